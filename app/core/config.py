@@ -15,6 +15,24 @@ class Settings(BaseSettings):
     SMTP_PORT: int = 587
     SUPABASE_URL: str
     SUPABASE_KEY: str
+    SUPABASE_TIMEOUT: float = 10.0
+    SUPABASE_MAX_CONNECTIONS: int = 20
+    SUPABASE_PAGE_SIZE: int = 1000
+    SUPABASE_HTTP2: bool = True
+    JOB_QUEUE_MAX_SIZE: int = 10000
+    JOB_QUEUE_TTL_SECONDS: int = 7 * 24 * 3600
+    JOB_QUEUE_VISIBILITY_TIMEOUT: int = 1800
+    JOB_QUEUE_MAX_LEASES: int = 5
+    JOB_WAIT_MAX_TIMEOUT: int = 60
+    JOB_WAIT_RECHECK_SECONDS: float = 60.0
+    JOB_STREAM_KEEPALIVE_SECONDS: float = 15.0
+    RESULTS_BATCH_MAX_SIZE: int = 1000
+    RESULT_SYNC_CONCURRENCY: int = 4
+    RESULT_SYNC_BATCH_SIZE: int = 500
+    RESULT_SYNC_POLL_SECONDS: float = 10.0
+    RESULT_SYNC_LEASE_SECONDS: int = 300
+    RESULT_SYNC_MAX_ATTEMPTS: int = 5
+    RESULT_SYNC_RETRY_BACKOFF: float = 30.0
 
     @property
     def cors_origins_list(self) -> List[str]:
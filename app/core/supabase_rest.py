@@ -0,0 +1,125 @@
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+import httpx
+import logging
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class SupabaseError(Exception):
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class SupabaseRest:
+    """Async client for Supabase's REST interface (PostgREST).
+
+    Every request goes through one pooled httpx.AsyncClient, so connections
+    are kept alive between calls, and over HTTP/2 when the h2 package is
+    installed. Filters use PostgREST's syntax, e.g. {"user_id": "eq.42"}.
+    Pointing SUPABASE_URL at a local stub serving /rest/v1/ is enough to
+    exercise it.
+    """
+
+    def __init__(self, url: str, key: str, timeout: float = 10.0, max_connections: int = 20,
+                 page_size: int = 1000, http2: bool = True):
+        self.base_url = f"{url.rstrip('/')}/rest/v1/"
+        self.key = key
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.page_size = page_size
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.client: Optional[httpx.AsyncClient] = None
+
+    def get_client(self) -> httpx.AsyncClient:
+        # Created on first use, inside the running event loop.
+        if self.client is None or self.client.is_closed:
+            self.client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"apikey": self.key, "Authorization": f"Bearer {self.key}"},
+                http2=self.http2,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self.client
+
+    async def request(self, method: str, table: str, **kwargs) -> httpx.Response:
+        try:
+            response = await self.get_client().request(method, table, **kwargs)
+        except httpx.HTTPError as e:
+            raise SupabaseError(f"{method} {table} failed: {str(e)}")
+        if response.status_code >= 400:
+            raise SupabaseError(f"{method} {table} failed: {response.text}", response.status_code)
+        return response
+
+    async def insert(self, table: str, rows: List[Dict[str, Any]], chunk_size: int = 1000,
+                     on_conflict: Optional[str] = None):
+        """Insert rows with one request per chunk_size rows.
+
+        With on_conflict (a column with a unique constraint), rows whose value
+        is already in the table are skipped, so the insert can be repeated.
+        """
+        params = {}
+        prefer = "return=minimal"
+        if on_conflict:
+            params["on_conflict"] = on_conflict
+            prefer += ",resolution=ignore-duplicates"
+        for start in range(0, len(rows), chunk_size):
+            await self.request(
+                "POST", table,
+                json=rows[start:start + chunk_size],
+                params=params,
+                headers={"Prefer": prefer}
+            )
+
+    async def select(self, table: str, filters: Optional[Dict[str, str]] = None, columns: str = "*",
+                     order: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Select matching rows, fetching page_size rows per request through Range headers."""
+        params = {"select": columns, **(filters or {})}
+        if order:
+            params["order"] = order
+        rows: List[Dict[str, Any]] = []
+        while limit is None or len(rows) < limit:
+            size = self.page_size if limit is None else min(self.page_size, limit - len(rows))
+            try:
+                response = await self.request(
+                    "GET", table,
+                    params=params,
+                    headers={"Range-Unit": "items", "Range": f"{len(rows)}-{len(rows) + size - 1}"}
+                )
+            except SupabaseError as e:
+                # Asking past the last row when it ended a full page
+                if e.status_code == 416:
+                    break
+                raise
+            page = response.json()
+            rows.extend(page)
+            if len(page) < size:
+                break
+        return rows
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+supabase_rest = SupabaseRest(
+    settings.SUPABASE_URL,
+    settings.SUPABASE_KEY,
+    timeout=settings.SUPABASE_TIMEOUT,
+    max_connections=settings.SUPABASE_MAX_CONNECTIONS,
+    page_size=settings.SUPABASE_PAGE_SIZE,
+    http2=settings.SUPABASE_HTTP2
+)
@@ -3,6 +3,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.routers import auth, admin, users, scraping
 from app.core.database import db
 from app.core.config import settings
+from app.core.supabase_rest import supabase_rest
+from app.services import job_queue, result_sync
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -28,8 +30,16 @@ async def startup_event():
     if db is None:
         logger.error("Database connection not initialized")
         raise ValueError("Database connection not initialized")
+    await job_queue.ensure_indexes()
+    await result_sync.ensure_indexes()
+    result_sync.start()
     logger.info("Application started")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await result_sync.stop()
+    await supabase_rest.aclose()
+
 @app.get("/")
 async def root():
     return {"message": "Web Scraping Backend API"}
\ No newline at end of file
@@ -1,12 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from fastapi.responses import Response
-from typing import List
-from app.services.scraping_service import store_xml_temp, get_xml_temp, store_scraping_result, get_user_scraping_results
-from app.schemas.scraping import ScrapingResultCreate, ScrapingResultOut, UploadXMLResponse, ScrapingXML
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status, UploadFile, File
+from fastapi.responses import Response, StreamingResponse
+from typing import Any, Dict, List, Optional
+from app.services.scraping_service import store_xml_temp, get_xml_temp, lease_xml_temp, wait_xml_temp, wait_xml_capacity, extend_xml_temp, complete_xml_temp, store_scraping_result, store_scraping_results_batch, get_user_scraping_results
+from app.schemas.scraping import ScrapingResultCreate, ScrapingResultOut, ScrapingBatchOut, UploadXMLResponse, ScrapingXML, XMLJobComplete
 from app.services.auth_service import get_current_user
+import json
 import logging
+import uuid
 import xml.etree.ElementTree as ET
 from datetime import datetime
+from app.core.config import settings
 from app.core.database import db
 from app.utils.xml_parser import generate_xml
 
@@ -30,10 +33,9 @@ async def upload_xml(xml_data: ScrapingXML, current_user: dict = Depends(get_cur
         # Generate XML content
         xml_content = generate_xml(xml_data.url, xml_data.keywords)
         
-        # Store in temporary queue
-        request_id = store_xml_temp(current_user["_id"], xml_data.url, xml_content)
-        
-        # Store XML in database
+        # Store XML in database first: a robot may lease the job as soon as
+        # it is queued, and reports on it through this document.
+        request_id = str(uuid.uuid4())
         xml_doc = {
             "user_id": current_user["_id"],
             "request_id": request_id,
@@ -44,6 +46,14 @@ async def upload_xml(xml_data: ScrapingXML, current_user: dict = Depends(get_cur
         }
         await db["xml_requests"].insert_one(xml_doc)
         logger.info(f"XML request stored in database with request_id {request_id}")
+
+        # Store in temporary queue
+        try:
+            await store_xml_temp(current_user["_id"], xml_data.url, xml_content, request_id)
+        except Exception:
+            # Not queued (e.g. the queue is full): no robot will ever pick it up.
+            await db["xml_requests"].delete_one({"request_id": request_id})
+            raise
         
         return UploadXMLResponse(request_id=request_id, message="XML request created and stored")
     except HTTPException:
@@ -53,10 +63,12 @@ async def upload_xml(xml_data: ScrapingXML, current_user: dict = Depends(get_cur
         raise HTTPException(status_code=500, detail="Failed to process XML request")
 
 @router.get("/xml")
-async def fetch_xml(request_id: str, current_user: dict = Depends(get_current_user)):
+async def fetch_xml(request_id: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    if request_id is None:
+        return await lease_xml(current_user)
     try:
         logger.info(f"Robot fetching XML for user {current_user['_id']} with request_id {request_id}")
-        xml_content = get_xml_temp(current_user["_id"], request_id)
+        xml_content = await get_xml_temp(current_user["_id"], request_id)
         if not xml_content:
             logger.error(f"No XML found for user {current_user['_id']} with request_id {request_id}")
             raise HTTPException(status_code=404, detail="No XML available for this request")
@@ -75,6 +87,96 @@ async def fetch_xml(request_id: str, current_user: dict = Depends(get_current_us
     except Exception as e:
         logger.error(f"Error fetching XML: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch XML")
+
+async def lease_xml(current_user: dict) -> Response:
+    # Worker robots poll without a request_id and get the next queued job,
+    # or 204 when there is nothing to do.
+    try:
+        leased = await lease_xml_temp(current_user["_id"])
+        if not leased:
+            return Response(status_code=status.HTTP_204_NO_CONTENT)
+        return await leased_response(current_user, *leased)
+    except Exception as e:
+        logger.error(f"Error leasing XML: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to lease XML")
+
+async def mark_leased(current_user: dict, request_id: str):
+    await db["xml_requests"].update_one(
+        {"user_id": current_user["_id"], "request_id": request_id},
+        {"$set": {"status": "processing", "leased_at": datetime.utcnow()}}
+    )
+    logger.info(f"XML request {request_id} leased by user {current_user['_id']}")
+
+async def leased_response(current_user: dict, request_id: str, xml_content: bytes) -> Response:
+    await mark_leased(current_user, request_id)
+    return Response(content=xml_content, media_type="application/xml", headers={"X-Request-Id": request_id})
+
+@router.get("/xml/wait")
+async def wait_xml(timeout: float = Query(30.0, ge=0), current_user: dict = Depends(get_current_user)):
+    # Long-poll variant of GET /xml: holds the request until a job is queued
+    # for the robot's user or the timeout expires (204).
+    try:
+        leased = await wait_xml_temp(current_user["_id"], min(timeout, settings.JOB_WAIT_MAX_TIMEOUT))
+        if not leased:
+            return Response(status_code=status.HTTP_204_NO_CONTENT)
+        return await leased_response(current_user, *leased)
+    except Exception as e:
+        logger.error(f"Error waiting for XML: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to wait for XML")
+
+@router.get("/xml/stream")
+async def stream_xml(request: Request, capacity: int = Query(1, ge=1), current_user: dict = Depends(get_current_user)):
+    # Server-sent events: jobs queued for the user are leased and pushed as
+    # `job` events ({"request_id", "xml"}) while the robot stays connected.
+    # At most `capacity` pushed jobs are in progress at once; the next one is
+    # only leased, and its visibility timeout started, once the robot
+    # completes one of them.
+    async def events():
+        in_progress: List[str] = []
+        while not await request.is_disconnected():
+            try:
+                in_progress = await wait_xml_capacity(
+                    current_user["_id"], in_progress, capacity, settings.JOB_STREAM_KEEPALIVE_SECONDS
+                )
+                if len(in_progress) >= capacity:
+                    yield ": keepalive\n\n"
+                    continue
+                leased = await wait_xml_temp(current_user["_id"], settings.JOB_STREAM_KEEPALIVE_SECONDS)
+            except Exception as e:
+                logger.error(f"Error streaming XML: {str(e)}")
+                yield "event: error\ndata: {}\n\n"
+                return
+            if not leased:
+                # Comment lines keep proxies from closing an idle stream.
+                yield ": keepalive\n\n"
+                continue
+            request_id, xml_content = leased
+            in_progress.append(request_id)
+            await mark_leased(current_user, request_id)
+            data = json.dumps({"request_id": request_id, "xml": xml_content.decode("utf-8")})
+            yield f"event: job\nid: {request_id}\ndata: {data}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.post("/xml/{request_id}/heartbeat")
+async def heartbeat_xml(request_id: str, current_user: dict = Depends(get_current_user)):
+    # Robots call this while they work on a job, well within
+    # JOB_QUEUE_VISIBILITY_TIMEOUT, so a long crawl is not handed out again.
+    if not await extend_xml_temp(current_user["_id"], request_id):
+        raise HTTPException(status_code=404, detail="No active lease for this XML request")
+    return {"message": "Lease extended", "visibility_timeout": settings.JOB_QUEUE_VISIBILITY_TIMEOUT}
+
+@router.post("/xml/{request_id}/complete")
+async def complete_xml(request_id: str, job: XMLJobComplete, current_user: dict = Depends(get_current_user)):
+    logger.info(f"Robot reporting job {request_id} as {job.status} with {job.items} items")
+    result = await db["xml_requests"].update_one(
+        {"user_id": current_user["_id"], "request_id": request_id},
+        {"$set": {"status": job.status, "items": job.items, "completed_at": datetime.utcnow()}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="XML request not found")
+    await complete_xml_temp(current_user["_id"], request_id)
+    return {"message": f"XML request marked as {job.status}"}
     
 
 
@@ -85,6 +187,15 @@ async def store_result(result: ScrapingResultCreate, current_user: dict = Depend
     logger.info("Scraping result stored")
     return stored_result
 
+@router.post("/results/batch", response_model=ScrapingBatchOut)
+async def store_results_batch(results: List[Dict[str, Any]], current_user: dict = Depends(get_current_user)):
+    # Items are validated one by one in the service, so a bad item is
+    # reported in the response instead of rejecting the whole batch.
+    logger.info(f"Storing batch of {len(results)} scraping results for user {current_user['_id']}")
+    report = await store_scraping_results_batch(current_user["_id"], results)
+    logger.info(f"Batch stored: {report.stored} stored, {report.failed} failed")
+    return report
+
 @router.get("/results", response_model=List[ScrapingResultOut])
 async def get_scraping_results(current_user: dict = Depends(get_current_user)):
     logger.info(f"Retrieving scraping results for user {current_user['_id']}")
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Literal, Optional
 from datetime import datetime
 
 class ScrapingXML(BaseModel):
@@ -9,15 +9,37 @@ class ScrapingXML(BaseModel):
 class ScrapingResultCreate(BaseModel):
     website_url:List[str]
     keywords: List[str]
+    # Number of matches of each keyword, in the same order
+    occurrences: List[int] = []
     results: str
+    # Page metadata found by the crawler, empty when it found none
+    title: str = ""
+    date: str = ""
+    authors: str = ""
 
 class ScrapingResultOut(BaseModel):
     id: str
     website_url:List[str]
     keywords: List[str]
+    occurrences: List[int] = []
     results: str
+    title: str = ""
+    date: str = ""
+    authors: str = ""
     scraped_at: datetime
 
+class ScrapingBatchItemStatus(BaseModel):
+    index: int
+    status: Literal["stored", "invalid", "failed"]
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+class ScrapingBatchOut(BaseModel):
+    received: int
+    stored: int
+    failed: int
+    items: List[ScrapingBatchItemStatus]
+
 class ScrapingRequestOut(BaseModel):
     id: str
     user_id: str
@@ -26,4 +48,8 @@ class ScrapingRequestOut(BaseModel):
 
 class UploadXMLResponse(BaseModel):
     request_id: str
-    message: str
\ No newline at end of file
+    message: str
+
+class XMLJobComplete(BaseModel):
+    status: Literal["completed", "failed"] = "completed"
+    items: int = 0
\ No newline at end of file
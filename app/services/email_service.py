@@ -1,5 +1,7 @@
 from fastapi import HTTPException
+import asyncio
 import smtplib
+from typing import List
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from app.core.config import settings
@@ -177,31 +179,100 @@ The Scraping Platform Team
         msg.attach(MIMEText(plain_text, 'plain'))
         msg.attach(MIMEText(html_body, 'html'))
 
-        logger.info(f"Connecting to SMTP server: {settings.SMTP_SERVER}:{settings.SMTP_PORT}")
-        server = smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT)
-        server.set_debuglevel(1)  # Enable debug output
-
-        try:
-            logger.info("Starting TLS connection")
-            server.starttls()
-
-            logger.info(f"Logging in to SMTP server with email: {settings.EMAIL_SENDER}")
-            server.login(settings.EMAIL_SENDER, settings.EMAIL_PASSWORD)
-
-            logger.info("Sending email message")
-            server.send_message(msg)
-            logger.info(f"Results notification email successfully sent to {email} for result {result_id}")
-        except smtplib.SMTPAuthenticationError as e:
-            logger.error(f"SMTP Authentication Error: {str(e)}")
-            logger.error("Make sure you're using an App-Specific password for Gmail (not your regular password)")
-        except smtplib.SMTPException as e:
-            logger.error(f"SMTP Error: {str(e)}")
-        finally:
-            server.quit()
-            logger.info("SMTP connection closed")
+        # smtplib blocks: run the SMTP session in a thread so the event loop
+        # keeps serving requests meanwhile.
+        def deliver():
+            logger.info(f"Connecting to SMTP server: {settings.SMTP_SERVER}:{settings.SMTP_PORT}")
+            server = smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT)
+            server.set_debuglevel(1)  # Enable debug output
+
+            try:
+                logger.info("Starting TLS connection")
+                server.starttls()
+
+                logger.info(f"Logging in to SMTP server with email: {settings.EMAIL_SENDER}")
+                server.login(settings.EMAIL_SENDER, settings.EMAIL_PASSWORD)
+
+                logger.info("Sending email message")
+                server.send_message(msg)
+                logger.info(f"Results notification email successfully sent to {email} for result {result_id}")
+            except smtplib.SMTPAuthenticationError as e:
+                logger.error(f"SMTP Authentication Error: {str(e)}")
+                logger.error("Make sure you're using an App-Specific password for Gmail (not your regular password)")
+            except smtplib.SMTPException as e:
+                logger.error(f"SMTP Error: {str(e)}")
+            finally:
+                server.quit()
+                logger.info("SMTP connection closed")
+
+        await asyncio.to_thread(deliver)
     except Exception as e:
         logger.error(f"Failed to send results notification email: {str(e)}")
         logger.error(f"Error type: {type(e).__name__}")
         import traceback
         logger.error(f"Traceback: {traceback.format_exc()}")
         # Don't raise an exception as we don't want to fail the request if email fails
+
+async def send_scraping_batch_results_email(email: str, username: str, website_urls: List[str], count: int):
+    logger.info(f"Attempting to send batch results email to {email} for {count} results")
+
+    if not settings.EMAIL_SENDER or not settings.EMAIL_PASSWORD:
+        logger.error(f"Email settings not configured. EMAIL_SENDER: {settings.EMAIL_SENDER}, EMAIL_PASSWORD: {'Set' if settings.EMAIL_PASSWORD else 'Not Set'}")
+        return
+
+    # A batch can cover hundreds of pages; name the first few sites only.
+    websites = ", ".join(website_urls[:5])
+    if len(website_urls) > 5:
+        websites += f" and {len(website_urls) - 5} more"
+
+    try:
+        msg = MIMEMultipart("alternative")
+        msg['From'] = f"WebScraping Service <{settings.EMAIL_SENDER}>"
+        msg['To'] = email
+        msg['Subject'] = "Your Scraping Results Are Ready!"
+        msg['Reply-To'] = settings.EMAIL_SENDER
+
+        # Plain text version
+        plain_text = f"""
+Hello {username},
+
+Great news! {count} new scraping results for {websites} are now ready.
+
+You can view your results by logging into your account and checking your dashboard.
+
+Best regards,
+The Scraping Platform Team
+        """
+
+        # HTML version
+        html_body = f"""
+        <html>
+            <body>
+                <h2>Your Scraping Results Are Ready!</h2>
+                <p>Hello {username},</p>
+                <p>Great news! <strong>{count}</strong> new scraping results for <strong>{websites}</strong> are now ready.</p>
+                <p>You can view your results by logging into your account and checking your dashboard.</p>
+                <p>Best regards,<br>The Scraping Platform Team</p>
+            </body>
+        </html>
+        """
+
+        msg.attach(MIMEText(plain_text, 'plain'))
+        msg.attach(MIMEText(html_body, 'html'))
+
+        def deliver():
+            server = smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT)
+            try:
+                server.starttls()
+                server.login(settings.EMAIL_SENDER, settings.EMAIL_PASSWORD)
+                server.send_message(msg)
+                logger.info(f"Batch results notification email successfully sent to {email}")
+            except smtplib.SMTPException as e:
+                logger.error(f"SMTP Error: {str(e)}")
+            finally:
+                server.quit()
+
+        await asyncio.to_thread(deliver)
+    except Exception as e:
+        logger.error(f"Failed to send batch results notification email: {str(e)}")
+        # Don't raise an exception as we don't want to fail the request if email fails
@@ -15,6 +15,7 @@ class SpiderResult:
     date: str
     content: str
     character_count: int
+    occurrences: List[int]
     request_id: str
     user_id: str
 
@@ -89,6 +90,7 @@ class ETLTransformer:
                 date=str(result.get('Date', '')).strip(),
                 content=self.text_cleaner.clean_text(str(result['Contenu'])),
                 character_count=int(result.get('Nombre_caractères', 0)),
+                occurrences=[int(count) for count in result.get('Occurrences') or []],
                 request_id=str(result.get('request_id', '')).strip(),
                 user_id=str(result.get('user_id', '')).strip()
             )
@@ -134,7 +136,8 @@ class ETLTransformer:
                     "content": validated_result.content,
                     "date": date,
                     "authors": validated_result.authors,
-                    "character_count": validated_result.character_count or len(validated_result.content)
+                    "character_count": validated_result.character_count or len(validated_result.content),
+                    "occurrences": validated_result.occurrences
                 },
                 "scraped_at": datetime.utcnow().isoformat()
             }
@@ -146,12 +149,14 @@ class ETLTransformer:
             self.logger.error(f"Error transforming spider result: {str(e)}")
             return None
 
-    def transform_batch(self, spider_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def transform_batch(self, spider_results: List[Dict[str, Any]], keep_failed: bool = False) -> List[Optional[Dict[str, Any]]]:
         """
         Transform a batch of spider results to backend format
         
         Args:
             spider_results: List of raw results from spider
+            keep_failed: Keep a None in place of every result that failed, so the
+                output lines up with the input
             
         Returns:
             List of transformed results in backend format
@@ -159,10 +164,11 @@ class ETLTransformer:
         transformed_results = []
         for result in spider_results:
             transformed = self.transform_spider_result(result)
-            if transformed:
+            if transformed or keep_failed:
                 transformed_results.append(transformed)
         
-        self.logger.info(f"Transformed {len(transformed_results)} out of {len(spider_results)} results")
+        succeeded = sum(1 for result in transformed_results if result)
+        self.logger.info(f"Transformed {succeeded} out of {len(spider_results)} results")
         return transformed_results
 
 def main():
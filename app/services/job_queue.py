@@ -0,0 +1,195 @@
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from pymongo import ASCENDING, ReturnDocument
+from app.core.config import settings
+from app.core.database import db
+import asyncio
+import uuid
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Scraping jobs waiting for a robot. Every uvicorn worker (and machine) shares
+# this collection, so a job uploaded through one process can be leased
+# through any other.
+#
+# A leased job stays in the collection, invisible until visible_at, and is
+# only deleted when the robot acknowledges it. A robot working on a long job
+# extends the lease with heartbeats; one that dies mid-job lets it become
+# visible again. A job whose JOB_QUEUE_MAX_LEASES-th lease expires without
+# an acknowledgement is deleted and its request marked failed. Jobs nobody
+# picks up are removed by a TTL index.
+queue = db["xml_queue"]
+
+# Robots long-polling for a job, per user. Enqueueing or acknowledging a job
+# sets and drops the user's event, waking every waiter in this process at
+# once. Waiters are woken by events only, so an idle one costs no queries;
+# those in other processes find the change at their next recheck, after
+# JOB_WAIT_RECHECK_SECONDS at most, or when their wait times out.
+job_events: Dict[str, asyncio.Event] = {}
+
+
+async def ensure_indexes():
+    await queue.create_index("expires_at", expireAfterSeconds=0)
+    await queue.create_index([("user_id", ASCENDING), ("visible_at", ASCENDING), ("created_at", ASCENDING)])
+    logger.info("Job queue indexes ensured")
+
+
+async def enqueue(user_id: str, website_url: List[str], content: bytes, request_id: Optional[str] = None) -> str:
+    if await queue.estimated_document_count() >= settings.JOB_QUEUE_MAX_SIZE:
+        await expire_exhausted()
+    if await queue.estimated_document_count() >= settings.JOB_QUEUE_MAX_SIZE:
+        logger.error(f"Job queue is full ({settings.JOB_QUEUE_MAX_SIZE} jobs), rejecting job for user {user_id}")
+        raise HTTPException(status_code=503, detail="Job queue is full, try again later")
+
+    now = datetime.utcnow()
+    request_id = request_id or str(uuid.uuid4())
+    await queue.insert_one({
+        "_id": request_id,
+        "user_id": user_id,
+        "website_url": website_url,
+        "content": content,
+        "created_at": now,
+        "visible_at": now,
+        "expires_at": now + timedelta(seconds=settings.JOB_QUEUE_TTL_SECONDS),
+        "leases": 0
+    })
+    notify(user_id)
+    return request_id
+
+
+def notify(user_id: str):
+    event = job_events.pop(user_id, None)
+    if event is not None:
+        event.set()
+
+
+async def take(user_id: str, request_id: str) -> Optional[bytes]:
+    """Remove a job by id and return its content, whether or not it is leased."""
+    job = await queue.find_one_and_delete({
+        "_id": request_id,
+        "user_id": user_id,
+        "expires_at": {"$gt": datetime.utcnow()}
+    })
+    return job["content"] if job else None
+
+
+async def lease(user_id: str) -> Optional[Tuple[str, bytes]]:
+    """Atomically claim the user's oldest visible job for one visibility timeout."""
+    now = datetime.utcnow()
+    job = await queue.find_one_and_update(
+        {
+            "user_id": user_id,
+            "visible_at": {"$lte": now},
+            # The TTL monitor only runs once a minute.
+            "expires_at": {"$gt": now},
+            "leases": {"$lt": settings.JOB_QUEUE_MAX_LEASES}
+        },
+        {
+            "$set": {
+                "visible_at": now + timedelta(seconds=settings.JOB_QUEUE_VISIBILITY_TIMEOUT),
+                "leased_at": now
+            },
+            "$inc": {"leases": 1}
+        },
+        sort=[("created_at", ASCENDING)],
+        projection={"content": 1, "leases": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not job:
+        # Only looked for when idle, so leasing stays one round trip.
+        await expire_exhausted(user_id)
+        return None
+    if job["leases"] > 1:
+        logger.warning(f"Job {job['_id']} leased again (attempt {job['leases']}) after its visibility timeout")
+    return job["_id"], job["content"]
+
+
+async def extend(user_id: str, request_id: str) -> bool:
+    """Renew the lease of a job its robot is still working on.
+
+    Returns False when the lease already expired, in which case the job may
+    have been handed to another robot.
+    """
+    now = datetime.utcnow()
+    result = await queue.update_one(
+        {"_id": request_id, "user_id": user_id, "visible_at": {"$gt": now}},
+        {"$set": {"visible_at": now + timedelta(seconds=settings.JOB_QUEUE_VISIBILITY_TIMEOUT)}}
+    )
+    return result.matched_count > 0
+
+
+async def expire_exhausted(user_id: Optional[str] = None) -> List[str]:
+    """Delete jobs whose last allowed lease expired unacknowledged and mark their requests failed."""
+    exhausted = {"leases": {"$gte": settings.JOB_QUEUE_MAX_LEASES}, "visible_at": {"$lte": datetime.utcnow()}}
+    if user_id is not None:
+        exhausted["user_id"] = user_id
+    expired = []
+    for job in await queue.find(exhausted, projection={"_id": 1}).to_list(length=None):
+        # A late acknowledgement may delete it first.
+        if (await queue.delete_one({**exhausted, "_id": job["_id"]})).deleted_count:
+            expired.append(job["_id"])
+    if expired:
+        logger.error(f"Giving up on {len(expired)} jobs leased {settings.JOB_QUEUE_MAX_LEASES} times without completing")
+        await db["xml_requests"].update_many(
+            {"request_id": {"$in": expired}},
+            {"$set": {"status": "failed", "error": "Job was never completed", "completed_at": datetime.utcnow()}}
+        )
+    return expired
+
+
+async def wait_and_lease(user_id: str, timeout: float) -> Optional[Tuple[str, bytes]]:
+    """Lease the user's next job, waiting up to timeout seconds for one to be enqueued."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        # Take the event before looking at the queue, so a job enqueued
+        # between the lease attempt and the wait still wakes us.
+        event = job_events.setdefault(user_id, asyncio.Event())
+        leased = await lease(user_id)
+        if leased:
+            return leased
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return None
+        try:
+            await asyncio.wait_for(event.wait(), min(remaining, settings.JOB_WAIT_RECHECK_SECONDS))
+        except asyncio.TimeoutError:
+            pass
+
+
+async def wait_for_capacity(user_id: str, request_ids: List[str], capacity: int, timeout: float) -> List[str]:
+    """Wait up to timeout seconds until fewer than capacity of the given jobs are still leased.
+
+    Returns the ones still leased: not acknowledged and within their
+    visibility timeout.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        # Taken before looking at the queue, as in wait_and_lease.
+        event = job_events.setdefault(user_id, asyncio.Event())
+        leased = []
+        if request_ids:
+            jobs = await queue.find(
+                {"_id": {"$in": request_ids}, "user_id": user_id, "visible_at": {"$gt": datetime.utcnow()}},
+                projection={"_id": 1}
+            ).to_list(length=None)
+            leased = [job["_id"] for job in jobs]
+        remaining = deadline - loop.time()
+        if len(leased) < capacity or remaining <= 0:
+            return leased
+        try:
+            await asyncio.wait_for(event.wait(), min(remaining, settings.JOB_WAIT_RECHECK_SECONDS))
+        except asyncio.TimeoutError:
+            pass
+
+
+async def ack(user_id: str, request_id: str) -> bool:
+    """Delete a finished job so it is never handed out again."""
+    result = await queue.delete_one({"_id": request_id, "user_id": user_id})
+    # Frees a slot of the stream that leased it.
+    notify(user_id)
+    return result.deleted_count > 0
@@ -0,0 +1,285 @@
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+from pymongo import ASCENDING
+from app.core.config import settings
+from app.core.database import db
+from app.core.supabase_rest import supabase_rest, SupabaseError
+from app.schemas.scraping import ScrapingResultCreate
+from app.services.email_service import send_scraping_results_email, send_scraping_batch_results_email
+from app.services.etl_module import ETLTransformer
+import asyncio
+import uuid
+import logging
+from bson import ObjectId
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Results are acknowledged as soon as they are in MongoDB. Each one carries a
+# sync state that background workers use to run the ETL, copy it to Supabase
+# and notify its owner, off the request path:
+#
+#   pending     waiting for a worker, from next_attempt_at on
+#   processing  claimed by a worker until next_attempt_at; a worker that dies
+#               mid-batch lets its results be claimed again after that
+#   synced      in Supabase
+#   failed      the ETL rejected it, or Supabase did RESULT_SYNC_MAX_ATTEMPTS
+#               times in a row
+#
+# A result may still reach Supabase twice: a worker can die between the insert
+# and marking it synced, or keep going after its lease expired. Rows are
+# therefore inserted idempotently on result_id, and a worker only updates the
+# results it still holds the claim of.
+results = db["scraping_results"]
+
+# Set when a result is stored, so an idle worker in this process starts right
+# away; workers in other processes find it at their next poll.
+sync_event = asyncio.Event()
+
+workers: List[asyncio.Task] = []
+
+
+def pending_state() -> Dict[str, Any]:
+    """The sync state new results are stored with."""
+    return {"status": "pending", "attempts": 0, "next_attempt_at": datetime.utcnow()}
+
+
+def notify():
+    sync_event.set()
+
+
+async def ensure_indexes():
+    await results.create_index([("sync.status", ASCENDING), ("sync.next_attempt_at", ASCENDING)])
+    logger.info("Result sync indexes ensured")
+
+
+def etl_input(user_id: str, result: ScrapingResultCreate, result_id: str) -> Dict[str, Any]:
+    """Reconstruct a flat version that mimics spider result for ETL input"""
+    return {
+        "URL": result.website_url[0] if isinstance(result.website_url, list) else result.website_url,
+        # The crawler posts one result per page with every matched keyword.
+        "Mot_clé": ", ".join(result.keywords) if isinstance(result.keywords, list) else result.keywords,
+        "Occurrences": result.occurrences,
+        "Titre": result.title,
+        "Contenu": result.results,  # Use the results string directly as content
+        "Nombre_caractères": len(result.results),  # Calculate character count from the string
+        "Date": result.date or datetime.utcnow().strftime("%Y-%m-%d"),  # Current date when the page has none
+        "Auteurs": result.authors,
+        "request_id": result_id,
+        "user_id": user_id
+    }
+
+
+def supabase_row(result_etl: Dict[str, Any]) -> Dict[str, Any]:
+    # Convert the results dictionary to a JSON string for Supabase
+    results_json = {
+        "title": result_etl["results"]["title"],
+        "content": result_etl["results"]["content"],
+        "date": result_etl["results"]["date"],
+        "authors": result_etl["results"]["authors"],
+        "character_count": result_etl["results"]["character_count"],
+        "occurrences": result_etl["results"]["occurrences"]
+    }
+    return {
+        "result_id": result_etl["request_id"],
+        "user_id": result_etl["user_id"],
+        "website_url": ", ".join(result_etl["website_url"]),
+        "keywords": ", ".join(result_etl["keywords"]),
+        "results": results_json,
+        "scraped_at": result_etl["scraped_at"]
+    }
+
+
+async def claim(limit: int) -> List[Dict[str, Any]]:
+    """Claim up to limit due results for this worker until the lease expires."""
+    now = datetime.utcnow()
+    due = {"sync.status": {"$in": ["pending", "processing"]}, "sync.next_attempt_at": {"$lte": now}}
+    candidates = await results.find(due, projection={"_id": 1}).sort("sync.next_attempt_at", ASCENDING).to_list(length=limit)
+    if not candidates:
+        return []
+    # Another worker may claim some of the same results in between; the
+    # filter is re-applied, so each result goes to exactly one of them.
+    token = str(uuid.uuid4())
+    await results.update_many(
+        {**due, "_id": {"$in": [doc["_id"] for doc in candidates]}},
+        {"$set": {
+            "sync.status": "processing",
+            "sync.claim": token,
+            "sync.next_attempt_at": now + timedelta(seconds=settings.RESULT_SYNC_LEASE_SECONDS)
+        }}
+    )
+    return await results.find({"sync.claim": token}).to_list(length=limit)
+
+
+def claimed(docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Filter matching the given results only while they are still claimed by this worker."""
+    return {"$or": [{"_id": doc["_id"], "sync.claim": doc["sync"].get("claim")} for doc in docs]}
+
+
+async def mark_synced(docs: List[Dict[str, Any]]) -> int:
+    """Mark results synced and return how many were still claimed by this worker."""
+    if not docs:
+        return 0
+    result = await results.update_many(
+        claimed(docs),
+        {"$set": {"sync.status": "synced", "sync.synced_at": datetime.utcnow()}, "$unset": {"sync.claim": ""}}
+    )
+    return result.modified_count
+
+
+async def mark_failed(docs: List[Dict[str, Any]], error: str):
+    if docs:
+        await results.update_many(
+            claimed(docs),
+            {"$set": {"sync.status": "failed", "sync.error": error}, "$unset": {"sync.claim": ""}}
+        )
+
+
+async def retry_later(docs: List[Dict[str, Any]], error: str):
+    """Put results back for another attempt with exponential backoff, or give up on them."""
+    now = datetime.utcnow()
+    given_up = []
+    for doc in docs:
+        attempts = doc["sync"].get("attempts", 0) + 1
+        if attempts >= settings.RESULT_SYNC_MAX_ATTEMPTS:
+            given_up.append(doc)
+            continue
+        delay = settings.RESULT_SYNC_RETRY_BACKOFF * 2 ** (attempts - 1)
+        await results.update_one(
+            claimed([doc]),
+            {"$set": {
+                "sync.status": "pending",
+                "sync.attempts": attempts,
+                "sync.error": error,
+                "sync.next_attempt_at": now + timedelta(seconds=delay)
+            }, "$unset": {"sync.claim": ""}}
+        )
+    if given_up:
+        logger.error(f"Giving up on {len(given_up)} results after {settings.RESULT_SYNC_MAX_ATTEMPTS} attempts: {error}")
+        await mark_failed(given_up, error)
+
+
+async def insert_rows(rows: List[Dict[str, Any]]) -> Optional[str]:
+    """Insert rows into Supabase in one request; return an error message on failure."""
+    try:
+        await supabase_rest.insert("scraping_results", rows, on_conflict="result_id")
+    except SupabaseError as e:
+        return str(e)
+    return None
+
+
+async def sync_user_results(user_id: str, docs: List[Dict[str, Any]]):
+    """ETL and Supabase insert for one user's claimed results; return the synced ones."""
+    transformer = ETLTransformer()
+    results_etl = transformer.transform_batch(
+        [
+            etl_input(user_id, ScrapingResultCreate(
+                website_url=doc["website_url"], keywords=doc["keywords"],
+                occurrences=doc.get("occurrences", []), results=doc["results"],
+                title=doc.get("title", ""), date=doc.get("date", ""), authors=doc.get("authors", "")
+            ), str(doc["_id"]))
+            for doc in docs
+        ],
+        keep_failed=True
+    )
+    rows = []
+    transformed = []
+    rejected = []
+    for doc, result_etl in zip(docs, results_etl):
+        if result_etl:
+            rows.append(supabase_row(result_etl))
+            transformed.append(doc)
+        else:
+            rejected.append(doc)
+    if rejected:
+        logger.warning(f"ETL transformation failed for {len(rejected)} results of user {user_id}")
+        await mark_failed(rejected, "ETL transformation failed")
+    if not rows:
+        return []
+
+    error = await insert_rows(rows)
+    if error:
+        logger.error(f"Failed to store {len(rows)} results of user {user_id} in Supabase: {error}")
+        await retry_later(transformed, error)
+        return []
+    logger.info(f"{len(rows)} results of user {user_id} stored in Supabase after ETL")
+    if not await mark_synced(transformed):
+        # The lease expired and another worker took the results over; it
+        # sends the notification.
+        logger.warning(f"Lost the claim on {len(transformed)} results of user {user_id} before marking them synced")
+        return []
+    return transformed
+
+
+async def notify_user(user_id: str, transformed: List[Dict[str, Any]]):
+    """Send one notification for a user's newly synced results."""
+    user = await db["users"].find_one({"_id": ObjectId(user_id)})
+    if not user:
+        return
+    if len(transformed) == 1:
+        await send_scraping_results_email(
+            email=user["email"],
+            username=user["username"],
+            website_url=transformed[0]["website_url"][0],
+            result_id=str(transformed[0]["_id"])
+        )
+    else:
+        website_urls = list(dict.fromkeys(url for doc in transformed for url in doc["website_url"]))
+        await send_scraping_batch_results_email(
+            email=user["email"],
+            username=user["username"],
+            website_urls=website_urls,
+            count=len(transformed)
+        )
+
+
+async def sync_batch(docs: List[Dict[str, Any]]):
+    by_user: Dict[str, List[Dict[str, Any]]] = {}
+    for doc in docs:
+        by_user.setdefault(doc["user_id"], []).append(doc)
+    for user_id, user_docs in by_user.items():
+        try:
+            synced = await sync_user_results(user_id, user_docs)
+        except Exception as e:
+            logger.exception(f"Result sync failed for user {user_id}")
+            await retry_later(user_docs, str(e))
+            continue
+        if not synced:
+            continue
+        # The results are synced by now; a failed notification must not
+        # send them through the retry path again.
+        try:
+            await notify_user(user_id, synced)
+        except Exception:
+            logger.exception(f"Could not notify user {user_id} of {len(synced)} synced results")
+
+
+async def run_worker(number: int):
+    logger.info(f"Result sync worker {number} started")
+    while True:
+        try:
+            docs = await claim(settings.RESULT_SYNC_BATCH_SIZE)
+        except Exception as e:
+            logger.error(f"Result sync worker {number} could not claim results: {str(e)}")
+            docs = []
+        if docs:
+            await sync_batch(docs)
+            continue
+        sync_event.clear()
+        try:
+            await asyncio.wait_for(sync_event.wait(), settings.RESULT_SYNC_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start():
+    for number in range(settings.RESULT_SYNC_CONCURRENCY):
+        workers.append(asyncio.create_task(run_worker(number)))
+
+
+async def stop():
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    workers.clear()
+    logger.info("Result sync workers stopped")
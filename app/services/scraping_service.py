@@ -1,12 +1,14 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime
 from fastapi import HTTPException
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+from app.core.config import settings
 from app.core.database import db
-from app.schemas.scraping import ScrapingResultCreate, ScrapingResultOut
-from app.core.supabase import supabase
-from app.services.email_service import send_scraping_status_email, send_scraping_results_email
-from app.services.etl_module import ETLTransformer
-import uuid
+from app.schemas.scraping import ScrapingResultCreate, ScrapingResultOut, ScrapingBatchItemStatus, ScrapingBatchOut
+from app.core.supabase_rest import supabase_rest
+from app.services.email_service import send_scraping_status_email
+from app.services import job_queue, result_sync
 import logging
 from bson import ObjectId
 
@@ -14,135 +16,161 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-xml_queue = {}
-
-def store_xml_temp(user_id: str, website_url: List[str], content: bytes) -> str:
+async def store_xml_temp(user_id: str, website_url: List[str], content: bytes, request_id: Optional[str] = None) -> str:
     logger.info(f"Queuing XML for user {user_id}")
-    request_id = str(uuid.uuid4())
-    xml_queue[request_id] = {
-        "user_id": user_id,
-        "website_url": website_url,
-        "content": content
-    }
-    return request_id
+    return await job_queue.enqueue(user_id, website_url, content, request_id)
 
-def get_xml_temp(user_id: str, request_id: str) -> Optional[bytes]:
+async def get_xml_temp(user_id: str, request_id: str) -> Optional[bytes]:
     logger.info(f"Retrieving XML for user {user_id} with request_id {request_id}")
-    if request_id in xml_queue and xml_queue[request_id]["user_id"] == user_id:
-        content = xml_queue[request_id]["content"]
-        del xml_queue[request_id]
+    content = await job_queue.take(user_id, request_id)
+    if content:
         logger.info(f"XML retrieved for request_id {request_id}")
         return content
     logger.warning(f"No XML found for user {user_id} with request_id {request_id}")
     return None
 
+async def lease_xml_temp(user_id: str) -> Optional[Tuple[str, bytes]]:
+    logger.info(f"Leasing next queued XML for user {user_id}")
+    leased = await job_queue.lease(user_id)
+    if leased:
+        logger.info(f"XML leased for request_id {leased[0]}")
+    return leased
+
+async def wait_xml_temp(user_id: str, timeout: float) -> Optional[Tuple[str, bytes]]:
+    logger.info(f"Waiting up to {timeout}s for queued XML for user {user_id}")
+    leased = await job_queue.wait_and_lease(user_id, timeout)
+    if leased:
+        logger.info(f"XML leased for request_id {leased[0]}")
+    return leased
+
+async def wait_xml_capacity(user_id: str, request_ids: List[str], capacity: int, timeout: float) -> List[str]:
+    return await job_queue.wait_for_capacity(user_id, request_ids, capacity, timeout)
+
+async def extend_xml_temp(user_id: str, request_id: str) -> bool:
+    return await job_queue.extend(user_id, request_id)
+
+async def complete_xml_temp(user_id: str, request_id: str) -> bool:
+    logger.info(f"Acknowledging XML job {request_id} for user {user_id}")
+    return await job_queue.ack(user_id, request_id)
+
 async def store_scraping_result(user_id: str, result: ScrapingResultCreate) -> ScrapingResultOut:
     logger.info(f"Storing scraping result for user {user_id}")
 
-    # Get user information for email notification
-    user = await db["users"].find_one({"_id": ObjectId(user_id)})
-    if not user:
-        logger.error(f"User {user_id} not found")
-        raise HTTPException(status_code=404, detail="User not found")
-
-    # Step 1: Store raw result in MongoDB
+    # Store raw result in MongoDB. The ETL, the copy to Supabase and the
+    # email notification are done by the result sync workers.
     result_doc = {
         "user_id": user_id,
         "website_url": result.website_url if isinstance(result.website_url, list) else [result.website_url],
         "keywords": result.keywords,
+        "occurrences": result.occurrences,
         "results": result.results,
-        "scraped_at": datetime.utcnow()
+        "title": result.title,
+        "date": result.date,
+        "authors": result.authors,
+        "scraped_at": datetime.utcnow(),
+        "sync": result_sync.pending_state()
     }
     inserted = await db["scraping_results"].insert_one(result_doc)
+    result_sync.notify()
     
     result_doc["id"] = str(inserted.inserted_id)
     result_doc.pop("_id", None)
 
     logger.info(f"Scraping result stored in MongoDB with ID {result_doc['id']}")
+    return ScrapingResultOut(**result_doc)
 
-    # Step 2: Apply ETL transformation before storing in Supabase
-    transformer = ETLTransformer()
-
-    # Reconstruct a flat version that mimics spider result for ETL input
-    spider_result_input = {
-        "URL": result.website_url[0] if isinstance(result.website_url, list) else result.website_url,
-        "Mot_clé": result.keywords[0] if isinstance(result.keywords, list) else result.keywords,
-        "Titre": "",  # Since results is now a string, we'll use empty defaults
-        "Contenu": result.results,  # Use the results string directly as content
-        "Nombre_caractères": len(result.results),  # Calculate character count from the string
-        "Date": datetime.utcnow().strftime("%Y-%m-%d"),  # Use current date
-        "Auteurs": "",  # Empty default for authors
-        "request_id": result_doc["id"],
-        "user_id": user_id
-    }
+async def store_scraping_results_batch(user_id: str, payloads: List[Dict[str, Any]]) -> ScrapingBatchOut:
+    """Store many results with a single MongoDB write.
 
-    result_etl = transformer.transform_spider_result(spider_result_input)
+    Every payload gets a status: "invalid" when it does not validate, "failed"
+    when the MongoDB write failed (the robot should resend it) and "stored"
+    otherwise. Stored results reach Supabase through the result sync workers.
+    """
+    logger.info(f"Storing batch of {len(payloads)} scraping results for user {user_id}")
+    if len(payloads) > settings.RESULTS_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large, send at most {settings.RESULTS_BATCH_MAX_SIZE} results"
+        )
 
-    if result_etl:
+    statuses = [ScrapingBatchItemStatus(index=index, status="stored") for index in range(len(payloads))]
+    results: List[Tuple[int, ScrapingResultCreate]] = []
+    for index, payload in enumerate(payloads):
         try:
-            # Convert the results dictionary to a JSON string for Supabase
-            results_json = {
-                "title": result_etl["results"]["title"],
-                "content": result_etl["results"]["content"],
-                "date": result_etl["results"]["date"],
-                "authors": result_etl["results"]["authors"],
-                "character_count": result_etl["results"]["character_count"]
-            }
+            results.append((index, ScrapingResultCreate.model_validate(payload)))
+        except ValidationError as e:
+            statuses[index].status = "invalid"
+            statuses[index].error = str(e)
 
-            supabase_data = {
-                "result_id": result_etl["request_id"],
-                "user_id": result_etl["user_id"],
-                "website_url": ", ".join(result_etl["website_url"]),
-                "keywords": ", ".join(result_etl["keywords"]),
-                "results": results_json,
-                "scraped_at": result_etl["scraped_at"]
-            }
-            
-            logger.info(f"Attempting to store in Supabase with data: {supabase_data}")
-            
-            supabase_result = supabase.table("scraping_results").insert(supabase_data).execute()
-            
-            logger.info(f"Supabase response: {supabase_result}")
-
-            if hasattr(supabase_result, 'error') and supabase_result.error:
-                logger.error(f"Supabase error: {supabase_result.error}")
-            else:
-                logger.info("Scraping result successfully stored in Supabase after ETL.")
-                
-                # Send email notification
-                await send_scraping_results_email(
-                    email=user["email"],
-                    username=user["username"],
-                    website_url=result.website_url[0] if isinstance(result.website_url, list) else result.website_url,
-                    result_id=result_doc["id"]
-                )
-        except Exception as e:
-            logger.error(f"Failed to store result in Supabase: {str(e)}")
-            logger.error(f"Error type: {type(e)}")
-            import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
-    else:
-        logger.warning("ETL transformation failed. Result not stored in Supabase.")
+    # insert_many assigns every document its _id before writing, so ids are
+    # known even if some of the writes fail.
+    scraped_at = datetime.utcnow()
+    docs = [
+        {
+            "user_id": user_id,
+            "website_url": result.website_url,
+            "keywords": result.keywords,
+            "occurrences": result.occurrences,
+            "results": result.results,
+            "title": result.title,
+            "date": result.date,
+            "authors": result.authors,
+            "scraped_at": scraped_at,
+            "sync": result_sync.pending_state()
+        }
+        for _, result in results
+    ]
+    write_errors: Dict[int, str] = {}
+    if docs:
+        try:
+            await db["scraping_results"].insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            write_errors = {error["index"]: error.get("errmsg", "write failed") for error in e.details.get("writeErrors", [])}
+            logger.error(f"{len(write_errors)} of {len(docs)} results failed to store in MongoDB")
+        result_sync.notify()
 
-    return ScrapingResultOut(**result_doc)
+    for position, ((index, _), doc) in enumerate(zip(results, docs)):
+        if position in write_errors:
+            statuses[index].status = "failed"
+            statuses[index].error = write_errors[position]
+        else:
+            statuses[index].id = str(doc["_id"])
+
+    stored = len(docs) - len(write_errors)
+    logger.info(f"{stored} scraping results stored in MongoDB")
+    return ScrapingBatchOut(
+        received=len(payloads),
+        stored=stored,
+        failed=len(payloads) - stored,
+        items=statuses
+    )
 
 async def get_user_scraping_results(user_id: str) -> List[ScrapingResultOut]:
     logger.info(f"Retrieving scraping results for user {user_id}")
     try:
         # First try to get from Supabase
-        response = supabase.table("scraping_results").select("*").eq("user_id", user_id).execute()
-        logger.info(f"Supabase response: {response}")
+        rows = await supabase_rest.select(
+            "scraping_results",
+            filters={"user_id": f"eq.{user_id}"},
+            # A stable order, so pages do not overlap
+            order="scraped_at.desc,result_id.asc"
+        )
+        logger.info(f"Supabase returned {len(rows)} results")
         
         results = []
-        if response.data:
-            for result in response.data:
+        if rows:
+            for result in rows:
                 try:
                     # Convert the data to match ScrapingResultOut format
                     formatted_result = {
                         "id": result.get("result_id", ""),
                         "website_url": result.get("website_url", "").split(", ") if result.get("website_url") else [],
                         "keywords": result.get("keywords", "").split(", ") if result.get("keywords") else [],
+                        "occurrences": result.get("results", {}).get("occurrences", []),
                         "results": result.get("results", {}).get("content", ""),  # Get content from results JSON
+                        "title": result.get("results", {}).get("title", ""),
+                        "date": result.get("results", {}).get("date", ""),
+                        "authors": result.get("results", {}).get("authors", ""),
                         "scraped_at": datetime.fromisoformat(result.get("scraped_at", datetime.utcnow().isoformat()))
                     }
                     results.append(ScrapingResultOut(**formatted_result))
@@ -0,0 +1,99 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("motor")
+pytest_asyncio = pytest.importorskip("pytest_asyncio")
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+
+from app.core.config import settings
+from app.services import job_queue
+
+
+@pytest_asyncio.fixture
+async def test_db(monkeypatch):
+    client = AsyncIOMotorClient(settings.MONGODB_URL, serverSelectionTimeoutMS=2000)
+    try:
+        await client.admin.command("ping")
+    except PyMongoError:
+        client.close()
+        pytest.skip("MongoDB is not reachable")
+    db = client[f"{settings.DATABASE_NAME}_test_{uuid.uuid4().hex}"]
+    monkeypatch.setattr(job_queue, "db", db)
+    monkeypatch.setattr(job_queue, "queue", db["xml_queue"])
+    monkeypatch.setattr(job_queue, "job_events", {})
+    yield db
+    await client.drop_database(db.name)
+    client.close()
+
+
+async def expire_lease(request_id):
+    await job_queue.queue.update_one(
+        {"_id": request_id},
+        {"$set": {"visible_at": datetime.utcnow() - timedelta(seconds=1)}}
+    )
+
+
+@pytest.mark.asyncio
+async def test_leased_job_is_hidden_until_acknowledged(test_db):
+    request_id = await job_queue.enqueue("user", ["https://example.com"], b"<xml/>")
+
+    assert await job_queue.lease("user") == (request_id, b"<xml/>")
+    assert await job_queue.lease("user") is None
+    assert await job_queue.lease("other") is None
+
+    assert await job_queue.ack("user", request_id)
+    assert await job_queue.queue.count_documents({}) == 0
+    assert not await job_queue.ack("user", request_id)
+
+
+@pytest.mark.asyncio
+async def test_oldest_job_is_leased_first(test_db):
+    first = await job_queue.enqueue("user", [], b"1", request_id="first")
+    second = await job_queue.enqueue("user", [], b"2", request_id="second")
+
+    assert (await job_queue.lease("user"))[0] == first
+    assert (await job_queue.lease("user"))[0] == second
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_is_handed_out_again(test_db):
+    request_id = await job_queue.enqueue("user", [], b"job")
+    await job_queue.lease("user")
+    assert await job_queue.extend("user", request_id)
+
+    await expire_lease(request_id)
+    assert not await job_queue.extend("user", request_id)
+    assert await job_queue.lease("user") == (request_id, b"job")
+    job = await job_queue.queue.find_one({"_id": request_id})
+    assert job["leases"] == 2
+
+
+@pytest.mark.asyncio
+async def test_job_is_failed_after_its_last_lease_expires(test_db, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_QUEUE_MAX_LEASES", 2)
+    request_id = await job_queue.enqueue("user", [], b"job")
+    await test_db["xml_requests"].insert_one({"request_id": request_id, "status": "pending"})
+
+    for _ in range(2):
+        assert await job_queue.lease("user") == (request_id, b"job")
+        await expire_lease(request_id)
+
+    # Idle leasing gives up on the job.
+    assert await job_queue.lease("user") is None
+    assert await job_queue.queue.count_documents({}) == 0
+    request = await test_db["xml_requests"].find_one({"request_id": request_id})
+    assert request["status"] == "failed"
+
+
+@pytest.mark.asyncio
+async def test_take_removes_a_leased_job(test_db):
+    request_id = await job_queue.enqueue("user", [], b"job")
+    await job_queue.lease("user")
+
+    assert await job_queue.take("other", request_id) is None
+    assert await job_queue.take("user", request_id) == b"job"
+    assert await job_queue.take("user", request_id) is None
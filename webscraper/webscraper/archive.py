@@ -0,0 +1,89 @@
+import glob
+import gzip
+import json
+import os
+from datetime import datetime
+
+
+class ArchiveWriter:
+    """Append-only, WARC-style archive of raw page bodies.
+
+    Each record is its own gzip member, so files can be appended to across
+    runs and still be read back as one stream. Records carry the URL, crawl
+    time, encoding, fetch mode and keywords needed to re-run extraction.
+    """
+
+    def __init__(self, directory, prefix):
+        self.directory = directory
+        self.prefix = prefix
+        os.makedirs(directory, exist_ok=True)
+        self.day = None
+        self.file = None
+
+    def current_file(self, now):
+        day = now.strftime('%Y%m%d')
+        if day != self.day:
+            self.close()
+            self.day = day
+            path = os.path.join(self.directory, f'{self.prefix}-{day}.warc.gz')
+            self.file = open(path, 'ab')
+        return self.file
+
+    def write(self, url, body, encoding, keywords, fetch_mode, status=200):
+        now = datetime.utcnow()
+        headers = [
+            'WARC/1.0',
+            'WARC-Type: response',
+            f'WARC-Target-URI: {url}',
+            f'WARC-Date: {now.strftime("%Y-%m-%dT%H:%M:%SZ")}',
+            f'X-Status: {status}',
+            f'X-Encoding: {encoding}',
+            f'X-Fetch-Mode: {fetch_mode}',
+            f'X-Keywords: {json.dumps(keywords, ensure_ascii=False)}',
+            f'Content-Length: {len(body)}',
+        ]
+        record = ('\r\n'.join(headers) + '\r\n\r\n').encode('utf-8') + body + b'\r\n\r\n'
+        self.current_file(now).write(gzip.compress(record))
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def iter_records(path):
+    """Yield one dict per record of an archive file."""
+    with gzip.open(path, 'rb') as f:
+        while True:
+            line = f.readline()
+            if not line:
+                return
+            if not line.startswith(b'WARC/'):
+                continue
+            headers = {}
+            for line in iter(f.readline, b'\r\n'):
+                if not line:
+                    return
+                name, _, value = line.decode('utf-8').partition(':')
+                headers[name.strip()] = value.strip()
+            body = f.read(int(headers['Content-Length']))
+            f.read(4)
+            yield {
+                'url': headers['WARC-Target-URI'],
+                'date': headers['WARC-Date'],
+                'status': int(headers.get('X-Status', 200)),
+                'encoding': headers.get('X-Encoding') or 'utf-8',
+                'fetch_mode': headers.get('X-Fetch-Mode'),
+                'keywords': json.loads(headers.get('X-Keywords') or '[]'),
+                'body': body,
+            }
+
+
+def archive_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '*.warc.gz'))))
+        else:
+            files.extend(sorted(glob.glob(path)))
+    return files
@@ -0,0 +1,246 @@
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Fixture sites are served under this fake TLD through the local server,
+# which the crawl uses as its HTTP proxy: every site gets its own hostname
+# (and so its own download slot) without any DNS set-up.
+BENCH_DOMAIN = 'bench.test'
+
+KEYWORDS = ['climat', 'université', 'recherche', 'économie']
+
+WORDS = (
+    "le la les des une un pour dans avec sur par plus nouvelle étude gouvernement ville "
+    "étudiants professeurs campus politique marché énergie santé projet ministre rapport "
+    "année semaine région public programme données laboratoire conférence équipe résultats "
+    "national international développement budget réforme société science technologie"
+).split()
+
+
+def sentence(rng, keyword=None):
+    words = rng.choices(WORDS, k=rng.randint(12, 24))
+    if keyword:
+        words.insert(rng.randrange(len(words)), keyword)
+    return ' '.join(words).capitalize() + '.'
+
+
+def paragraphs(rng, count, keyword=None):
+    return ''.join(
+        f"<p>{' '.join(sentence(rng, keyword if i == 0 and j == 0 else None) for j in range(rng.randint(3, 6)))}</p>"
+        for i in range(count)
+    )
+
+
+def chrome(site, rng, body):
+    """Wrap a page body in the navigation, header and footer of the site's template."""
+    nav = ''.join(f'<li><a href="/rubrique-{i}">{rng.choice(WORDS).capitalize()}</a></li>' for i in range(12))
+    if site['kind'] == 'university':
+        header = f'<header class="site-header"><div class="logo">Université {site["index"]}</div><nav class="menu"><ul>{nav}</ul></nav></header>'
+        footer = '<footer class="site-footer"><p>Campus, admissions, bibliothèque, contact.</p></footer>'
+    else:
+        header = f'<header><div class="brand">Le Journal {site["index"]}</div><nav><ul>{nav}</ul></nav><div class="cookie-banner">Cookie consent</div></header>'
+        footer = '<footer><ul><li><a href="/mentions">Mentions légales</a></li><li><a href="/contact">Contact</a></li></ul></footer>'
+    return f'<body>{header}<main class="content">{body}</main>{footer}</body>'
+
+
+def article_body(site, rng, number):
+    keyword = site['keywords'][number % len(site['keywords'])]
+    related = ''.join(f'<li><a href="/article-{rng.randint(1, 50)}">{sentence(rng)}</a></li>' for _ in range(5))
+    css = 'article-content' if site['kind'] == 'news' else 'entry-content'
+    return (
+        f'<article><h1 class="article-title">{sentence(rng, keyword)}</h1>'
+        f'<div class="byline"><span class="author">{rng.choice(WORDS).capitalize()} {rng.choice(WORDS).capitalize()}</span>'
+        f'<span class="date">2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}</span></div>'
+        f'<div class="{css}">{paragraphs(rng, rng.randint(4, 10), keyword)}</div>'
+        f'<aside class="related"><ul>{related}</ul></aside></article>'
+    )
+
+
+def js_heavy_page(site, rng, number, title):
+    # Static HTML carries almost no text; a large bundle writes the article,
+    # so the spider has to fall back to a Selenium render.
+    article = article_body(site, rng, number)
+    bundle = 'var x=' + json.dumps(''.join(rng.choices('abcdef0123456789', k=200000))) + ';'
+    return (
+        f'<html><head><title>{title}</title><script>{bundle}</script></head>'
+        f'<body><div id="app">Chargement...</div>'
+        f'<script>document.getElementById("app").innerHTML = {json.dumps(article)};</script></body></html>'
+    )
+
+
+def render_page(site, path):
+    """Return the HTML for a path of a fixture site, or None for a 404."""
+    rng = random.Random(f"{site['host']}{path}")
+    title = f"{site['kind'].capitalize()} {site['index']}"
+    if path in ('', '/'):
+        links = ''.join(
+            f'<li><a href="/article-{number}">{sentence(rng, site["keywords"][number % 2])}</a></li>'
+            for number in range(1, site['articles'] + 1)
+        )
+        body = f'<section class="teasers"><h1>{title}</h1><ul>{links}</ul>{paragraphs(rng, 1, site["keywords"][0])}</section>'
+        return f'<html><head><title>{title}</title></head>{chrome(site, rng, body)}</html>'
+    if not path.startswith('/article-'):
+        return None
+    try:
+        number = int(path[len('/article-'):])
+    except ValueError:
+        return None
+    if site['variant'] == 'js':
+        return js_heavy_page(site, rng, number, title)
+    return f'<html><head><title>{title}</title></head>{chrome(site, rng, article_body(site, rng, number))}</html>'
+
+
+def build_sites(count, articles, slow_share, js_share, seed=0):
+    rng = random.Random(seed)
+    sites = []
+    for index in range(count):
+        draw = rng.random()
+        variant = 'slow' if draw < slow_share else 'js' if draw < slow_share + js_share else 'plain'
+        sites.append({
+            'index': index,
+            'host': f'site-{index:04d}.{BENCH_DOMAIN}',
+            'kind': 'news' if index % 2 == 0 else 'university',
+            'variant': variant,
+            'articles': articles,
+            'keywords': rng.sample(KEYWORDS, 2),
+        })
+    return sites
+
+
+def config_xml(sites):
+    entries = []
+    for site in sites:
+        keywords = ''.join(f'<keyword>{keyword}</keyword>' for keyword in site['keywords'])
+        entries.append(
+            f'    <site>\n        <url>http://{site["host"]}/</url>\n'
+            f'        <keywords>{keywords}</keywords>\n'
+            f'        <crawl max_depth="1" max_pages="{site["articles"] + 1}" same_domain="true"/>\n    </site>\n'
+        )
+    return '<?xml version="1.0" encoding="UTF-8"?>\n<sites>\n' + ''.join(entries) + '</sites>\n'
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        # Requests arrive in proxy form, with the fixture hostname in the URL.
+        url = urlsplit(self.path)
+        site = self.server.sites.get(url.hostname or self.headers.get('Host', '').split(':')[0])
+        html = render_page(site, url.path) if site else None
+        if site and site['variant'] == 'slow':
+            time.sleep(self.server.slow_delay)
+        body = (html or '<html><body>Not found</body></html>').encode('utf-8')
+        self.send_response(200 if html else 404)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, sites, slow_delay):
+        super().__init__(('127.0.0.1', 0), FixtureHandler)
+        self.sites = {site['host']: site for site in sites}
+        self.slow_delay = slow_delay
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def percentile(values, share):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(share * len(ordered))) - 1))]
+
+
+def peak_rss_mb(usage, platform):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return usage.ru_maxrss / (1024 * 1024 if platform == 'darwin' else 1024)
+
+
+class CrawlBenchmark:
+    """Extension recording per-page latencies and dumping them with the crawl stats.
+
+    Enabled by the benchcrawl command through BENCHMARK_STATS_FILE.
+    """
+
+    def __init__(self, crawler, path):
+        self.crawler = crawler
+        self.path = path
+        self.started = None
+        self.fetch_latencies = []
+        self.page_latencies = []
+        self.finished_pages = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get('BENCHMARK_STATS_FILE')
+        if not path:
+            raise NotConfigured
+        ext = cls(crawler, path)
+        crawler.signals.connect(ext.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def request_scheduled(self, request, spider):
+        now = time.perf_counter()
+        if self.started is None:
+            self.started = now
+        request.meta.setdefault('bench_scheduled', now)
+
+    def response_received(self, response, request, spider):
+        scheduled = request.meta.get('bench_scheduled')
+        if scheduled is not None:
+            self.fetch_latencies.append(time.perf_counter() - scheduled)
+
+    def item_scraped(self, item, response, spider):
+        # A page is done once its first item is exported.
+        scheduled = response.meta.get('bench_scheduled')
+        if scheduled is None or response.url in self.finished_pages:
+            return
+        self.finished_pages.add(response.url)
+        self.page_latencies.append(time.perf_counter() - scheduled)
+
+    def spider_closed(self, spider, reason):
+        result = {
+            'reason': reason,
+            'elapsed': time.perf_counter() - self.started if self.started else 0.0,
+            'pages': len(self.fetch_latencies),
+            'pages_with_items': len(self.page_latencies),
+            'fetch_latencies': self.fetch_latencies,
+            'page_latencies': self.page_latencies,
+            'stats': {key: value for key, value in self.crawler.stats.get_stats().items()
+                      if isinstance(value, (int, float, str))},
+        }
+        if resource is not None:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            result['crawler_cpu'] = {'user': usage.ru_utime, 'system': usage.ru_stime}
+            result['crawler_rss_mb'] = peak_rss_mb(usage, sys.platform)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
@@ -0,0 +1,199 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from webscraper import bench
+
+# Metrics compared against the baseline, and whether higher is better.
+METRICS = {
+    'pages_per_second': True,
+    'fetch_p50_ms': False,
+    'fetch_p99_ms': False,
+    'page_p50_ms': False,
+    'page_p99_ms': False,
+    'peak_rss_mb': False,
+    'cpu_seconds': False,
+}
+
+# Crawl settings for the benchmark: no politeness delay, since the fixture
+# server is local, and nothing sent to a real backend.
+CRAWL_SETTINGS = {
+    'DOWNLOAD_DELAY': '0',
+    'DOMAIN_THROTTLE_MIN_DELAY': '0',
+    'LOG_LEVEL': 'WARNING',
+}
+
+
+def ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def summarize(result, wall, children_cpu, children_rss_mb):
+    """Reduce the extension's dump and the process usage to the benchmark metrics."""
+    stats = result['stats']
+    summary = {
+        'pages': result['pages'],
+        'pages_with_items': result['pages_with_items'],
+        'items': stats.get('item_scraped_count', 0),
+        'errors': stats.get('log_count/ERROR', 0),
+        'elapsed_s': round(result['elapsed'], 2),
+        'wall_s': round(wall, 2),
+        'pages_per_second': round(result['pages'] / result['elapsed'], 2) if result['elapsed'] else 0.0,
+        'fetch_p50_ms': ms(bench.percentile(result['fetch_latencies'], 0.50)),
+        'fetch_p99_ms': ms(bench.percentile(result['fetch_latencies'], 0.99)),
+        'page_p50_ms': ms(bench.percentile(result['page_latencies'], 0.50)),
+        'page_p99_ms': ms(bench.percentile(result['page_latencies'], 0.99)),
+        'selenium_fallbacks': stats.get('hybrid/selenium_fallback', 0),
+    }
+    if children_cpu is not None:
+        crawler = result.get('crawler_cpu', {})
+        crawler_cpu = crawler.get('user', 0.0) + crawler.get('system', 0.0)
+        # The crawl's process tree: the crawler itself (downloads, callbacks,
+        # export) and what its extraction workers used on top of it.
+        summary['cpu_seconds'] = round(children_cpu, 2)
+        summary['cpu_by_stage'] = {
+            'crawler': round(crawler_cpu, 2),
+            'extraction_workers': round(max(children_cpu - crawler_cpu, 0.0), 2),
+        }
+        summary['peak_rss_mb'] = round(max(children_rss_mb, result.get('crawler_rss_mb', 0.0)), 1)
+    # Totals across domains only: stage_time/<stage>/total_ms.
+    summary['time_by_stage_ms'] = {
+        key.split('/')[1]: round(value, 1) for key, value in stats.items()
+        if key.startswith('stage_time/') and key.endswith('/total_ms') and key.count('/') == 2
+    }
+    return summary
+
+
+def compare(summary, baseline, tolerance):
+    """Return (metric, baseline, current, change) for every metric that regressed."""
+    regressions = []
+    for metric, higher_is_better in METRICS.items():
+        current = summary.get(metric)
+        previous = baseline.get(metric)
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append((metric, previous, current, change))
+    return regressions
+
+
+def children_usage():
+    if bench.resource is None:
+        return None, 0.0
+    usage = bench.resource.getrusage(bench.resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime, bench.peak_rss_mb(usage, sys.platform)
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Benchmark xml_spider end to end against a local fixture server"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument('--sites', type=int, default=300, help="number of fixture sites (default: 300)")
+        parser.add_argument('--articles', type=int, default=5, help="articles per site (default: 5)")
+        parser.add_argument('--slow-share', type=float, default=0.05,
+                            help="share of sites answering slowly (default: 0.05)")
+        parser.add_argument('--slow-delay', type=float, default=2.0,
+                            help="response delay of slow sites in seconds (default: 2.0)")
+        parser.add_argument('--js-share', type=float, default=0.05,
+                            help="share of JS-heavy sites needing a Selenium render; "
+                                 "set to 0 without a working browser driver (default: 0.05)")
+        parser.add_argument('--baseline', default='bench_baseline.json',
+                            help="baseline file to compare with (default: bench_baseline.json)")
+        parser.add_argument('--save-baseline', action='store_true', help="store this run as the new baseline")
+        parser.add_argument('--tolerance', type=float, default=0.15,
+                            help="relative change counted as a regression (default: 0.15)")
+        parser.add_argument('-c', '--crawl-set', action='append', default=[], metavar='NAME=VALUE',
+                            help="extra setting for the benchmarked crawl (may be repeated)")
+        parser.add_argument('--keep', action='store_true', help="keep the crawl's working directory")
+
+    def run(self, args, opts):
+        crawl_settings = dict(CRAWL_SETTINGS)
+        for entry in opts.crawl_set:
+            name, sep, value = entry.partition('=')
+            if not sep:
+                raise UsageError(f"Invalid crawl setting: {entry}")
+            crawl_settings[name] = value
+
+        sites = bench.build_sites(opts.sites, opts.articles, opts.slow_share, opts.js_share)
+        server = bench.FixtureServer(sites, opts.slow_delay)
+        server.start()
+
+        workdir = tempfile.mkdtemp(prefix='benchcrawl-')
+        stats_path = os.path.join(workdir, 'bench_stats.json')
+        with open(os.path.join(workdir, 'config.xml'), 'w', encoding='utf-8') as f:
+            f.write(bench.config_xml(sites))
+
+        project_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        env = dict(os.environ)
+        env.pop('BACKEND_URL', None)
+        env.update({
+            'PYTHONPATH': os.pathsep.join(filter(None, [project_dir, env.get('PYTHONPATH')])),
+            'SCRAPY_SETTINGS_MODULE': os.environ.get('SCRAPY_SETTINGS_MODULE', 'webscraper.settings'),
+            'http_proxy': server.url,
+            'no_proxy': '',
+        })
+        command = [
+            sys.executable, '-m', 'scrapy', 'crawl', 'xml_spider',
+            '-s', f'BENCHMARK_STATS_FILE={stats_path}',
+            '-s', 'EXTENSIONS=' + json.dumps({'webscraper.bench.CrawlBenchmark': 500}),
+        ]
+        for name, value in crawl_settings.items():
+            command += ['-s', f'{name}={value}']
+
+        variants = {variant: sum(1 for site in sites if site['variant'] == variant) for variant in ('plain', 'slow', 'js')}
+        print(f"Crawling {len(sites)} fixture sites {variants} through {server.url} in {workdir}")
+        cpu_before, _ = children_usage()
+        started = time.perf_counter()
+        try:
+            returncode = subprocess.call(command, cwd=workdir, env=env)
+        finally:
+            server.shutdown()
+        wall = time.perf_counter() - started
+        cpu_after, rss_mb = children_usage()
+
+        try:
+            if returncode != 0 or not os.path.exists(stats_path):
+                print(f"Benchmark crawl failed (exit code {returncode})")
+                self.exitcode = 1
+                return
+            with open(stats_path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+        finally:
+            if not opts.keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        summary = summarize(result, wall, None if cpu_before is None else cpu_after - cpu_before, rss_mb)
+        print(json.dumps(summary, indent=2))
+
+        if opts.save_baseline:
+            with open(opts.baseline, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2)
+            print(f"Saved baseline to {opts.baseline}")
+            return
+        if not os.path.exists(opts.baseline):
+            print(f"No baseline at {opts.baseline}; run with --save-baseline to create one")
+            return
+        with open(opts.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(summary, baseline, opts.tolerance)
+        for metric, previous, current, change in regressions:
+            print(f"REGRESSION {metric}: {previous} -> {current} ({change:+.0%})")
+        if regressions:
+            self.exitcode = 1
+        else:
+            print(f"No regression beyond {opts.tolerance:.0%} against {opts.baseline}")
@@ -0,0 +1,88 @@
+import time
+from itertools import islice
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+from scrapy.http import HtmlResponse
+
+from webscraper import extractors
+from webscraper.archive import archive_files, iter_records
+
+
+def run_selectors(response):
+    return extractors.extract_content_selectors(response.selector)
+
+
+def run_single_pass(response):
+    return extractors.extract_content(response.selector.root, extractors.clean_text)
+
+
+def run_density(response):
+    return extractors.extract_content_density(response.selector.root, extractors.clean_text)
+
+
+EXTRACTORS = {
+    'selectors': run_selectors,
+    'single_pass': run_single_pass,
+    'density': run_density,
+}
+
+
+def load_pages(files, limit):
+    records = (record for path in files for record in iter_records(path) if record['status'] == 200)
+    return [
+        HtmlResponse(url=record['url'], body=record['body'], encoding=record['encoding'])
+        for record in islice(records, limit)
+    ]
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+
+    def syntax(self):
+        return "[options] <archive file or directory> ..."
+
+    def short_desc(self):
+        return "Compare content extractors' speed and output length on archived pages"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument('-e', '--extractors', default=','.join(EXTRACTORS),
+                            help=f"comma-separated extractors to compare (default: {','.join(EXTRACTORS)})")
+        parser.add_argument('-n', '--limit', type=int, default=None,
+                            help="only use the first N archived pages")
+        parser.add_argument('-r', '--repeat', type=int, default=3,
+                            help="runs per extractor, the fastest is reported (default: 3)")
+
+    def run(self, args, opts):
+        if not args:
+            raise UsageError()
+        names = [name.strip() for name in opts.extractors.split(',') if name.strip()]
+        unknown = [name for name in names if name not in EXTRACTORS]
+        if unknown:
+            raise UsageError(f"Unknown extractors: {', '.join(unknown)}")
+        files = archive_files(args)
+        if not files:
+            raise UsageError(f"No archive files found in {', '.join(args)}")
+
+        # Parse every page up front so only extraction is timed.
+        pages = load_pages(files, opts.limit)
+        if not pages:
+            raise UsageError("The archives contain no successful pages")
+        for page in pages:
+            page.selector.root
+
+        print(f"{len(pages)} pages from {len(files)} archive files, best of {opts.repeat} runs")
+        print(f"{'extractor':<12} {'pages/s':>10} {'ms/page':>10} {'avg chars':>10} {'empty':>7}")
+        for name in names:
+            extract = EXTRACTORS[name]
+            best = None
+            for _ in range(max(opts.repeat, 1)):
+                started = time.perf_counter()
+                lengths = [len(extract(page)) for page in pages]
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            print(
+                f"{name:<12} {len(pages) / best:>10.1f} {best * 1000 / len(pages):>10.2f} "
+                f"{sum(lengths) / len(pages):>10.0f} {lengths.count(0):>7}"
+            )
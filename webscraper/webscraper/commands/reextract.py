@@ -0,0 +1,111 @@
+import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+from scrapy.exporters import CsvItemExporter, JsonLinesItemExporter
+
+from webscraper import extractors
+from webscraper.archive import archive_files, iter_records
+from webscraper.exporters import PAGE_FIELDS, PerKeywordCsvItemExporter, PerKeywordJsonLinesItemExporter
+from webscraper.fetch_modes import STATIC
+from webscraper.spiders.xml_spider import XmlSpider
+
+
+CHUNK_SIZE = 32
+
+
+def reextract_chunk(records, options, static_options):
+    items = []
+    for record in records:
+        # Like the live crawl, a static page too short to keep yields
+        # nothing; its Selenium render is archived as a record of its own.
+        record_options = static_options if record['fetch_mode'] == STATIC else options
+        result = extractors.extract_page(record['url'], record['body'], record['encoding'], record['keywords'], record_options)
+        items.extend(extractors.page_items(record['url'], result, record['keywords'], record_options))
+    return len(records), items
+
+
+def iter_chunks(files):
+    chunk = []
+    for path in files:
+        logging.info(f"Re-extracting {path}")
+        for record in iter_records(path):
+            if record['status'] != 200:
+                continue
+            chunk.append(record)
+            if len(chunk) >= CHUNK_SIZE:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+class Command(ScrapyCommand):
+    requires_project = True
+
+    def syntax(self):
+        return "[options] <archive file or directory> ..."
+
+    def short_desc(self):
+        return "Re-run extraction and keyword matching over archived pages, without network or browser"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument('-o', '--output', default='reextracted.csv',
+                            help="output file, .csv or .jsonl (default: reextracted.csv)")
+        parser.add_argument('-j', '--processes', type=int, default=None,
+                            help="number of worker processes (default: one per core)")
+        parser.add_argument('--per-keyword', action='store_true',
+                            help="write one row per matched keyword instead of one per page")
+
+    def run(self, args, opts):
+        if not args:
+            raise UsageError()
+        files = archive_files(args)
+        if not files:
+            raise UsageError(f"No archive files found in {', '.join(args)}")
+
+        # Use the spider's extraction settings so the output matches a live crawl.
+        settings = self.settings.copy()
+        settings.setdict(XmlSpider.custom_settings, priority='spider')
+        options = extractors.extraction_options(settings)
+        static_options = options
+        if settings.getbool('HYBRID_FETCH_ENABLED'):
+            static_options = extractors.extraction_options(settings, settings.getint('HYBRID_MIN_CONTENT_LENGTH'))
+
+        with open(opts.output, 'wb') as f:
+            if opts.output.endswith('.jsonl'):
+                exporter_class = PerKeywordJsonLinesItemExporter if opts.per_keyword else JsonLinesItemExporter
+                exporter = exporter_class(f, encoding='utf-8')
+            elif opts.per_keyword:
+                exporter = PerKeywordCsvItemExporter(f, encoding='utf-8')
+            else:
+                exporter = CsvItemExporter(f, encoding='utf-8', fields_to_export=PAGE_FIELDS)
+            exporter.start_exporting()
+
+            pages = items = 0
+            processes = opts.processes or os.cpu_count() or 1
+            # Keep a bounded window of chunks in flight so archives of any
+            # size are streamed rather than loaded into memory.
+            pending = deque()
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                chunks = iter_chunks(files)
+                while True:
+                    while len(pending) < processes * 2:
+                        chunk = next(chunks, None)
+                        if chunk is None:
+                            break
+                        pending.append(pool.submit(reextract_chunk, chunk, options, static_options))
+                    if not pending:
+                        break
+                    chunk_pages, chunk_items = pending.popleft().result()
+                    pages += chunk_pages
+                    for item in chunk_items:
+                        exporter.export_item(item)
+                    items += len(chunk_items)
+
+            exporter.finish_exporting()
+        print(f"Re-extracted {pages} pages from {len(files)} archive files into {items} items ({opts.output})")
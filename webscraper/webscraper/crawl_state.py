@@ -0,0 +1,67 @@
+import hashlib
+import logging
+import os
+
+# Sent with items=[...] by pipelines that deliver items after item_scraped,
+# e.g. in batches, once those items are delivered or safely on disk.
+items_delivered = object()
+
+# Sent with response=... by the spider once a page has been parsed and
+# extracted without error.
+page_processed = object()
+
+
+def job_dir_resuming(job_dir):
+    """True when job_dir holds the state of an interrupted crawl."""
+    return bool(job_dir) and os.path.exists(os.path.join(job_dir, 'requests.seen'))
+
+
+class EmittedLog:
+    """Append-only record of the items already emitted by a resumable crawl.
+
+    An item is claimed when the spider yields it, which keeps it from being
+    emitted twice in the same run, and added once it has been delivered.
+    Only added keys are flushed to disk, so a crawl killed without a clean
+    shutdown emits again the items it had not delivered yet, never the ones
+    it had.
+    """
+
+    def __init__(self, job_dir):
+        os.makedirs(job_dir, exist_ok=True)
+        self.path = os.path.join(job_dir, 'items.emitted')
+        self.keys = set()
+        self.claimed = set()
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.keys.update(line.strip() for line in f if line.strip())
+            logging.info(f"Resuming with {len(self.keys)} items already emitted")
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha1('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+    def claim(self, *parts):
+        """Reserve an item for this run and return True if it had not been emitted before."""
+        key = self.key(*parts)
+        if key in self.keys or key in self.claimed:
+            return False
+        self.claimed.add(key)
+        return True
+
+    def release(self, *parts):
+        """Give up the claim on an item that was never delivered."""
+        self.claimed.discard(self.key(*parts))
+
+    def add(self, *parts):
+        """Record a delivered item for good."""
+        key = self.key(*parts)
+        self.claimed.discard(key)
+        if key in self.keys:
+            return
+        self.keys.add(key)
+        self.file.write(key + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
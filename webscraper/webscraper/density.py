@@ -0,0 +1,110 @@
+import math
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Candidate blocks and how much their tag alone says about being the article.
+TAG_WEIGHTS = {
+    'article': 1.5, 'main': 1.4, 'section': 1.0, 'div': 1.0, 'td': 0.8,
+    'body': 0.6, 'ul': 0.6, 'form': 0.2, 'header': 0.3, 'aside': 0.2,
+    'nav': 0.1, 'footer': 0.1,
+}
+
+POSITIVE_NAMES = re.compile(r'article|body|content|entry|main|post|story|text', re.I)
+NEGATIVE_NAMES = re.compile(
+    r'banner|breadcrumb|comment|cookie|footer|header|menu|nav|promo|related|share|sidebar|social|widget', re.I
+)
+
+IGNORED_TAGS = {'script', 'style', 'noscript', 'template', 'head'}
+
+# Blocks inside the winner with more link text than this, or a weight below
+# MIN_WEIGHT, are left out of its text (menus, share bars, "read more" lists).
+MAX_LINK_DENSITY = 0.5
+MIN_WEIGHT = 0.5
+
+
+def block_weight(element):
+    weight = TAG_WEIGHTS[element.tag]
+    names = f"{element.get('class', '')} {element.get('id', '')}"
+    if POSITIVE_NAMES.search(names):
+        weight *= 1.5
+    if NEGATIVE_NAMES.search(names):
+        weight *= 0.3
+    return weight
+
+
+def collect_blocks(root):
+    """Gather text length, link text length, tag count and weight of every candidate block in one walk."""
+    blocks = []
+    text_lengths = []
+    link_lengths = []
+    tag_counts = []
+    weights = []
+
+    def walk(element, in_link):
+        text = len((element.text or '').strip())
+        links = text if in_link else 0
+        tags = 1
+        for child in element:
+            if isinstance(child.tag, str) and child.tag not in IGNORED_TAGS:
+                child_text, child_links, child_tags = walk(child, in_link or child.tag == 'a')
+                text += child_text
+                links += child_links
+                tags += child_tags
+            if child.tail:
+                tail = len(child.tail.strip())
+                text += tail
+                links += tail if in_link else 0
+        if element.tag in TAG_WEIGHTS:
+            blocks.append(element)
+            text_lengths.append(text)
+            link_lengths.append(links)
+            tag_counts.append(tags)
+            weights.append(block_weight(element))
+        return text, links, tags
+
+    walk(root, False)
+    return blocks, text_lengths, link_lengths, tag_counts, weights
+
+
+def score_blocks(text_lengths, link_lengths, tag_counts, weights):
+    """Score blocks by non-link text, scaled by text density and tag weight.
+
+    Returns (scores, link_densities), as arrays when numpy is available.
+    """
+    if np is not None:
+        text = np.asarray(text_lengths, dtype=float)
+        links = np.asarray(link_lengths, dtype=float)
+        tags = np.asarray(tag_counts, dtype=float)
+        link_density = links / np.maximum(text, 1.0)
+        scores = (text - links) * np.sqrt(text / (tags + 1.0)) * np.asarray(weights, dtype=float)
+        return scores, link_density
+    link_density = [links / max(text, 1) for text, links in zip(text_lengths, link_lengths)]
+    scores = [
+        (text - links) * math.sqrt(text / (tags + 1)) * weight
+        for text, links, tags, weight in zip(text_lengths, link_lengths, tag_counts, weights)
+    ]
+    return scores, link_density
+
+
+def main_content(root):
+    """Pick the main content block of a page.
+
+    Returns (block, pruned) where pruned holds the boilerplate blocks to skip
+    while reading the block's text, or (None, set()) when nothing scores.
+    """
+    blocks, text_lengths, link_lengths, tag_counts, weights = collect_blocks(root)
+    if not blocks:
+        return None, set()
+    scores, link_density = score_blocks(text_lengths, link_lengths, tag_counts, weights)
+    best = max(range(len(blocks)), key=scores.__getitem__) if np is None else int(np.argmax(scores))
+    if scores[best] <= 0:
+        return None, set()
+    pruned = {
+        block for index, block in enumerate(blocks)
+        if index != best and (link_density[index] > MAX_LINK_DENSITY or weights[index] < MIN_WEIGHT)
+    }
+    return blocks[best], pruned
@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from io import BytesIO
+import xml.etree.ElementTree as ET
+
+
+def local_name(tag):
+    return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else ''
+
+
+def parse_date(text):
+    """Parse an ISO 8601 (sitemaps, Atom) or RFC 822 (RSS) date into an aware UTC datetime."""
+    if not text:
+        return None
+    text = text.strip()
+    try:
+        value = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except ValueError:
+        try:
+            value = parsedate_to_datetime(text)
+        except (TypeError, ValueError):
+            return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def namespace(tag):
+    return tag[1:].split('}', 1)[0] if isinstance(tag, str) and tag.startswith('{') else ''
+
+
+def iter_sitemap(body):
+    """Stream (kind, loc, lastmod) tuples out of a sitemap or sitemap index.
+
+    kind is 'sitemap' for entries of a sitemap index and 'url' for pages.
+    News sitemaps' publication_date is used when there is no lastmod.
+    Only the entry's own <loc> counts: image and video extensions nest
+    their own <loc> elements inside <url>.
+    """
+    loc = lastmod = None
+    parents = []
+    for event, element in ET.iterparse(BytesIO(body), events=('start', 'end')):
+        if event == 'start':
+            parents.append(element)
+            continue
+        parents.pop()
+        parent = parents[-1] if parents else None
+        name = local_name(element.tag)
+        in_entry = parent is not None and local_name(parent.tag) in ('url', 'sitemap') \
+            and namespace(parent.tag) == namespace(element.tag)
+        if name == 'loc':
+            if in_entry:
+                loc = (element.text or '').strip()
+        elif name == 'lastmod' and in_entry:
+            lastmod = parse_date(element.text)
+        elif name == 'publication_date' and lastmod is None:
+            lastmod = parse_date(element.text)
+        elif name in ('url', 'sitemap'):
+            if loc:
+                yield name, loc, lastmod
+            loc = lastmod = None
+            # Drop finished entries so huge sitemaps parse in constant memory.
+            element.clear()
+
+
+def iter_feed(body):
+    """Stream (link, published) pairs out of an RSS or Atom feed."""
+    link = published = None
+    for event, element in ET.iterparse(BytesIO(body), events=('start', 'end')):
+        name = local_name(element.tag)
+        if event == 'start':
+            # Channel/feed-level links and dates must not leak into the first entry.
+            if name in ('item', 'entry'):
+                link = published = None
+            continue
+        if name == 'link':
+            # RSS puts the URL in the text, Atom in the href of rel="alternate".
+            href = element.get('href')
+            if href and element.get('rel', 'alternate') == 'alternate':
+                link = href.strip()
+            elif element.text and element.text.strip() and not href:
+                link = element.text.strip()
+        elif name in ('pubDate', 'published', 'updated', 'date') and published is None:
+            published = parse_date(element.text)
+        elif name in ('item', 'entry'):
+            if link:
+                yield link, published
+            link = published = None
+            element.clear()
+
+
+class WatermarkStore:
+    """Newest article date seen per site, so discovery only queues fresh entries."""
+
+    def __init__(self, path):
+        self.path = path
+        self.watermarks = {}
+        self.pending = {}
+        self.skipped = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.watermarks = json.load(f)
+            except Exception as e:
+                logging.error(f"Error loading discovery watermarks: {str(e)}")
+
+    def get(self, site):
+        value = self.watermarks.get(site)
+        return parse_date(value) if value else None
+
+    def is_fresh(self, site, published):
+        watermark = self.get(site)
+        return watermark is None or published > watermark
+
+    def observe(self, site, published):
+        # Watermarks only advance when the crawl is saved, so entries found
+        # during this run are compared against the previous run's watermark.
+        current = self.pending.get(site)
+        if current is None or published > current:
+            self.pending[site] = published
+
+    def skip(self, site, published):
+        # A fresh entry left out (e.g. over the site's budget) must stay
+        # fresh for the next run, so the watermark may not pass it.
+        current = self.skipped.get(site)
+        if current is None or published < current:
+            self.skipped[site] = published
+
+    def save(self):
+        if not self.path or not self.pending:
+            return
+        for site, published in self.pending.items():
+            if site in self.skipped:
+                published = min(published, self.skipped[site] - timedelta(microseconds=1))
+            watermark = self.get(site)
+            if watermark is None or published > watermark:
+                self.watermarks[site] = published.isoformat()
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.watermarks, f, indent=2, sort_keys=True)
+            self.pending = {}
+            self.skipped = {}
+        except Exception as e:
+            logging.error(f"Error saving discovery watermarks: {str(e)}")
@@ -0,0 +1,38 @@
+from itemadapter import ItemAdapter
+from scrapy.exporters import CsvItemExporter, JsonLinesItemExporter
+
+PAGE_FIELDS = ['URL', 'Mots_clés', 'Occurrences', 'Titre', 'Contenu', 'Date', 'Auteurs']
+
+KEYWORD_FIELDS = ['URL', 'Mot_clé', 'Titre', 'Contenu', 'Date', 'Auteurs']
+
+
+def keyword_rows(item):
+    """Expand a page item into the original one-row-per-matched-keyword items."""
+    adapter = ItemAdapter(item)
+    for keyword in adapter.get('Mots_clés') or []:
+        yield {
+            'URL': adapter.get('URL'),
+            'Mot_clé': keyword,
+            'Titre': adapter.get('Titre'),
+            'Contenu': adapter.get('Contenu'),
+            'Date': adapter.get('Date'),
+            'Auteurs': adapter.get('Auteurs'),
+        }
+
+
+class PerKeywordMixin:
+    def export_item(self, item):
+        for row in keyword_rows(item):
+            super().export_item(row)
+
+
+class PerKeywordCsvItemExporter(PerKeywordMixin, CsvItemExporter):
+    """CSV feed format 'csv_per_keyword': the pre-page-item resultats.csv layout."""
+
+    def __init__(self, file, **kwargs):
+        kwargs.setdefault('fields_to_export', KEYWORD_FIELDS)
+        super().__init__(file, **kwargs)
+
+
+class PerKeywordJsonLinesItemExporter(PerKeywordMixin, JsonLinesItemExporter):
+    """JSON lines feed format 'jsonlines_per_keyword'."""
@@ -0,0 +1,272 @@
+import re
+
+from lxml.cssselect import CSSSelector
+from scrapy.http import HtmlResponse
+
+from webscraper import density
+from webscraper.keywords import KeywordMatcher
+from webscraper.metrics import StageTimer
+
+CONTENT_SELECTORS = [
+    'article', '.article', '.post', '.entry',
+    '.content', '.main', '.body', '.text',
+    '[itemprop="articleBody"]', '.article-content',
+    '.post-content', '.entry-content'
+]
+
+TITLE_SELECTORS = [
+    'title::text', 'h1::text', '.title::text', '.article-title::text',
+    '.post-title::text', '.entry-title::text', '.content-title::text',
+    '#title::text', '[itemprop="headline"]::text'
+]
+
+AUTHOR_SELECTORS = [
+    '.author::text', '.authors::text', '.byline::text',
+    '[itemprop="author"]::text', '.post-author::text',
+    '.article-author::text', '.contributor::text'
+]
+
+DATE_SELECTORS = [
+    '.date::text', '.published::text', '.post-date::text',
+    '[itemprop="datePublished"]::text', '.article-date::text',
+    '.timestamp::text', '.time::text'
+]
+
+BOILERPLATE_PREFIXES = ('{', 'document.', 'Skip to', 'Advertisement', 'Cookie', 'Sign in')
+
+SKIPPED_TAGS = {'script', 'style', 'noscript', 'template'}
+
+# One grouped selector compiles to a single XPath union, so every candidate
+# container is found in one evaluation and returned in document order.
+content_selector = CSSSelector(', '.join(CONTENT_SELECTORS), translator='html')
+
+
+def clean_text(text):
+    if not text:
+        return ""
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'[^\w\s.,;:!?éèêëàâäôöûüçÉÈÊËÀÂÄÔÖÛÜÇ-]', '', text)
+    return text.strip()
+
+
+def extract_metadata(selector, profile=None, used=None, clean_text=clean_text):
+    """Extract title, authors and date.
+
+    profile maps fields to selectors learned for the page's domain; they are
+    tried first and the full lists are only probed when they yield nothing.
+    The selectors that produced output, the fields that fell back and the
+    number of selector evaluations are written to used when given.
+    """
+    profile = profile or {}
+    used = used if used is not None else {}
+    used.setdefault('fallbacks', [])
+    used.setdefault('evaluations', 0)
+
+    def first_match(field, selectors):
+        for css in selectors:
+            used['evaluations'] += 1
+            value = selector.css(css).get()
+            if value:
+                used[field] = [css]
+                return clean_text(value)
+        return ''
+
+    def all_matches(field, selectors):
+        values = []
+        for css in selectors:
+            used['evaluations'] += 1
+            found = [value for value in selector.css(css).getall() if value.strip()]
+            if found:
+                used.setdefault(field, []).append(css)
+                values.extend(found)
+        return values
+
+    def with_profile(field, extract, selectors):
+        if profile.get(field):
+            value = extract(field, profile[field])
+            if value:
+                return value
+            used['fallbacks'].append(field)
+        return extract(field, selectors)
+
+    authors = with_profile('authors', all_matches, AUTHOR_SELECTORS)
+    return {
+        'title': with_profile('title', first_match, TITLE_SELECTORS),
+        'authors': ', '.join([clean_text(author) for author in authors]),
+        'date': with_profile('date', first_match, DATE_SELECTORS),
+    }
+
+
+def keep_fragment(text):
+    stripped = text.strip()
+    return len(stripped) > 3 and not stripped.startswith(BOILERPLATE_PREFIXES)
+
+
+def outermost(elements):
+    # Nested matches (e.g. `article .post-content`) are already covered by
+    # their matched ancestor, so only the outermost containers are walked.
+    matched = set(elements)
+    return [
+        element for element in elements
+        if not any(ancestor in matched for ancestor in element.iterancestors())
+    ]
+
+
+def iter_text(element, skipped=frozenset()):
+    if element.text:
+        yield element.text
+    for child in element:
+        if isinstance(child.tag, str) and child.tag not in SKIPPED_TAGS and child not in skipped:
+            yield from iter_text(child, skipped)
+        if child.tail:
+            yield child.tail
+
+
+def extract_content(root, clean_text):
+    """Collect the text of every content container once, in a single tree walk."""
+    parts = []
+    for container in outermost(content_selector(root)):
+        for text in iter_text(container):
+            if keep_fragment(text):
+                parts.append(clean_text(text))
+    return ' '.join(parts)
+
+
+def extract_content_density(root, clean_text):
+    """Text of the block that scores highest on text density, minus its boilerplate blocks."""
+    block, pruned = density.main_content(root)
+    if block is None:
+        return ''
+    return ' '.join(clean_text(text) for text in iter_text(block, pruned) if keep_fragment(text))
+
+
+def extract_content_selectors(selector, selectors=CONTENT_SELECTORS, used=None, clean_text=clean_text):
+    """Original extractor: one ::text query per content selector."""
+    content_parts = []
+    for css in selectors:
+        found = selector.css(f'{css}::text, {css} *::text').getall()
+        if used is not None:
+            used['evaluations'] += 1
+            if any(keep_fragment(text) for text in found):
+                used.setdefault('content', []).append(css)
+        content_parts.extend(found)
+    return ' '.join([clean_text(text) for text in content_parts if keep_fragment(text)])
+
+
+def compare_content(legacy, single_pass):
+    """Summarise how the single-pass output differs from the selector-loop output."""
+    legacy_words = set(legacy.split())
+    single_pass_words = set(single_pass.split())
+    return {
+        'legacy_length': len(legacy),
+        'single_pass_length': len(single_pass),
+        'missing_words': sorted(legacy_words - single_pass_words),
+        'extra_words': sorted(single_pass_words - legacy_words),
+    }
+
+
+# Keyword automata are cached per process, so pool workers build each one once.
+keyword_matchers = {}
+
+
+def keyword_matcher(keywords, word_boundaries=True, fold_accents=True):
+    key = (tuple(keywords), word_boundaries, fold_accents)
+    if key not in keyword_matchers:
+        keyword_matchers[key] = KeywordMatcher(keywords, word_boundaries=word_boundaries, fold_accents=fold_accents)
+    return keyword_matchers[key]
+
+
+def extraction_options(settings, min_content_length=0):
+    return {
+        'extractor': settings.get('CONTENT_EXTRACTOR', 'single_pass'),
+        'parity': settings.getbool('CONTENT_EXTRACTOR_PARITY'),
+        'word_boundaries': settings.getbool('KEYWORD_WORD_BOUNDARIES'),
+        'fold_accents': settings.getbool('KEYWORD_FOLD_ACCENTS'),
+        'min_content_length': min_content_length,
+    }
+
+
+def page_items(url, result, keywords, options):
+    """Build the exported item for a page from an extract_page result.
+
+    One item per page, listing the matched keywords (in configuration
+    order) with their occurrence counts; empty when nothing matched.
+    """
+    if not result['content'] or not result['metadata']:
+        return []
+    metadata = result['metadata']
+    matcher = keyword_matcher(keywords, options.get('word_boundaries', True), options.get('fold_accents', True))
+    matched = [keyword for keyword in matcher.keywords if keyword in result['hits']]
+    if not matched:
+        return []
+    return [{
+        'URL': url,
+        'Mots_clés': matched,
+        'Occurrences': [result['hits'][keyword]['count'] for keyword in matched],
+        'Titre': metadata['title'],
+        'Contenu': result['content'][:1000],
+        'Date': metadata['date'],
+        'Auteurs': metadata['authors']
+    }]
+
+
+def extract_page(url, body, encoding, keywords, options):
+    """Run content extraction, metadata extraction and keyword matching for one page.
+
+    Takes and returns only plain data so it can run in a worker process.
+    When the content is shorter than options['min_content_length'], metadata
+    and keywords are skipped because the page is going to be re-rendered.
+    options['profile'] holds the selectors learned for the page's domain;
+    result['selectors'] reports the ones that worked so the caller can
+    update the profile. With options['timings'], result['timings'] holds
+    the seconds spent in each stage (clean_text is also counted in the
+    content and metadata stages that call it).
+    """
+    timer = StageTimer()
+    # Timing every clean_text call is the only measurement with a per-call
+    # cost, so it is skipped unless timings were asked for.
+    clean = timer.wrap('clean_text', clean_text) if options.get('timings') else clean_text
+    with timer.stage('html_parse'):
+        response = HtmlResponse(url=url, body=body, encoding=encoding)
+        selector = response.selector
+    result = {'content': '', 'metadata': None, 'hits': {}, 'parity': None, 'selectors': None, 'timings': None}
+    if options.get('timings'):
+        result['timings'] = timer.totals
+    profile = options.get('profile') or {}
+    used = {'fallbacks': [], 'evaluations': 0}
+
+    with timer.stage('content'):
+        if options.get('extractor') == 'selectors':
+            content = ''
+            if profile.get('content'):
+                content = extract_content_selectors(selector, profile['content'], used, clean)
+                if len(content) < options.get('profile_min_length', 1):
+                    used['fallbacks'].append('content')
+                    used.pop('content', None)
+                    content = ''
+            if not content:
+                content = extract_content_selectors(selector, CONTENT_SELECTORS, used, clean)
+        elif options.get('extractor') == 'density':
+            # Density scoring does not use the selector lists, so there is
+            # nothing for selector profiles to learn or skip.
+            content = extract_content_density(selector.root, clean)
+        else:
+            # The grouped selector already finds every container in one
+            # evaluation, so a content profile would not save anything;
+            # profiles still apply to the metadata below.
+            used['evaluations'] += 1
+            content = extract_content(selector.root, clean)
+    if options.get('parity') and options.get('extractor') not in ('selectors', 'density'):
+        result['parity'] = compare_content(extract_content_selectors(selector), content)
+    result['content'] = content
+
+    if len(content) < options.get('min_content_length', 0):
+        return result
+
+    with timer.stage('metadata'):
+        result['metadata'] = extract_metadata(selector, profile, used, clean)
+    result['selectors'] = used
+    with timer.stage('keywords'):
+        matcher = keyword_matcher(keywords, options.get('word_boundaries', True), options.get('fold_accents', True))
+        result['hits'] = matcher.find(content)
+    return result
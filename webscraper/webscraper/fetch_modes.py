@@ -0,0 +1,71 @@
+import json
+import logging
+import os
+import time
+from urllib.parse import urlparse
+
+STATIC = 'static'
+SELENIUM = 'selenium'
+
+
+class FetchModeStore:
+    """Remembers, per domain, whether the static fetch or the Selenium render worked.
+
+    A domain moved to Selenium stays there for ttl seconds only (forever
+    when ttl is 0). After that its pages are fetched statically again, so a
+    mostly static site that had a few short pages or one refused fetch goes
+    back to the plain downloader, or is moved to Selenium again.
+    """
+
+    def __init__(self, path, ttl=0):
+        self.path = path
+        self.ttl = ttl
+        self.modes = {}
+        self.dirty = False
+        self.load()
+
+    @staticmethod
+    def domain(url):
+        return urlparse(url).netloc.lower()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.modes = {
+                    # Files from before the TTL hold bare modes; those are
+                    # treated as set long ago.
+                    domain: entry if isinstance(entry, dict) else {'mode': entry, 'since': 0}
+                    for domain, entry in json.load(f).items()
+                }
+            logging.info(f"Loaded fetch modes for {len(self.modes)} domains from {self.path}")
+        except Exception as e:
+            logging.error(f"Error loading fetch modes: {str(e)}")
+            self.modes = {}
+
+    def get(self, url):
+        entry = self.modes.get(self.domain(url))
+        if entry is None:
+            return None
+        if entry['mode'] == SELENIUM and self.ttl and time.time() - entry['since'] >= self.ttl:
+            return None
+        return entry['mode']
+
+    def set(self, url, mode):
+        domain = self.domain(url)
+        entry = self.modes.get(domain)
+        # Moving to Selenium again restarts the TTL.
+        if entry is None or entry['mode'] != mode or mode == SELENIUM:
+            self.modes[domain] = {'mode': mode, 'since': time.time()}
+            self.dirty = True
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.modes, f, indent=2, sort_keys=True)
+            self.dirty = False
+        except Exception as e:
+            logging.error(f"Error saving fetch modes: {str(e)}")
@@ -0,0 +1,159 @@
+import re
+import unicodedata
+
+ASCII_BYTES = bytes(range(128))
+
+# Up to this many distinct keywords, each one is searched on its own: the
+# regex engine finds a lone literal with a fast substring search, which beats
+# trying an alternation at every position of the text. Longer lists are
+# merged into one trie-shaped alternation.
+SEPARATE_KEYWORDS = 64
+
+
+class KeywordMatcher:
+    """Matches every keyword of a site with compiled regular expressions over the folded content.
+
+    Matching is case-insensitive and, with fold_accents, accent-insensitive
+    ("universite" matches "Université"). With word_boundaries, a keyword only
+    matches as a whole word instead of inside a longer word. Overlapping
+    occurrences all count, and positions are reported as offsets into the
+    original (unfolded) text.
+    """
+
+    def __init__(self, keywords, word_boundaries=True, fold_accents=True):
+        self.word_boundaries = word_boundaries
+        self.fold_accents = fold_accents
+        self.fold_cache = {}
+        self.keywords = []
+        for keyword in keywords:
+            if keyword and keyword.strip() and keyword.strip() not in self.keywords:
+                self.keywords.append(keyword.strip())
+
+        # Keywords that fold to the same text share one pattern.
+        self.patterns = {}
+        for index, keyword in enumerate(self.keywords):
+            pattern = self.fold(keyword)[0]
+            if pattern:
+                self.patterns.setdefault(pattern, []).append(index)
+        if len(self.patterns) <= SEPARATE_KEYWORDS:
+            groups = [[pattern] for pattern in self.patterns]
+        else:
+            groups = [list(self.patterns)]
+        self.regexes = [re.compile(self.trie_pattern(self.trie(group))) for group in groups]
+        # A match is the longest keyword of its group starting there; the
+        # shorter ones it starts with are checked from that match.
+        self.prefixes = {
+            pattern: [shorter for shorter in group if len(shorter) < len(pattern) and pattern.startswith(shorter)]
+            for group in groups for pattern in group
+        }
+
+    @staticmethod
+    def trie(patterns):
+        root = {}
+        for pattern in patterns:
+            node = root
+            for char in pattern:
+                node = node.setdefault(char, {})
+            node[''] = pattern
+        return root
+
+    def trie_pattern(self, node):
+        # The end of a keyword comes last, so longer keywords are tried first.
+        alternatives = [
+            self.boundary(child) if char == '' else re.escape(char) + self.trie_pattern(child)
+            for char, child in sorted(node.items(), key=lambda item: item[0] == '')
+        ]
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return '(?:' + '|'.join(alternatives) + ')'
+
+    def boundary(self, pattern):
+        # Same rule as at_boundary: an edge of the keyword that is not a word
+        # character needs no boundary.
+        if not self.word_boundaries:
+            return ''
+        check = ''
+        if self.is_word_char(pattern[0]):
+            # Looked up from the end of the keyword rather than before it, so
+            # the regex starts with the keyword itself and the engine can
+            # skip ahead to its candidates.
+            check += r'(?<!\w[\s\S]{%d})' % len(pattern)
+        if self.is_word_char(pattern[-1]):
+            check += r'(?!\w)'
+        return check
+
+    def fold_char(self, char):
+        folded = self.fold_cache.get(char)
+        if folded is None:
+            folded = char.casefold()
+            if self.fold_accents:
+                folded = ''.join(
+                    c for c in unicodedata.normalize('NFKD', folded)
+                    if not unicodedata.combining(c)
+                )
+            self.fold_cache[char] = folded
+        return folded
+
+    def fold(self, text):
+        """Return (folded_text, offsets) where offsets maps folded positions back to text.
+
+        offsets is None when every character folds to exactly one, so
+        positions in both texts are the same.
+        """
+        if text.isascii():
+            return text.lower(), None
+        folded = text.casefold()
+        if len(folded) == len(text):
+            if not self.fold_accents:
+                return folded, None
+            # Only the few distinct non-ASCII characters are looked at one by
+            # one; everything else is a whole-text pass in C.
+            accented = folded.encode('utf-8').translate(None, ASCII_BYTES).decode('utf-8')
+            replacements = {char: self.fold_char(char) for char in set(accented)}
+            if all(len(replacement) == 1 for replacement in replacements.values()):
+                for char, replacement in replacements.items():
+                    if replacement != char:
+                        folded = folded.replace(char, replacement)
+                return folded, None
+        # Ligatures and the like ("ß" -> "ss") change the length.
+        table = {char: self.fold_char(char) for char in set(text)}
+        offsets = [position for position, char in enumerate(text) for _ in table[char]]
+        return text.translate(str.maketrans(table)), offsets
+
+    @staticmethod
+    def is_word_char(char):
+        return char.isalnum() or char == '_'
+
+    def at_boundary(self, text, start, end):
+        if start > 0 and self.is_word_char(text[start - 1]) and self.is_word_char(text[start]):
+            return False
+        if end < len(text) and self.is_word_char(text[end]) and self.is_word_char(text[end - 1]):
+            return False
+        return True
+
+    def find(self, text):
+        """Return {keyword: {'count': n, 'positions': [...]}} for every keyword found."""
+        hits = {}
+        if not text or not self.regexes:
+            return hits
+
+        folded, offsets = self.fold(text)
+        for regex in self.regexes:
+            match = regex.search(folded)
+            while match is not None:
+                start = match.start()
+                pattern = match.group()
+                found = [pattern] + [
+                    prefix for prefix in self.prefixes[pattern]
+                    if not self.word_boundaries or self.at_boundary(folded, start, start + len(prefix))
+                ]
+                position = offsets[start] if offsets else start
+                for matched in found:
+                    for index in self.patterns[matched]:
+                        hit = hits.setdefault(self.keywords[index], {'count': 0, 'positions': []})
+                        hit['count'] += 1
+                        hit['positions'].append(position)
+                # Search again from the next character, so overlapping
+                # occurrences count too.
+                match = regex.search(folded, start + 1)
+        return hits
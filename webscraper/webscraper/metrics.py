@@ -0,0 +1,152 @@
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import urlparse
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+from twisted.web import resource, server
+
+# Upper bounds, in milliseconds, of the latency histogram buckets.
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2000, 5000, 10000, 30000]
+
+
+def bucket_label(value_ms):
+    for bound in LATENCY_BUCKETS_MS:
+        if value_ms <= bound:
+            return f'le_{bound}ms'
+    return 'le_inf'
+
+
+def domain_of(url):
+    return urlparse(url).netloc.lower() or 'unknown'
+
+
+def record_latency(stats, prefix, seconds):
+    """Add one observation to the histogram stored under prefix in the crawl stats."""
+    value_ms = seconds * 1000
+    stats.inc_value(f'{prefix}/count')
+    stats.inc_value(f'{prefix}/total_ms', round(value_ms, 3))
+    stats.max_value(f'{prefix}/max_ms', round(value_ms, 3))
+    stats.inc_value(f'{prefix}/{bucket_label(value_ms)}')
+
+
+def record_stage(stats, stage, domain, seconds):
+    """Record one stage timing both across all domains and for the page's domain."""
+    record_latency(stats, f'stage_time/{stage}', seconds)
+    record_latency(stats, f'stage_time/{stage}/{domain}', seconds)
+
+
+class StageTimer:
+    """Accumulates wall time per stage, in seconds, for one page.
+
+    Plain data in and out, so it can be filled in an extraction worker and
+    its totals shipped back to the spider.
+    """
+
+    def __init__(self):
+        self.totals = {}
+
+    def add(self, stage, seconds):
+        self.totals[stage] = self.totals.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def wrap(self, name, func):
+        """Return func timed under name, for helpers called many times per page."""
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - started)
+        return timed
+
+
+class MetricsExport:
+    """Extension exposing the crawl's timing metrics while it runs.
+
+    Writes the stats to METRICS_DUMP_FILE every METRICS_DUMP_INTERVAL seconds
+    and, when METRICS_PORT is set, serves them as JSON on
+    http://127.0.0.1:<port>/metrics. Only stats under METRICS_PREFIXES are
+    exported, so per-domain histograms can be scraped without the rest.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.path = settings.get('METRICS_DUMP_FILE')
+        self.port = settings.getint('METRICS_PORT')
+        if not self.path and not self.port:
+            raise NotConfigured
+        self.interval = settings.getfloat('METRICS_DUMP_INTERVAL', 30.0)
+        self.prefixes = tuple(settings.getlist('METRICS_PREFIXES', ['stage_time/', 'render_time/']))
+        self.stats = crawler.stats
+        self.dump_loop = None
+        self.listener = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def snapshot(self):
+        return {
+            'time': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'metrics': {
+                key: value for key, value in sorted(self.stats.get_stats().items())
+                if key.startswith(self.prefixes)
+            },
+        }
+
+    def dump(self):
+        try:
+            # Write then rename, so readers never see a half-written file.
+            temp_path = f'{self.path}.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.snapshot(), f, indent=2)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            logging.error(f"Error writing metrics to {self.path}: {str(e)}")
+
+    def spider_opened(self, spider):
+        if self.path:
+            self.dump_loop = task.LoopingCall(self.dump)
+            self.dump_loop.start(self.interval, now=False)
+        if self.port:
+            from twisted.internet import reactor
+            root = resource.Resource()
+            root.putChild(b'metrics', MetricsResource(self))
+            self.listener = reactor.listenTCP(self.port, server.Site(root), interface='127.0.0.1')
+            spider.logger.info(f"Serving metrics on http://127.0.0.1:{self.port}/metrics")
+
+    def spider_closed(self, spider):
+        if self.dump_loop is not None and self.dump_loop.running:
+            self.dump_loop.stop()
+        if self.path:
+            self.dump()
+        if self.listener is not None:
+            return self.listener.stopListening()
+
+
+class MetricsResource(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, export):
+        super().__init__()
+        self.export = export
+
+    def render_GET(self, request):
+        request.setHeader(b'Content-Type', b'application/json')
+        return json.dumps(self.export.snapshot()).encode('utf-8')
@@ -3,11 +3,45 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import dbm
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from importlib import import_module
+from urllib.parse import quote, urlparse
+from urllib.request import getproxies
+
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import HtmlResponse, Request
+from scrapy_selenium import SeleniumRequest
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from twisted.internet import defer, threads
+from twisted.python.threadpool import ThreadPool
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
 
+from webscraper import extractors
+from webscraper.archive import ArchiveWriter
+from webscraper.crawl_state import page_processed
+from webscraper.metrics import domain_of, record_latency, record_stage
+
+# URL patterns blocked for each SELENIUM_BLOCK_RESOURCES type.
+RESOURCE_PATTERNS = {
+    'image': ['*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico', '*.avif'],
+    'font': ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot'],
+    'media': ['*.mp4', '*.webm', '*.m3u8', '*.mp3', '*.ogg'],
+    'stylesheet': ['*.css'],
+}
+
 
 class WebscraperSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
@@ -101,3 +135,688 @@ class WebscraperDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+def download_slot(crawler, request, spider):
+    """Return (key, slot) of the downloader slot for the request's host.
+
+    Keyed exactly as the downloader does it, and created when missing, so
+    renders, which never reach the downloader, share the slot of the
+    static fetches of their host.
+    """
+    return crawler.engine.downloader._get_slot(request, spider)
+
+
+class RenderWait:
+    # Wait condition that ends a render as soon as the content selector is
+    # in the DOM, or once no new resource has started loading for idle_ms.
+
+    def __init__(self, selector, idle_ms):
+        self.selector = selector
+        self.idle = idle_ms / 1000
+        self.resource_count = -1
+        self.last_change = time.monotonic()
+        self.reason = 'timeout'
+
+    def __call__(self, driver):
+        if self.selector and driver.find_elements(By.CSS_SELECTOR, self.selector):
+            self.reason = 'selector'
+            return True
+        count, ready_state = driver.execute_script(
+            "return [performance.getEntriesByType('resource').length, document.readyState]"
+        )
+        now = time.monotonic()
+        if count != self.resource_count:
+            self.resource_count = count
+            self.last_change = now
+            return False
+        if ready_state != 'loading' and now - self.last_change >= self.idle:
+            self.reason = 'network_idle'
+            return True
+        return False
+
+
+class SeleniumPoolMiddleware:
+    # Renders SeleniumRequest objects on a pool of pre-warmed WebDriver
+    # sessions. Each render runs in a dedicated thread pool so the reactor
+    # keeps serving other downloads while browsers are busy.
+    #
+    # Renders are returned from process_request and never go through the
+    # downloader, so they are held back here by the downloader slot of their
+    # host instead: at most slot.concurrency renders per host at a time, and
+    # slot.delay between any two downloads of the host, renders or not.
+
+    def __init__(self, driver_name, driver_executable_path, browser_executable_path,
+                 driver_arguments, pool_size, max_pages, max_retries,
+                 checkout_timeout=300, block_resources=None, block_hosts=None, smart_wait=False,
+                 idle_ms=500, wait_selector=None, proxy=None):
+        self.driver_name = driver_name
+        self.driver_executable_path = driver_executable_path
+        self.browser_executable_path = browser_executable_path
+        self.driver_arguments = driver_arguments or []
+        self.pool_size = max(1, pool_size)
+        self.max_pages = max_pages
+        self.max_retries = max_retries
+        self.checkout_timeout = checkout_timeout
+        self.drivers = queue.Queue()
+        self.page_counts = {}
+        self.all_drivers = set()
+        # Slots whose browser could not be (re)started; the next checkout
+        # tries again so the pool never shrinks for good.
+        self.empty_slots = 0
+        self.lock = threading.Lock()
+        self.threadpool = ThreadPool(minthreads=1, maxthreads=self.pool_size, name='selenium-pool')
+        self.crawler = None
+        self.stats = None
+        # Downloader slot key -> renders running and waiting for that host.
+        self.render_slots = {}
+        self.block_resources = block_resources or []
+        self.block_hosts = block_hosts or []
+        self.proxy = proxy
+        self.smart_wait = smart_wait
+        self.idle_ms = idle_ms
+        self.wait_selector = wait_selector
+        # Timings are recorded per profile so renders with and without the
+        # blocking/smart-wait profile can be compared side by side.
+        self.profile = 'fast' if (self.block_resources or self.block_hosts or smart_wait) else 'default'
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        driver_name = settings.get('SELENIUM_DRIVER_NAME')
+        if not driver_name:
+            raise NotConfigured('SELENIUM_DRIVER_NAME must be set')
+
+        s = cls(
+            driver_name=driver_name,
+            driver_executable_path=settings.get('SELENIUM_DRIVER_EXECUTABLE_PATH'),
+            browser_executable_path=settings.get('SELENIUM_BROWSER_EXECUTABLE_PATH'),
+            driver_arguments=settings.getlist('SELENIUM_DRIVER_ARGUMENTS'),
+            pool_size=settings.getint('SELENIUM_POOL_SIZE', 4),
+            max_pages=settings.getint('SELENIUM_POOL_MAX_PAGES', 50),
+            max_retries=settings.getint('SELENIUM_POOL_MAX_RETRIES', 2),
+            checkout_timeout=settings.getfloat('SELENIUM_POOL_CHECKOUT_TIMEOUT', 300),
+            block_resources=settings.getlist('SELENIUM_BLOCK_RESOURCES'),
+            block_hosts=settings.getlist('SELENIUM_BLOCK_HOSTS'),
+            smart_wait=settings.getbool('SELENIUM_SMART_WAIT'),
+            idle_ms=settings.getint('SELENIUM_NETWORK_IDLE_MS', 500),
+            wait_selector=settings.get('SELENIUM_WAIT_SELECTOR'),
+            proxy=settings.get('SELENIUM_PROXY'),
+        )
+        s.crawler = crawler
+        s.stats = crawler.stats
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def create_driver(self):
+        base_path = f'selenium.webdriver.{self.driver_name}'
+        driver_klass = getattr(import_module(f'{base_path}.webdriver'), 'WebDriver')
+        options_klass = getattr(import_module(f'{base_path}.options'), 'Options')
+        service_klass = getattr(import_module(f'{base_path}.service'), 'Service')
+
+        options = options_klass()
+        if self.browser_executable_path:
+            options.binary_location = self.browser_executable_path
+        for argument in self.driver_arguments:
+            options.add_argument(argument)
+        if self.smart_wait:
+            # Return from driver.get() at DOMContentLoaded; RenderWait decides the rest.
+            options.page_load_strategy = 'eager'
+        self.apply_blocking_preferences(options)
+
+        service = service_klass(executable_path=self.driver_executable_path) \
+            if self.driver_executable_path else service_klass()
+        driver = driver_klass(service=service, options=options)
+        self.apply_blocking_rules(driver)
+
+        with self.lock:
+            self.all_drivers.add(driver)
+            self.page_counts[driver] = 0
+        if self.stats:
+            self.stats.inc_value('selenium_pool/drivers_created')
+        return driver
+
+    def replace_driver(self):
+        # Fills one pool slot; a browser that fails to start leaves the slot
+        # empty instead of losing it along with the render thread's error.
+        try:
+            self.drivers.put(self.create_driver())
+        except Exception as e:
+            logging.error(f"Could not start a WebDriver session: {str(e)}")
+            with self.lock:
+                self.empty_slots += 1
+            if self.stats:
+                self.stats.inc_value('selenium_pool/create_failures')
+
+    def checkout_driver(self):
+        with self.lock:
+            refill = self.empty_slots > 0
+            if refill:
+                self.empty_slots -= 1
+        if refill:
+            self.replace_driver()
+        with self.lock:
+            alive = bool(self.all_drivers)
+        if not alive:
+            raise IgnoreRequest('No WebDriver session could be started')
+        try:
+            return self.drivers.get(timeout=self.checkout_timeout)
+        except queue.Empty:
+            raise IgnoreRequest(f'No WebDriver session freed up within {self.checkout_timeout}s')
+
+    def apply_blocking_preferences(self, options):
+        if self.driver_name == 'firefox':
+            if 'image' in self.block_resources:
+                options.set_preference('permissions.default.image', 2)
+            if 'font' in self.block_resources:
+                options.set_preference('gfx.downloadable_fonts.enabled', False)
+            if 'media' in self.block_resources:
+                options.set_preference('media.autoplay.default', 5)
+                options.set_preference('media.mediasource.enabled', False)
+            if self.block_hosts:
+                # Firefox has no request interception over WebDriver. A proxy
+                # auto-config script sends the blocked hosts and all their
+                # subdomains to a closed local port, so their requests fail
+                # at once. It replaces the browser's proxy settings, so every
+                # other request goes to the proxy the crawl would use.
+                options.set_preference('network.proxy.type', 2)
+                options.set_preference('network.proxy.autoconfig_url', self.block_hosts_pac())
+                options.set_preference('network.proxy.failover_direct', False)
+        elif self.driver_name == 'chrome' and 'image' in self.block_resources:
+            options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+
+    def upstream_proxies(self):
+        """Return ({'http': ..., 'https': ...}, bypassed hosts) as PAC results.
+
+        SELENIUM_PROXY applies to both schemes; without it the proxies come
+        from the environment (http_proxy, https_proxy, no_proxy) or, on
+        Windows and macOS, the system settings.
+        """
+        proxies = {'http': self.proxy, 'https': self.proxy} if self.proxy else getproxies()
+        results = {}
+        for scheme in ('http', 'https'):
+            proxy = proxies.get(scheme)
+            if not proxy:
+                results[scheme] = 'DIRECT'
+                continue
+            parsed = urlparse(proxy if '://' in proxy else f'http://{proxy}')
+            kind = {'https': 'HTTPS', 'socks5': 'SOCKS5', 'socks5h': 'SOCKS5', 'socks4': 'SOCKS', 'socks': 'SOCKS'}.get(parsed.scheme, 'PROXY')
+            results[scheme] = f"{kind} {parsed.hostname}:{parsed.port or (443 if parsed.scheme == 'https' else 80)}"
+        bypass = [] if self.proxy else [
+            host.strip().lstrip('*').lstrip('.') or '*' for host in proxies.get('no', '').split(',') if host.strip()
+        ]
+        return results, bypass
+
+    def block_hosts_pac(self):
+        proxies, bypass = self.upstream_proxies()
+        pac = (
+            'function FindProxyForURL(url, host) {'
+            f' var blocked = {json.dumps(self.block_hosts)};'
+            ' for (var i = 0; i < blocked.length; i++) {'
+            ' if (host == blocked[i] || dnsDomainIs(host, "." + blocked[i])) return "PROXY 127.0.0.1:9";'
+            ' }'
+            f' var bypass = {json.dumps(bypass)};'
+            ' for (var j = 0; j < bypass.length; j++) {'
+            ' if (bypass[j] == "*" || host == bypass[j] || dnsDomainIs(host, "." + bypass[j])) return "DIRECT";'
+            ' }'
+            f' if (url.substring(0, 6) == "https:") return {json.dumps(proxies["https"])};'
+            f' return {json.dumps(proxies["http"])};'
+            ' }'
+        )
+        return 'data:application/x-ns-proxy-autoconfig,' + quote(pac)
+
+    def apply_blocking_rules(self, driver):
+        if not hasattr(driver, 'execute_cdp_cmd'):
+            return
+        patterns = [pattern for resource in self.block_resources for pattern in RESOURCE_PATTERNS.get(resource, [])]
+        patterns += [f'*://{host}/*' for host in self.block_hosts]
+        patterns += [f'*://*.{host}/*' for host in self.block_hosts]
+        if patterns:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+
+    def wait_condition(self, request):
+        if not self.smart_wait:
+            return request.wait_until or (
+                lambda driver: driver.execute_script('return document.readyState') == 'complete'
+            )
+        return RenderWait(request.meta.get('wait_selector', self.wait_selector), self.idle_ms)
+
+    def discard_driver(self, driver):
+        with self.lock:
+            self.all_drivers.discard(driver)
+            self.page_counts.pop(driver, None)
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.warning(f"Error closing WebDriver session: {str(e)}")
+
+    def checkin_driver(self, driver):
+        with self.lock:
+            self.page_counts[driver] = self.page_counts.get(driver, 0) + 1
+            recycle = self.max_pages and self.page_counts[driver] >= self.max_pages
+        if recycle:
+            self.discard_driver(driver)
+            if self.stats:
+                self.stats.inc_value('selenium_pool/drivers_recycled')
+            self.replace_driver()
+        else:
+            self.drivers.put(driver)
+
+    def render(self, request):
+        # Runs in a pool thread: blocking WebDriver calls are fine here.
+        attempt = 0
+        while True:
+            driver = self.checkout_driver()
+            started = time.monotonic()
+            wait = self.wait_condition(request)
+            try:
+                try:
+                    driver.get(request.url)
+
+                    for cookie_name, cookie_value in request.cookies.items():
+                        driver.add_cookie({'name': cookie_name, 'value': cookie_value})
+
+                    WebDriverWait(driver, request.wait_time or 30, poll_frequency=0.1).until(wait)
+
+                    if request.screenshot:
+                        request.meta['screenshot'] = driver.get_screenshot_as_png()
+
+                    if request.script:
+                        driver.execute_script(request.script)
+                except TimeoutException:
+                    # The page is still usable, it simply never reached the wait condition.
+                    pass
+                body = driver.page_source
+                url = driver.current_url
+            except WebDriverException as e:
+                logging.error(f"WebDriver session crashed on {request.url}: {str(e)}")
+                self.discard_driver(driver)
+                if self.stats:
+                    self.stats.inc_value('selenium_pool/crashes')
+                self.replace_driver()
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                continue
+            except BaseException:
+                # Anything else (geckodriver gone, connection refused, ...)
+                # leaves the session in an unknown state: it is never put
+                # back, but its pool slot is refilled so the pool keeps its size.
+                logging.exception(f"Render of {request.url} failed, replacing its browser session")
+                self.discard_driver(driver)
+                if self.stats:
+                    self.stats.inc_value('selenium_pool/render_errors')
+                self.replace_driver()
+                raise
+
+            request.meta['download_latency'] = time.monotonic() - started
+            request.meta['render_wait_reason'] = getattr(wait, 'reason', 'ready_state')
+            self.checkin_driver(driver)
+            if self.stats:
+                self.stats.inc_value('selenium_pool/pages_rendered')
+            return HtmlResponse(url, body=body.encode('utf-8'), encoding='utf-8', request=request)
+
+    def process_request(self, request, spider):
+        if not isinstance(request, SeleniumRequest):
+            return None
+        from twisted.internet import reactor
+        key, slot = download_slot(self.crawler, request, spider)
+        d = self.acquire_render_slot(key, slot)
+        d.addCallback(lambda _: threads.deferToThreadPool(reactor, self.threadpool, self.render, request))
+        d.addBoth(self.release_render_slot, key, slot)
+        d.addCallback(self.record_render, request)
+        return d
+
+    def acquire_render_slot(self, key, slot):
+        render_slot = self.render_slots.setdefault(key, {'active': 0, 'waiting': deque(), 'latercall': None})
+        d = defer.Deferred()
+        render_slot['waiting'].append(d)
+        self.process_render_slot(key, slot)
+        return d
+
+    def process_render_slot(self, key, slot):
+        # Same rules as the downloader's own queue processing.
+        from twisted.internet import reactor
+        render_slot = self.render_slots.get(key)
+        if render_slot is None or (render_slot['latercall'] and render_slot['latercall'].active()):
+            return
+        while render_slot['waiting'] and render_slot['active'] < slot.concurrency:
+            penalty = slot.download_delay() - time.time() + slot.lastseen
+            if penalty > 0:
+                render_slot['latercall'] = reactor.callLater(penalty, self.process_render_slot, key, slot)
+                return
+            slot.lastseen = time.time()
+            render_slot['active'] += 1
+            render_slot['waiting'].popleft().callback(None)
+
+    def release_render_slot(self, result, key, slot):
+        render_slot = self.render_slots[key]
+        render_slot['active'] -= 1
+        if not render_slot['active'] and not render_slot['waiting']:
+            del self.render_slots[key]
+        else:
+            self.process_render_slot(key, slot)
+        return result
+
+    def record_render(self, response, request):
+        # Back on the reactor thread, so stats can be updated safely.
+        if self.stats:
+            domain = domain_of(request.url)
+            latency = request.meta.get('download_latency', 0)
+            record_latency(self.stats, f'render_time/{self.profile}/{domain}', latency)
+            record_stage(self.stats, 'render', domain, latency)
+            self.stats.inc_value(f"render_wait/{request.meta.get('render_wait_reason')}")
+        return response
+
+    def spider_opened(self, spider):
+        from twisted.internet import reactor
+        self.threadpool.start()
+        spider.logger.info(f"Starting {self.pool_size} WebDriver sessions")
+        return defer.DeferredList([
+            threads.deferToThreadPool(reactor, self.threadpool, self.replace_driver)
+            for _ in range(self.pool_size)
+        ])
+
+    def spider_closed(self, spider):
+        for render_slot in self.render_slots.values():
+            if render_slot['latercall'] and render_slot['latercall'].active():
+                render_slot['latercall'].cancel()
+        with self.lock:
+            drivers = list(self.all_drivers)
+        for driver in drivers:
+            self.discard_driver(driver)
+        self.threadpool.stop()
+
+
+class DomainThrottleMiddleware:
+    # Adapts the delay of every per-domain download slot from the latency
+    # and error rate observed on that domain, so each host is throttled
+    # independently instead of behind one global delay. Renders count too:
+    # they share the slot of their host (see SeleniumPoolMiddleware).
+    #
+    # Concurrency is left at CONCURRENT_REQUESTS_PER_DOMAIN: with a delay
+    # above zero the downloader starts one request per delay whatever the
+    # slot's concurrency, and the delay never drops below
+    # DOMAIN_THROTTLE_MIN_DELAY.
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('DOMAIN_THROTTLE_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.min_delay = settings.getfloat('DOMAIN_THROTTLE_MIN_DELAY', 0.25)
+        self.max_delay = settings.getfloat('DOMAIN_THROTTLE_MAX_DELAY', 60.0)
+        self.target_latency = settings.getfloat('DOMAIN_THROTTLE_TARGET_LATENCY', 2.0)
+        self.error_codes = set(int(code) for code in settings.getlist('DOMAIN_THROTTLE_ERROR_CODES', [429, 500, 502, 503, 504]))
+        self.domains = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def get_slot(self, request, spider):
+        # meta['download_slot'] is only set once a request reaches the
+        # downloader, which renders never do.
+        return download_slot(self.crawler, request, spider)
+
+    def domain_stats(self, key):
+        if key not in self.domains:
+            self.domains[key] = {'responses': 0, 'errors': 0, 'latency': 0.0}
+        return self.domains[key]
+
+    def process_response(self, request, response, spider):
+        key, slot = self.get_slot(request, spider)
+        stats = self.domain_stats(key)
+        stats['responses'] += 1
+
+        if response.status in self.error_codes:
+            stats['errors'] += 1
+            retry_after = response.headers.get('Retry-After')
+            self.back_off(key, slot, retry_after)
+            return response
+
+        latency = request.meta.get('download_latency')
+        if latency is None:
+            return response
+        # Exponential moving average keeps one slow page from swinging the slot.
+        stats['latency'] = latency if stats['responses'] == 1 else 0.7 * stats['latency'] + 0.3 * latency
+
+        if stats['latency'] <= self.target_latency:
+            slot.delay = max(self.min_delay, slot.delay * 0.75)
+        else:
+            slot.delay = min(self.max_delay, max(slot.delay, stats['latency']))
+
+        self.record(key, slot)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        # Requests dropped on purpose (e.g. unchanged pages) say nothing
+        # about the host.
+        if isinstance(exception, IgnoreRequest):
+            return None
+        key, slot = self.get_slot(request, spider)
+        self.domain_stats(key)['errors'] += 1
+        self.back_off(key, slot)
+        return None
+
+    def back_off(self, key, slot, retry_after=None):
+        delay = max(slot.delay * 2, self.min_delay)
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        slot.delay = min(self.max_delay, delay)
+        self.record(key, slot)
+
+    def record(self, key, slot):
+        stats = self.domains[key]
+        prefix = f'domain_throttle/{key}'
+        self.stats.set_value(f'{prefix}/delay', round(slot.delay, 3))
+        self.stats.set_value(f'{prefix}/responses', stats['responses'])
+        self.stats.set_value(f'{prefix}/errors', stats['errors'])
+        self.stats.set_value(f'{prefix}/avg_latency', round(stats['latency'], 3))
+
+    def spider_closed(self, spider):
+        spider.logger.info(f"Domain throttle tracked {len(self.domains)} domains")
+
+
+class ConditionalCacheMiddleware:
+    # Remembers ETag, Last-Modified and a body hash for every URL in a local
+    # dbm file. Recrawls send conditional requests and drop the request as
+    # soon as the page is known to be unchanged, before rendering,
+    # extraction or export.
+    #
+    # A rendered page has no headers, and its body changes with every ad or
+    # timestamp, so a SeleniumRequest is first probed with a plain
+    # conditional GET. The render is dropped when the static page answers
+    # 304 or hashes the same as when it was last rendered.
+    #
+    # An entry also records the site's keywords and the extraction settings
+    # it was processed with; a page processed differently is fetched again.
+    # Entries are only written once the spider has parsed and extracted the
+    # page, so a page that failed is not mistaken for an unchanged one.
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('CONDITIONAL_CACHE_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.path = settings.get('CONDITIONAL_CACHE_DIR', '.conditional_cache')
+        self.options = extractors.extraction_options(settings, settings.getint('HYBRID_MIN_CONTENT_LENGTH'))
+        self.db = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(s.page_processed, signal=page_processed)
+        return s
+
+    def spider_opened(self, spider):
+        os.makedirs(self.path, exist_ok=True)
+        self.db = dbm.open(os.path.join(self.path, f'{spider.name}.db'), 'c')
+        spider.logger.info(f"Conditional cache opened with {len(self.db)} entries")
+
+    def spider_closed(self, spider):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    @staticmethod
+    def cache_key(request):
+        # A render's entry holds what its static probe saw when the page was
+        # last rendered, apart from the validators of plain fetches.
+        prefix = 'render:' if isinstance(request, SeleniumRequest) else ''
+        return f'{prefix}{request.url}'.encode('utf-8')
+
+    def context(self, request):
+        processing = {'keywords': request.meta.get('keywords'), 'options': self.options}
+        return hashlib.sha1(json.dumps(processing, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get_entry(self, request):
+        value = self.db.get(self.cache_key(request))
+        if not value:
+            return None
+        entry = json.loads(value)
+        # Processed with other keywords or extraction settings last time.
+        return entry if entry.get('context') == self.context(request) else None
+
+    def store_after_parse(self, request, entry):
+        request.meta['conditional_cache_entry'] = {**entry, 'context': self.context(request)}
+
+    def page_processed(self, response):
+        entry = response.meta.pop('conditional_cache_entry', None)
+        if entry is not None and self.db is not None:
+            self.db[self.cache_key(response.request)] = json.dumps(entry)
+
+    @staticmethod
+    def validators(response):
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        return {
+            'etag': etag.decode('latin-1') if etag else None,
+            'last_modified': last_modified.decode('latin-1') if last_modified else None,
+            'hash': hashlib.sha1(response.body).hexdigest(),
+        }
+
+    def process_request(self, request, spider):
+        if request.meta.get('conditional_cache_skip'):
+            return None
+        entry = self.get_entry(request)
+        if entry is None and self.cache_key(request) in self.db:
+            self.stats.inc_value('conditional_cache/context_changed')
+        if isinstance(request, SeleniumRequest):
+            return self.probe(request, entry)
+        if not entry:
+            return None
+        if entry.get('etag'):
+            request.headers.setdefault('If-None-Match', entry['etag'])
+        if entry.get('last_modified'):
+            request.headers.setdefault('If-Modified-Since', entry['last_modified'])
+        self.stats.inc_value('conditional_cache/revalidation')
+        return None
+
+    def probe(self, request, entry):
+        headers = dict(request.headers.to_unicode_dict())
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        # Downloaded straight through the engine: the probe never reaches
+        # the scheduler or a spider callback.
+        probe = Request(request.url, headers=headers, dont_filter=True, meta={'conditional_cache_skip': True})
+        self.stats.inc_value('conditional_cache/render_probe')
+        d = self.crawler.engine.download(probe)
+        # A failed probe proves nothing: render as usual.
+        d.addCallbacks(self.probe_done, lambda failure: None, callbackArgs=(request, entry))
+        return d
+
+    def probe_done(self, response, request, entry):
+        if entry and (response.status == 304 or (
+                response.status == 200 and hashlib.sha1(response.body).hexdigest() == entry.get('hash'))):
+            self.stats.inc_value('conditional_cache/render_skipped')
+            self.stats.inc_value('conditional_cache/bytes_saved', entry.get('size', 0))
+            raise IgnoreRequest(f"Not modified, render skipped: {request.url}")
+        if response.status == 200:
+            # Only stored once the render succeeds, so a failed render is
+            # not mistaken for an unchanged page next time.
+            request.meta['conditional_probe'] = self.validators(response)
+        return None
+
+    def process_response(self, request, response, spider):
+        if request.meta.get('conditional_cache_skip'):
+            return response
+
+        if isinstance(request, SeleniumRequest):
+            probed = request.meta.get('conditional_probe')
+            if probed and response.status == 200:
+                self.stats.inc_value('conditional_cache/miss')
+                self.store_after_parse(request, {**probed, 'size': len(response.body)})
+            return response
+
+        entry = self.get_entry(request)
+        if response.status == 304 and entry:
+            self.stats.inc_value('conditional_cache/hit')
+            self.stats.inc_value('conditional_cache/bytes_saved', entry.get('size', 0))
+            raise IgnoreRequest(f"Not modified: {request.url}")
+
+        if response.status != 200:
+            return response
+
+        validators = self.validators(response)
+        if entry and entry.get('hash') == validators['hash']:
+            self.stats.inc_value('conditional_cache/unchanged_body')
+            raise IgnoreRequest(f"Body unchanged: {request.url}")
+
+        self.stats.inc_value('conditional_cache/miss')
+        self.store_after_parse(request, {**validators, 'size': len(response.body)})
+        return response
+
+
+class SnapshotArchiveMiddleware:
+    # Stores every fetched or rendered HTML body in a compressed, append-only
+    # archive so extraction changes can be replayed offline with
+    # `scrapy reextract` instead of crawling the sites again.
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('SNAPSHOT_ARCHIVE_ENABLED'):
+            raise NotConfigured
+        self.stats = crawler.stats
+        self.directory = settings.get('SNAPSHOT_ARCHIVE_DIR', 'archive')
+        self.writer = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def spider_opened(self, spider):
+        self.writer = ArchiveWriter(self.directory, spider.name)
+
+    def spider_closed(self, spider):
+        if self.writer is not None:
+            self.writer.close()
+
+    def process_response(self, request, response, spider):
+        if response.status == 200 and isinstance(response, HtmlResponse) and 'keywords' in request.meta:
+            self.writer.write(
+                response.url,
+                response.body,
+                response.encoding,
+                request.meta['keywords'],
+                request.meta.get('fetch_mode'),
+            )
+            self.stats.inc_value('snapshot_archive/records')
+            self.stats.inc_value('snapshot_archive/bytes', len(response.body))
+        return response
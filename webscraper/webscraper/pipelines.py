@@ -4,10 +4,334 @@
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
 
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from urllib.parse import urlparse
+
+import httpx
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.defer import deferred_from_coro
+from twisted.internet import defer, task
+
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
 
+from webscraper.crawl_state import items_delivered
+from webscraper.exporters import PAGE_FIELDS
+from webscraper.metrics import record_latency, record_stage
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
 
 class WebscraperPipeline:
     def process_item(self, item, spider):
         return item
+
+
+class BackendBatchPipeline:
+    """Buffers items and ships them to the backend in batches.
+
+    Items are flushed when BACKEND_BATCH_SIZE is reached, every
+    BACKEND_FLUSH_INTERVAL seconds and when the spider closes, in requests of
+    at most BACKEND_BATCH_SIZE items. Network errors, timeouts, throttling
+    and server errors are retried with exponential backoff; whatever still
+    fails is spilled to BACKEND_SPILL_FILE and replayed on the next run.
+    Other 4xx responses would fail the same way again, so those items are
+    counted and dropped. Once a batch is settled either way, items_delivered
+    is sent with its items.
+    """
+
+    # Items are only delivered when their batch is sent, after item_scraped.
+    acks_delivery = True
+
+    results_path = '/scraping/results'
+    batch_results_path = '/scraping/results/batch'
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.base_url = settings.get('BACKEND_URL')
+        if not self.base_url:
+            raise NotConfigured('BACKEND_URL is not set')
+        self.token = settings.get('BACKEND_TOKEN')
+        self.batch_size = settings.getint('BACKEND_BATCH_SIZE', 100)
+        self.flush_interval = settings.getfloat('BACKEND_FLUSH_INTERVAL', 10.0)
+        self.max_retries = settings.getint('BACKEND_MAX_RETRIES', 3)
+        self.retry_backoff = settings.getfloat('BACKEND_RETRY_BACKOFF', 1.0)
+        self.max_connections = settings.getint('BACKEND_MAX_CONNECTIONS', 10)
+        self.spill_path = settings.get('BACKEND_SPILL_FILE', 'pending_results.jsonl')
+        self.batch_endpoint = settings.getbool('BACKEND_BATCH_ENDPOINT', True)
+        self.stats = crawler.stats
+        self.signals = crawler.signals
+        self.buffer = []
+        self.items = []
+        self.client = None
+        self.flush_loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def open_spider(self, spider):
+        headers = {'Authorization': f'Bearer {self.token}'} if self.token else {}
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=headers,
+            timeout=30.0,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+            ),
+        )
+        self.buffer.extend(self.load_spill())
+        self.flush_loop = task.LoopingCall(self.flush)
+        self.flush_loop.start(self.flush_interval, now=False)
+
+    def close_spider(self, spider):
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+        return deferred_from_coro(self.close())
+
+    def process_item(self, item, spider):
+        self.buffer.append(self.to_payload(item))
+        self.items.append(item)
+        if len(self.buffer) >= self.batch_size:
+            d = self.flush()
+            d.addCallback(lambda _: item)
+            return d
+        return item
+
+    @staticmethod
+    def to_payload(item):
+        adapter = ItemAdapter(item)
+        return {
+            'website_url': [adapter.get('URL', '')],
+            'keywords': list(adapter.get('Mots_clés') or []),
+            'occurrences': list(adapter.get('Occurrences') or []),
+            'results': adapter.get('Contenu', ''),
+            'title': adapter.get('Titre', ''),
+            'date': adapter.get('Date', ''),
+            'authors': adapter.get('Auteurs', ''),
+        }
+
+    def flush(self):
+        if not self.buffer:
+            return defer.succeed(None)
+        batch, self.buffer = self.buffer, []
+        items, self.items = self.items, []
+        return deferred_from_coro(self.deliver(batch, items))
+
+    async def close(self):
+        if self.buffer:
+            batch, self.buffer = self.buffer, []
+            items, self.items = self.items, []
+            await self.deliver(batch, items)
+        await self.client.aclose()
+
+    async def deliver(self, batch, items):
+        await self.send(batch)
+        # Each item is now in the backend, spilled for the next run or
+        # rejected for good; none of them needs emitting again.
+        if items:
+            self.signals.send_catch_log(items_delivered, items=items)
+
+    @staticmethod
+    def retryable(status):
+        return status in (408, 429) or status >= 500
+
+    async def post(self, batch):
+        """Send a batch and return (payloads worth sending again, number of payloads rejected)."""
+        if self.batch_endpoint:
+            try:
+                response = await self.client.post(self.batch_results_path, json=batch)
+                if response.status_code >= 400 and not self.retryable(response.status_code):
+                    logging.error(f"Backend rejected a batch of {len(batch)} results with HTTP "
+                                  f"{response.status_code}, dropping it: {response.text[:200]}")
+                    return [], len(batch)
+                response.raise_for_status()
+                report = response.json()
+            except (httpx.HTTPError, ValueError) as e:
+                logging.warning(f"Batch of {len(batch)} results failed: {str(e)}")
+                return batch, 0
+            # Only items the backend failed to write are worth resending;
+            # invalid ones would be rejected again.
+            invalid = [entry for entry in report.get('items', []) if entry.get('status') == 'invalid']
+            if invalid:
+                self.stats.inc_value('backend/items_invalid', len(invalid))
+                logging.warning(f"Backend rejected {len(invalid)} invalid results: {invalid[0].get('error')}")
+            return [batch[entry['index']] for entry in report.get('items', []) if entry.get('status') == 'failed'], 0
+
+        responses = await asyncio.gather(
+            *[self.client.post(self.results_path, json=payload) for payload in batch],
+            return_exceptions=True,
+        )
+        pending = []
+        rejected = 0
+        for payload, response in zip(batch, responses):
+            if isinstance(response, Exception) or self.retryable(response.status_code):
+                pending.append(payload)
+            elif response.status_code >= 400:
+                rejected += 1
+                if rejected == 1:
+                    logging.error(f"Backend rejected a result with HTTP {response.status_code}, "
+                                  f"dropping it: {response.text[:200]}")
+        return pending, rejected
+
+    async def send(self, batch):
+        # Replayed spills can hold far more than one batch, and the backend
+        # caps the size of a batch request.
+        for start in range(0, len(batch), self.batch_size):
+            await self.send_chunk(batch[start:start + self.batch_size])
+
+    async def send_chunk(self, batch):
+        started = time.perf_counter()
+        pending = batch
+        rejected = 0
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+                self.stats.inc_value('backend/retries')
+            pending, dropped = await self.post(pending)
+            rejected += dropped
+            if not pending:
+                break
+
+        self.stats.inc_value('backend/batches_sent')
+        self.stats.inc_value('backend/items_sent', len(batch) - len(pending) - rejected)
+        if rejected:
+            self.stats.inc_value('backend/items_rejected', rejected)
+        record_latency(self.stats, 'stage_time/export_backend', time.perf_counter() - started)
+        if pending:
+            logging.error(f"Backend unreachable, spilling {len(pending)} results to {self.spill_path}")
+            self.spill(pending)
+
+    def spill(self, payloads):
+        with open(self.spill_path, 'a', encoding='utf-8') as f:
+            for payload in payloads:
+                f.write(json.dumps(payload, ensure_ascii=False) + '\n')
+        self.stats.inc_value('backend/items_spilled', len(payloads))
+
+    def load_spill(self):
+        if not os.path.exists(self.spill_path):
+            return []
+        payloads = []
+        with open(self.spill_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    payloads.append(json.loads(line))
+        os.remove(self.spill_path)
+        logging.info(f"Replaying {len(payloads)} spilled results from {self.spill_path}")
+        return payloads
+
+
+class ParquetExportPipeline:
+    """Appends items to a compressed Parquet dataset alongside resultats.csv.
+
+    Files are Hive-partitioned as crawl_date=YYYY-MM-DD/domain=<host>/ and
+    every run adds new part files instead of rewriting earlier ones, so
+    readers can prune partitions and load only the columns they need.
+    Every PARQUET_ROTATE_INTERVAL seconds the open files are completed and
+    later rows go to new ones, so a long-running worker leaves readable
+    files behind instead of one growing file per partition.
+    """
+
+    fields = PAGE_FIELDS
+    # Page items carry the matched keywords and their counts as lists.
+    list_fields = {'Mots_clés': 'string', 'Occurrences': 'int64'}
+    # Stored in the file metadata and bumped whenever the columns change,
+    # together with a new PARQUET_EXPORT_DIR so a dataset scan never mixes
+    # versions (version 1 had one row per keyword with a string Mot_clé).
+    schema_version = 2
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('PARQUET_EXPORT_ENABLED'):
+            raise NotConfigured
+        if pa is None:
+            raise NotConfigured('pyarrow is required for PARQUET_EXPORT_ENABLED')
+        self.root = settings.get('PARQUET_EXPORT_DIR', 'resultats_parquet_v2')
+        self.row_group_size = settings.getint('PARQUET_ROW_GROUP_SIZE', 5000)
+        self.compression = settings.get('PARQUET_COMPRESSION', 'zstd')
+        self.rotate_interval = settings.getfloat('PARQUET_ROTATE_INTERVAL', 300.0)
+        self.stats = crawler.stats
+        self.schema = pa.schema([
+            (field, pa.list_(getattr(pa, self.list_fields[field])()) if field in self.list_fields else pa.string())
+            for field in self.fields
+        ], metadata={'schema_version': str(self.schema_version)})
+        self.run_id = f"{datetime.utcnow().strftime('%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.buffers = {}
+        self.writers = {}
+        self.sequence = 0
+        self.files = 0
+        self.rotate_loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def open_spider(self, spider):
+        if self.rotate_interval > 0:
+            self.rotate_loop = task.LoopingCall(self.rotate)
+            self.rotate_loop.start(self.rotate_interval, now=False)
+
+    @staticmethod
+    def partition(adapter):
+        # hostname drops the port, which is not valid in a Windows path.
+        domain = urlparse(adapter.get('URL', '')).hostname or 'unknown'
+        return datetime.utcnow().strftime('%Y-%m-%d'), domain
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        key = self.partition(adapter)
+        rows = self.buffers.setdefault(key, [])
+        rows.append({
+            field: list(adapter.get(field) or []) if field in self.list_fields else str(adapter.get(field) or '')
+            for field in self.fields
+        })
+        if len(rows) >= self.row_group_size:
+            self.write_row_group(key)
+        return item
+
+    def write_row_group(self, key):
+        rows = self.buffers.pop(key, None)
+        if not rows:
+            return
+        started = time.perf_counter()
+        writer = self.writers.get(key)
+        if writer is None:
+            crawl_date, domain = key
+            directory = os.path.join(self.root, f'crawl_date={crawl_date}', f'domain={domain}')
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'part-{self.run_id}-{self.sequence:04d}.parquet')
+            writer = pq.ParquetWriter(path, self.schema, compression=self.compression)
+            self.writers[key] = writer
+            self.files += 1
+        writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+        self.stats.inc_value('parquet_export/row_groups')
+        self.stats.inc_value('parquet_export/rows', len(rows))
+        record_stage(self.stats, 'export_parquet', key[1], time.perf_counter() - started)
+
+    def rotate(self):
+        # Closing a writer writes the file footer; until then the file
+        # cannot be read.
+        for key in list(self.buffers):
+            self.write_row_group(key)
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+        self.sequence += 1
+
+    def close_spider(self, spider):
+        if self.rotate_loop is not None and self.rotate_loop.running:
+            self.rotate_loop.stop()
+        self.rotate()
+        spider.logger.info(f"Parquet export wrote {self.files} files to {self.root}")
@@ -0,0 +1,81 @@
+import json
+import logging
+import os
+
+FIELDS = ('title', 'authors', 'date', 'content')
+
+# Fields whose profile failing on a page counts towards relearning it. Dates
+# and authors are legitimately missing from many pages of a domain.
+CRITICAL_FIELDS = ('title', 'content')
+
+
+class ProfileStore:
+    """Learns which extraction selectors work for each domain.
+
+    Once a domain has been seen on min_pages pages, the selectors that
+    matched on at least min_share of them become its profile and are tried
+    before (or instead of) the full selector lists. After max_fallbacks
+    consecutive pages where the profile failed, the domain is relearned.
+    """
+
+    def __init__(self, path, min_pages=5, min_share=0.5, max_fallbacks=3):
+        self.path = path
+        self.min_pages = min_pages
+        self.min_share = min_share
+        self.max_fallbacks = max_fallbacks
+        self.domains = {}
+        self.dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.domains = json.load(f)
+                logging.info(f"Loaded extraction profiles for {len(self.domains)} domains from {path}")
+            except Exception as e:
+                logging.error(f"Error loading extraction profiles: {str(e)}")
+
+    def get(self, domain):
+        entry = self.domains.get(domain)
+        if not entry or entry['pages'] < self.min_pages:
+            return None
+        profile = {}
+        for field in FIELDS:
+            counts = entry['hits'].get(field, {})
+            selectors = [
+                css for css, count in sorted(counts.items(), key=lambda pair: pair[1], reverse=True)
+                if count / entry['pages'] >= self.min_share
+            ]
+            if selectors:
+                profile[field] = selectors
+        return profile or None
+
+    def record(self, domain, used):
+        """Update a domain with the selectors that produced output on one page.
+
+        Returns True when the domain's profile was reset.
+        """
+        entry = self.domains.setdefault(domain, {'pages': 0, 'hits': {}, 'fallbacks': 0})
+        entry['pages'] += 1
+        for field in FIELDS:
+            counts = entry['hits'].setdefault(field, {})
+            for css in used.get(field, []):
+                counts[css] = counts.get(css, 0) + 1
+        self.dirty = True
+
+        if any(field in CRITICAL_FIELDS for field in used.get('fallbacks', [])):
+            entry['fallbacks'] += 1
+        else:
+            entry['fallbacks'] = 0
+        if entry['fallbacks'] >= self.max_fallbacks:
+            del self.domains[domain]
+            return True
+        return False
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.domains, f, indent=2, sort_keys=True, ensure_ascii=False)
+            self.dirty = False
+        except Exception as e:
+            logging.error(f"Error saving extraction profiles: {str(e)}")
@@ -7,19 +7,95 @@
 #     https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 #     https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import os
+
 BOT_NAME = 'webscraper'
 SPIDER_MODULES = ['webscraper.spiders']
 NEWSPIDER_MODULE = 'webscraper.spiders'
 ROBOTSTXT_OBEY = True
 FEED_EXPORT_ENCODING = 'utf-8'
 DOWNLOADER_MIDDLEWARES = {
-    'scrapy_selenium.SeleniumMiddleware': 800
+    'webscraper.middlewares.SeleniumPoolMiddleware': 800
 }
 SELENIUM_DRIVER_NAME = 'firefox'
 SELENIUM_DRIVER_EXECUTABLE_PATH = r'C:\Users\celine\webscraper\geckodriver.exe'
 SELENIUM_BROWSER_EXECUTABLE_PATH = r'C:\Program Files\Mozilla Firefox\firefox.exe'
 SELENIUM_DRIVER_ARGUMENTS = ['-headless']
-CONCURRENT_REQUESTS = 1
+# Number of pre-warmed browser sessions, pages rendered before a session is
+# recycled, and how many times a render is retried after a browser crash.
+SELENIUM_POOL_SIZE = 4
+SELENIUM_POOL_MAX_PAGES = 50
+SELENIUM_POOL_MAX_RETRIES = 2
+# Seconds a render waits for a free browser session before it is dropped.
+SELENIUM_POOL_CHECKOUT_TIMEOUT = 300
+# Render profile: skip heavy resources and ad/tracker hosts, and stop waiting
+# as soon as a content selector is present or the network has been idle.
+SELENIUM_BLOCK_RESOURCES = ['image', 'font', 'media']
+SELENIUM_BLOCK_HOSTS = [
+    'doubleclick.net', 'googlesyndication.com', 'googletagmanager.com',
+    'google-analytics.com', 'facebook.net', 'scorecardresearch.com',
+]
+# Proxy for the browser's requests (host:port or a proxy URL). When unset,
+# renders use the http_proxy/https_proxy/no_proxy environment or the system
+# proxy, like the plain downloader.
+SELENIUM_PROXY = None
+SELENIUM_SMART_WAIT = True
+SELENIUM_NETWORK_IDLE_MS = 500
+SELENIUM_WAIT_SELECTOR = 'article, [itemprop="articleBody"], .article-content, .post-content, .entry-content'
+CONCURRENT_REQUESTS = 32
+CONCURRENT_REQUESTS_PER_DOMAIN = 1
+# Above the built-in RetryMiddleware (550): responses and exceptions reach
+# the throttle before a retry is scheduled, so 429/503 still back off.
+DOWNLOADER_MIDDLEWARES['webscraper.middlewares.DomainThrottleMiddleware'] = 555
+# Per-domain adaptive throttling: each domain slot starts at DOWNLOAD_DELAY
+# and moves between these bounds depending on its own latency and errors.
+DOMAIN_THROTTLE_ENABLED = True
+DOMAIN_THROTTLE_MIN_DELAY = 0.25
+DOMAIN_THROTTLE_MAX_DELAY = 60.0
+DOMAIN_THROTTLE_TARGET_LATENCY = 2.0
+# Conditional-GET cache: recrawls revalidate with ETag/Last-Modified and
+# skip pages whose body hash has not changed since the last run.
+# Between the built-in MetaRefreshMiddleware (580) and HttpCompressionMiddleware
+# (590), so bodies are hashed after decompression.
+DOWNLOADER_MIDDLEWARES['webscraper.middlewares.ConditionalCacheMiddleware'] = 585
+CONDITIONAL_CACHE_ENABLED = True
+CONDITIONAL_CACHE_DIR = '.conditional_cache'
+# Ship items to the backend in batches. The pipeline stays disabled until
+# BACKEND_URL is set (e.g. BACKEND_URL=http://localhost:8000).
+ITEM_PIPELINES = {
+    'webscraper.pipelines.BackendBatchPipeline': 300,
+    'webscraper.pipelines.ParquetExportPipeline': 400,
+}
+BACKEND_URL = os.environ.get('BACKEND_URL')
+BACKEND_TOKEN = os.environ.get('BACKEND_TOKEN')
+BACKEND_BATCH_SIZE = 100
+# Post each batch to /scraping/results/batch in one request; False posts
+# items one by one to /scraping/results for older backends.
+BACKEND_BATCH_ENDPOINT = True
+BACKEND_FLUSH_INTERVAL = 10.0
+BACKEND_MAX_RETRIES = 3
+BACKEND_RETRY_BACKOFF = 1.0
+BACKEND_MAX_CONNECTIONS = 10
+BACKEND_SPILL_FILE = 'pending_results.jsonl'
+# Columnar export next to resultats.csv (requires pyarrow), partitioned by
+# crawl date and domain and appended to on every run. The directory changes
+# with the Parquet schema version; resultats_parquet holds version 1.
+PARQUET_EXPORT_ENABLED = True
+PARQUET_EXPORT_DIR = 'resultats_parquet_v2'
+PARQUET_ROW_GROUP_SIZE = 5000
+PARQUET_COMPRESSION = 'zstd'
+# Seconds after which open Parquet files are completed and new ones started.
+PARQUET_ROTATE_INTERVAL = 300.0
+# Raw page archive for offline re-extraction (`scrapy reextract archive/`).
+DOWNLOADER_MIDDLEWARES['webscraper.middlewares.SnapshotArchiveMiddleware'] = 570
+SNAPSHOT_ARCHIVE_ENABLED = False
+SNAPSHOT_ARCHIVE_DIR = 'archive'
+COMMANDS_MODULE = 'webscraper.commands'
+# Resumable crawls: run with `-s JOBDIR=crawls/<name>` to keep the scheduler
+# queue, dupefilter and emitted items on disk. Restarting with the same
+# JOBDIR continues where the interrupted run stopped.
+SCHEDULER_DISK_QUEUE = 'scrapy.squeues.PickleFifoDiskQueue'
+SCHEDULER_MEMORY_QUEUE = 'scrapy.squeues.FifoMemoryQueue'
 
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
 #USER_AGENT = "webscraper (+http://www.yourdomain.com)"
@@ -99,3 +175,21 @@ ROBOTSTXT_OBEY = True
 REQUEST_FINGERPRINTER_IMPLEMENTATION = "2.7"
 TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
 FEED_EXPORT_ENCODING = "utf-8"
+
+# Timing metrics export: stage_time/ and render_time/ histograms are written
+# to METRICS_DUMP_FILE every METRICS_DUMP_INTERVAL seconds and, when
+# METRICS_PORT is non-zero, served as JSON on http://127.0.0.1:<port>/metrics.
+EXTENSIONS = {
+    'webscraper.metrics.MetricsExport': 500,
+}
+METRICS_DUMP_FILE = 'crawl_metrics.json'
+METRICS_DUMP_INTERVAL = 30.0
+METRICS_PORT = 0
+METRICS_PREFIXES = ['stage_time/', 'render_time/']
+
+# Feed formats writing one row per matched keyword from page items, for
+# consumers of the original resultats.csv layout (see FEED_PER_KEYWORD).
+FEED_EXPORTERS = {
+    'csv_per_keyword': 'webscraper.exporters.PerKeywordCsvItemExporter',
+    'jsonlines_per_keyword': 'webscraper.exporters.PerKeywordJsonLinesItemExporter',
+}
@@ -1,9 +1,31 @@
 import scrapy
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest
+from scrapy.spidermiddlewares.httperror import HttpError
+from scrapy.utils.defer import deferred_from_coro
+from scrapy.utils.gz import gunzip
+from scrapy.linkextractors import IGNORED_EXTENSIONS
 from scrapy_selenium import SeleniumRequest
-from webscraper.xml_parser import parse_xml
+from twisted.internet import task
+from webscraper.xml_parser import parse_xml, parse_xml_content
+from webscraper.worker import BackendJobClient
+from webscraper.fetch_modes import FetchModeStore, STATIC, SELENIUM
+from webscraper.profiles import ProfileStore
+from webscraper import extractors
+from webscraper.seen import BloomFilter
+from webscraper.discovery import WatermarkStore, iter_feed, iter_sitemap
+from webscraper.crawl_state import EmittedLog, items_delivered, job_dir_resuming, page_processed
+from webscraper.exporters import KEYWORD_FIELDS, PAGE_FIELDS
+from webscraper.metrics import domain_of, record_stage
+import asyncio
+import multiprocessing
 import os
-import logging
-import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import defaultdict
+from urllib.parse import urljoin, urlparse
+from w3lib.url import canonicalize_url
 
 class XmlSpider(scrapy.Spider):
     name = 'xml_spider'
@@ -13,30 +35,182 @@ class XmlSpider(scrapy.Spider):
             'resultats.csv': {
                 'format': 'csv',
                 'encoding': 'utf-8',
-                'fields': ['URL', 'Mot_clé', 'Titre', 'Contenu', 'Date', 'Auteurs'],
+                'fields': PAGE_FIELDS,
                 'overwrite': True,
             },
         },
+        # One row per page with the matched keywords and their counts. Set to
+        # True to write resultats.csv with the original one-row-per-keyword
+        # layout (feed format 'csv_per_keyword').
+        'FEED_PER_KEYWORD': False,
         'SELENIUM_DRIVER_NAME': 'firefox',
         'SELENIUM_DRIVER_EXECUTABLE_PATH': r'C:\Users\celine\scraper_project\geckodriver.exe',
         'SELENIUM_BROWSER_EXECUTABLE_PATH': r'C:\Program Files\Mozilla Firefox\firefox.exe',
         'SELENIUM_DRIVER_ARGUMENTS': ['-headless'],
         'USER_AGENT': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
         'ROBOTSTXT_OBEY': False,
+        # Starting delay for each domain slot; DomainThrottleMiddleware adapts
+        # it per domain from there.
         'DOWNLOAD_DELAY': 3,
-        'CONCURRENT_REQUESTS': 1,
+        'CONCURRENT_REQUESTS': 32,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': 1,
         'DOWNLOAD_TIMEOUT': 30,
+        # Hybrid mode: try the plain downloader first and only render with
+        # Selenium when the static page yields too little content.
+        'HYBRID_FETCH_ENABLED': True,
+        'HYBRID_MIN_CONTENT_LENGTH': 200,
+        'HYBRID_FETCH_MODES_FILE': 'fetch_modes.json',
+        # Seconds a domain moved to Selenium is rendered before its pages
+        # are tried with the static fetch again (0 keeps it on Selenium).
+        'HYBRID_FETCH_MODE_TTL': 86400.0,
+        # 'single_pass' walks the DOM once; 'selectors' is the original
+        # per-selector loop; 'density' ignores the selectors and picks the
+        # block with the best text/link density. Parity mode runs single_pass
+        # and selectors side by side and logs differences.
+        'CONTENT_EXTRACTOR': 'single_pass',
+        'CONTENT_EXTRACTOR_PARITY': False,
+        # Learn per domain which title/author/date/content selectors match and
+        # try those first on later pages instead of probing every selector.
+        'SELECTOR_PROFILES_ENABLED': True,
+        'SELECTOR_PROFILES_FILE': 'selector_profiles.json',
+        'SELECTOR_PROFILES_MIN_PAGES': 5,
+        'SELECTOR_PROFILES_MAX_FALLBACKS': 3,
+        'KEYWORD_WORD_BOUNDARIES': True,
+        'KEYWORD_FOLD_ACCENTS': True,
+        # Worker processes running extraction and keyword matching off the
+        # reactor thread; 0 runs them inline.
+        'EXTRACTION_PROCESSES': 4,
+        # Per-stage, per-domain latency histograms under stage_time/ in the
+        # crawl stats (download, html_parse, content, clean_text, metadata,
+        # keywords, extraction_overhead); see MetricsExport to export them.
+        'STAGE_TIMING_ENABLED': True,
+        # Worker mode (-a worker=1): stay open and lease jobs from the backend.
+        'WORKER_POLL_INTERVAL': 5.0,
+        # Seconds each lease long-polls the backend for a new job (0 polls).
+        'WORKER_LEASE_WAIT': 30.0,
+        'WORKER_MAX_JOBS': 4,
+        # Seconds between lease renewals of running jobs; must stay well
+        # below the backend's JOB_QUEUE_VISIBILITY_TIMEOUT.
+        'WORKER_HEARTBEAT_INTERVAL': 300.0,
+        # Link-following crawl mode. Sites can override the limits with
+        # <crawl max_depth="..." max_pages="..." same_domain="..."/>.
+        'LINK_CRAWL_ENABLED': False,
+        'LINK_CRAWL_MAX_DEPTH': 1,
+        'LINK_CRAWL_MAX_PAGES': 50,
+        'LINK_CRAWL_SAME_DOMAIN': True,
+        'LINK_CRAWL_SEEN_CAPACITY': 1000000,
+        'LINK_CRAWL_SEEN_ERROR_RATE': 0.001,
+        # Discovery mode: find articles through robots.txt sitemaps, news
+        # sitemaps and RSS/Atom feeds (<feeds><feed>...</feed></feeds>),
+        # queueing only entries newer than the site's last watermark.
+        'DISCOVERY_ENABLED': False,
+        'DISCOVERY_ONLY': False,
+        'DISCOVERY_MAX_ENTRIES': 200,
+        'DISCOVERY_WATERMARKS_FILE': 'discovery_watermarks.json',
+        # Seconds between saves of fetch modes, selector profiles and
+        # discovery watermarks while crawling; they are also saved on close.
+        'STATE_SAVE_INTERVAL': 300.0,
     }
 
-    def __init__(self, *args, **kwargs):
+    request_headers = {
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'fr-FR,fr;q=0.9,en-US;q=0.8,en;q=0.7',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1',
+    }
+
+    def __init__(self, worker=None, *args, **kwargs):
         super(XmlSpider, self).__init__(*args, **kwargs)
-        csv_path = os.path.join(os.getcwd(), 'resultats.csv')
-        if os.path.exists(csv_path):
-            os.remove(csv_path)
-            self.logger.info(f"Removed existing CSV file: {csv_path}")
+        self.worker_mode = str(worker).lower() in ('1', 'true', 'yes')
+        self.jobs = {}
+        self.job_client = None
+        self.poll_loop = None
+        self.heartbeat_loop = None
+        self.save_loop = None
+        self.emitted = None
+        # id(item) -> EmittedLog key parts of the items yielded but not yet delivered
+        self.emitting = {}
+        self.delivery_acked = None
+
+    @classmethod
+    def update_settings(cls, settings):
+        super(XmlSpider, cls).update_settings(settings)
+        if settings.getbool('FEED_PER_KEYWORD'):
+            feeds = {
+                uri: {**options, 'format': f"{options['format']}_per_keyword", 'fields': KEYWORD_FIELDS}
+                for uri, options in settings.getdict('FEEDS').items()
+            }
+            settings.set('FEEDS', feeds, priority='spider')
+        if job_dir_resuming(settings.get('JOBDIR')):
+            # Append to the CSV of the interrupted run instead of starting over.
+            feeds = {
+                uri: {**options, 'overwrite': False, 'item_export_kwargs': {'include_headers_line': False}}
+                for uri, options in settings.getdict('FEEDS').items()
+            }
+            settings.set('FEEDS', feeds, priority='spider')
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(XmlSpider, cls).from_crawler(crawler, *args, **kwargs)
+        job_dir = crawler.settings.get('JOBDIR')
+        if not spider.worker_mode and not job_dir_resuming(job_dir):
+            csv_path = os.path.join(os.getcwd(), 'resultats.csv')
+            if os.path.exists(csv_path):
+                os.remove(csv_path)
+                spider.logger.info(f"Removed existing CSV file: {csv_path}")
+        if job_dir:
+            spider.emitted = EmittedLog(job_dir)
+            crawler.signals.connect(spider.item_scraped, signal=signals.item_scraped)
+            crawler.signals.connect(spider.item_lost, signal=signals.item_dropped)
+            crawler.signals.connect(spider.item_lost, signal=signals.item_error)
+            crawler.signals.connect(spider.items_delivered, signal=items_delivered)
+        if spider.worker_mode:
+            crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+            crawler.signals.connect(spider.request_scheduled, signal=signals.request_scheduled)
+        return spider
+
+    def setup_crawl(self):
+        # With a JOBDIR the persistent dupefilter must see start, discovery and
+        # link requests, so a resumed crawl does not download them again.
+        # Worker jobs may legitimately repeat URLs, so they always bypass it.
+        self.dont_filter = self.worker_mode or not self.settings.get('JOBDIR')
+        self.hybrid = self.settings.getbool('HYBRID_FETCH_ENABLED')
+        self.min_content_length = self.settings.getint('HYBRID_MIN_CONTENT_LENGTH')
+        self.fetch_modes = FetchModeStore(
+            self.settings.get('HYBRID_FETCH_MODES_FILE'),
+            ttl=self.settings.getfloat('HYBRID_FETCH_MODE_TTL'),
+        )
+        self.profiles = None
+        if self.settings.getbool('SELECTOR_PROFILES_ENABLED'):
+            self.profiles = ProfileStore(
+                self.settings.get('SELECTOR_PROFILES_FILE'),
+                min_pages=self.settings.getint('SELECTOR_PROFILES_MIN_PAGES'),
+                max_fallbacks=self.settings.getint('SELECTOR_PROFILES_MAX_FALLBACKS'),
+            )
+        self.stage_timing = self.settings.getbool('STAGE_TIMING_ENABLED')
+        processes = self.settings.getint('EXTRACTION_PROCESSES')
+        self.extraction_pool = self.new_extraction_pool() if processes > 0 else None
+        # Link-crawl and discovery state is kept per worker job (None outside
+        # worker mode), so a later job for the same site starts afresh.
+        self.seen_urls = {}
+        self.site_pages = defaultdict(lambda: defaultdict(int))
+        self.frontier_size = 0
+        self.discovery = self.settings.getbool('DISCOVERY_ENABLED')
+        self.watermarks = WatermarkStore(self.settings.get('DISCOVERY_WATERMARKS_FILE')) if self.discovery else None
+        self.discovered = defaultdict(lambda: defaultdict(int))
+        # Long-running crawls, and workers above all, must not keep what
+        # they learned in memory only until they close.
+        self.save_loop = task.LoopingCall(self.save_state)
+        self.save_loop.start(self.settings.getfloat('STATE_SAVE_INTERVAL'), now=False)
 
     def start_requests(self):
         self.logger.info("Starting spider...")
+        self.setup_crawl()
+
+        if self.worker_mode:
+            self.start_worker()
+            return
+
         sites = parse_xml('config.xml')
         
         if not sites:
@@ -47,123 +221,543 @@ class XmlSpider(scrapy.Spider):
         
         for site in sites:
             self.logger.info(f"Processing site: {site['url']}")
-            yield SeleniumRequest(
-                url=site['url'],
+            yield from self.site_requests(site)
+
+    def crawl_config(self, site):
+        overrides = site.get('crawl')
+        if not self.settings.getbool('LINK_CRAWL_ENABLED') and overrides is None:
+            return None
+        overrides = overrides or {}
+        return {
+            'site': site['url'],
+            'depth': 0,
+            'max_depth': int(overrides.get('max_depth', self.settings.getint('LINK_CRAWL_MAX_DEPTH'))),
+            'max_pages': int(overrides.get('max_pages', self.settings.getint('LINK_CRAWL_MAX_PAGES'))),
+            'same_domain': str(overrides.get('same_domain', self.settings.getbool('LINK_CRAWL_SAME_DOMAIN'))).lower() in ('1', 'true', 'yes'),
+        }
+
+    def seen(self, job_id):
+        if job_id not in self.seen_urls:
+            self.seen_urls[job_id] = BloomFilter(
+                self.settings.getint('LINK_CRAWL_SEEN_CAPACITY'),
+                self.settings.getfloat('LINK_CRAWL_SEEN_ERROR_RATE'),
+            )
+        return self.seen_urls[job_id]
+
+    def forget_job(self, job_id):
+        self.seen_urls.pop(job_id, None)
+        self.site_pages.pop(job_id, None)
+        self.discovered.pop(job_id, None)
+
+    def site_requests(self, site, job_id=None):
+        if self.discovery:
+            yield from self.discovery_requests(site, job_id)
+            if self.settings.getbool('DISCOVERY_ONLY'):
+                return
+        crawl = self.crawl_config(site)
+        if crawl:
+            self.seen(job_id).add(canonicalize_url(site['url']))
+            self.site_pages[job_id][site['url']] += 1
+        yield self.build_request(site['url'], site['keywords'], job_id=job_id, crawl=crawl)
+
+    def discovery_requests(self, site, job_id=None):
+        # robots.txt, sitemaps and feeds must be parsed on every run, changed
+        # or not, since they are what leads to new articles.
+        meta = {'site': site['url'], 'keywords': site['keywords'], 'job_id': job_id, 'conditional_cache_skip': True}
+        yield scrapy.Request(
+            urljoin(site['url'], '/robots.txt'),
+            callback=self.parse_robots,
+            errback=self.request_failed,
+            # A missing robots.txt still falls back to /sitemap.xml.
+            meta={**meta, 'handle_httpstatus_list': [403, 404]},
+            dont_filter=self.dont_filter,
+        )
+        for feed in site.get('feeds', []):
+            yield scrapy.Request(feed, callback=self.parse_feed, errback=self.request_failed, meta=meta, dont_filter=self.dont_filter)
+
+    def parse_robots(self, response):
+        try:
+            sitemaps = [
+                line.split(':', 1)[1].strip() for line in response.text.splitlines()
+                if response.status == 200 and line.lower().startswith('sitemap:')
+            ]
+            if not sitemaps:
+                sitemaps = [urljoin(response.url, '/sitemap.xml')]
+            meta = {key: response.meta[key] for key in ('site', 'keywords', 'job_id', 'conditional_cache_skip')}
+            for sitemap in sitemaps:
+                yield response.follow(sitemap, callback=self.parse_sitemap, errback=self.request_failed,
+                                      meta=meta, dont_filter=self.dont_filter)
+        finally:
+            self.request_done(response.meta.get('job_id'))
+
+    def parse_sitemap(self, response):
+        try:
+            body = response.body
+            if response.url.endswith('.gz') or body[:2] == b'\x1f\x8b':
+                body = gunzip(body)
+            for kind, loc, lastmod in iter_sitemap(body):
+                if kind == 'sitemap':
+                    # Sitemap indexes are followed unless the child is known to be stale.
+                    if lastmod is None or self.watermarks.is_fresh(response.meta['site'], lastmod):
+                        yield response.follow(loc, callback=self.parse_sitemap, errback=self.request_failed,
+                                              meta=response.meta, dont_filter=self.dont_filter)
+                    continue
+                request = self.discovered_request(response.meta, loc, lastmod)
+                if request is not None:
+                    yield request
+        except Exception as e:
+            self.logger.error(f"Error parsing sitemap {response.url}: {str(e)}")
+        finally:
+            self.request_done(response.meta.get('job_id'))
+
+    def parse_feed(self, response):
+        try:
+            for link, published in iter_feed(response.body):
+                request = self.discovered_request(response.meta, response.urljoin(link), published)
+                if request is not None:
+                    yield request
+        except Exception as e:
+            self.logger.error(f"Error parsing feed {response.url}: {str(e)}")
+        finally:
+            self.request_done(response.meta.get('job_id'))
+
+    def discovered_request(self, meta, url, published):
+        site = meta['site']
+        stats = self.crawler.stats
+        stats.inc_value('discovery/entries_seen')
+        # Undated entries cannot be compared with the watermark, so they are skipped.
+        if published is None or not self.watermarks.is_fresh(site, published):
+            stats.inc_value('discovery/entries_stale')
+            return None
+        job_id = meta.get('job_id')
+        discovered = self.discovered[job_id]
+        if discovered[site] >= self.settings.getint('DISCOVERY_MAX_ENTRIES'):
+            stats.inc_value('discovery/entries_over_budget')
+            self.watermarks.skip(site, published)
+            return None
+        if not self.seen(job_id).add(canonicalize_url(url)):
+            return None
+        discovered[site] += 1
+        self.watermarks.observe(site, published)
+        stats.inc_value('discovery/entries_queued')
+        return self.build_request(url, meta['keywords'], job_id=job_id)
+
+    def build_request(self, url, keywords, render=None, job_id=None, crawl=None, priority=0, dont_filter=None):
+        if dont_filter is None:
+            dont_filter = self.dont_filter
+        if render is None:
+            render = not self.hybrid or self.fetch_modes.get(url) == SELENIUM
+
+        meta = {'keywords': keywords, 'job_id': job_id, 'crawl': crawl}
+        # Unchanged pages are only skipped when nothing depends on them: a
+        # worker job wants its own items even if an earlier job already saw
+        # the page, and link-crawl pages must be parsed for their links.
+        if job_id is not None or (crawl and crawl['depth'] < crawl['max_depth']):
+            meta['conditional_cache_skip'] = True
+
+        if not render:
+            return scrapy.Request(
+                url=url,
                 callback=self.parse,
-                meta={'keywords': site['keywords']},
-                wait_time=30,
-                wait_until=lambda driver: driver.execute_script('return document.readyState') == 'complete',
-                dont_filter=True,
-                headers={
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                    'Accept-Language': 'fr-FR,fr;q=0.9,en-US;q=0.8,en;q=0.7',
-                    'Connection': 'keep-alive',
-                    'Upgrade-Insecure-Requests': '1',
-                }
+                errback=self.request_failed,
+                meta={**meta, 'fetch_mode': STATIC},
+                priority=priority,
+                dont_filter=dont_filter,
+                headers=self.request_headers,
             )
 
-    def clean_text(self, text):
-        if not text:
-            return ""
-        text = re.sub(r'\s+', ' ', text)
-        text = re.sub(r'[^\w\s.,;:!?éèêëàâäôöûüçÉÈÊËÀÂÄÔÖÛÜÇ-]', '', text)
-        return text.strip()
-
-    def extract_metadata(self, response):
-        metadata = {
-            'title': '',
-            'authors': '',
-            'date': ''
-        }
-        
-        title_selectors = [
-            'title::text', 'h1::text', '.title::text', '.article-title::text',
-            '.post-title::text', '.entry-title::text', '.content-title::text',
-            '#title::text', '[itemprop="headline"]::text'
-        ]
-        for selector in title_selectors:
-            title = response.css(selector).get()
-            if title:
-                metadata['title'] = self.clean_text(title)
-                break
+        return SeleniumRequest(
+            url=url,
+            callback=self.parse,
+            errback=self.request_failed,
+            meta={**meta, 'fetch_mode': SELENIUM},
+            priority=priority,
+            wait_time=30,
+            dont_filter=dont_filter,
+            headers=self.request_headers,
+        )
+
+    def keyword_matcher(self, keywords):
+        return extractors.keyword_matcher(
+            keywords,
+            word_boundaries=self.settings.getbool('KEYWORD_WORD_BOUNDARIES'),
+            fold_accents=self.settings.getbool('KEYWORD_FOLD_ACCENTS'),
+        )
+
+    def start_worker(self):
+        base_url = self.settings.get('BACKEND_URL')
+        if not base_url:
+            self.logger.error("Worker mode requires BACKEND_URL")
+            return
+        self.job_client = BackendJobClient(base_url, self.settings.get('BACKEND_TOKEN'))
+        self.poll_loop = task.LoopingCall(self.poll_jobs)
+        self.poll_loop.start(self.settings.getfloat('WORKER_POLL_INTERVAL'))
+        self.heartbeat_loop = task.LoopingCall(self.renew_leases)
+        self.heartbeat_loop.start(self.settings.getfloat('WORKER_HEARTBEAT_INTERVAL'), now=False)
+        self.logger.info(f"Worker started, polling {base_url} for jobs")
+
+    def renew_leases(self):
+        if not self.jobs:
+            return None
+        d = deferred_from_coro(self.heartbeat_jobs())
+        d.addErrback(lambda failure: self.logger.error(f"Could not renew job leases: {failure.getErrorMessage()}"))
+        return d
+
+    async def heartbeat_jobs(self):
+        for job_id in list(self.jobs):
+            if not await self.job_client.heartbeat(job_id):
+                # Another robot may run it too; finishing it does no harm.
+                self.logger.warning(f"Lease of job {job_id} expired before it completed")
+
+    def poll_jobs(self):
+        if len(self.jobs) >= self.settings.getint('WORKER_MAX_JOBS'):
+            return None
+        d = deferred_from_coro(self.lease_job())
+        # A failure here would stop the LoopingCall and leave the worker
+        # idle for good; log it and poll again at the next tick.
+        d.addErrback(lambda failure: self.logger.error(f"Could not lease a job: {failure.getErrorMessage()}"))
+        return d
+
+    async def lease_job(self):
+        leased = await self.job_client.lease(self.settings.getfloat('WORKER_LEASE_WAIT'))
+        if not leased:
+            return
+        request_id, content = leased
+        sites = parse_xml_content(content)
+        self.logger.info(f"Leased job {request_id} with {len(sites)} sites")
+        if not sites:
+            await self.job_client.complete(request_id, 'failed', 0)
+            return
 
-        author_selectors = [
-            '.author::text', '.authors::text', '.byline::text',
-            '[itemprop="author"]::text', '.post-author::text',
-            '.article-author::text', '.contributor::text'
-        ]
-        authors = []
-        for selector in author_selectors:
-            authors.extend(response.css(selector).getall())
-        metadata['authors'] = ', '.join([self.clean_text(author) for author in authors if author.strip()])
-
-        date_selectors = [
-            '.date::text', '.published::text', '.post-date::text',
-            '[itemprop="datePublished"]::text', '.article-date::text',
-            '.timestamp::text', '.time::text'
-        ]
-        for selector in date_selectors:
-            date = response.css(selector).get()
-            if date:
-                metadata['date'] = self.clean_text(date)
+        self.jobs[request_id] = {'pending': 0, 'items': 0}
+        for site in sites:
+            for request in self.site_requests(site, job_id=request_id):
+                self.crawler.engine.crawl(request)
+
+    def request_scheduled(self, request, spider):
+        job = self.jobs.get(request.meta.get('job_id'))
+        if job is not None:
+            job['pending'] += 1
+
+    def request_done(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        job['pending'] -= 1
+        if job['pending'] <= 0:
+            del self.jobs[job_id]
+            self.forget_job(job_id)
+            self.logger.info(f"Job {job_id} completed with {job['items']} items")
+            deferred_from_coro(self.job_client.complete(job_id, 'completed', job['items']))
+
+    def request_failed(self, failure):
+        request = failure.request
+        if failure.check(IgnoreRequest):
+            # Dropped on purpose, mostly unchanged pages skipped by the
+            # conditional cache, which counts them in its own stats.
+            self.logger.debug(f"Request dropped for {request.url}: {failure.getErrorMessage()}")
+        else:
+            self.logger.warning(f"Request failed for {request.url}: {failure.getErrorMessage()}")
+        requeued = False
+        try:
+            fallback = self.http_error_fallback(failure)
+            if fallback is not None:
+                requeued = True
+                yield fallback
+        finally:
+            if not requeued:
+                self.link_done(request.meta)
+            self.request_done(request.meta.get('job_id'))
+
+    def http_error_fallback(self, failure):
+        # Bot walls and JS challenges answer the static fetch with 403, 429
+        # or 503 while a real browser gets the page, so those are rendered
+        # too. Pages that do not exist are not worth a browser.
+        request = failure.request
+        if not failure.check(HttpError) or request.meta.get('fetch_mode') != STATIC:
+            return None
+        status = failure.value.response.status
+        if status in (404, 410):
+            return None
+        self.logger.info(f"Static fetch of {request.url} got HTTP {status}, falling back to Selenium")
+        self.crawler.stats.inc_value('hybrid/selenium_fallback_http')
+        if status in (401, 403):
+            # Refused outright: the whole domain is rendered until HYBRID_FETCH_MODE_TTL runs out.
+            self.fetch_modes.set(request.url, SELENIUM)
+        # Same URL as the static request, so it must bypass the dupefilter.
+        return self.build_request(request.url, request.meta['keywords'], render=True,
+                                  job_id=request.meta.get('job_id'), crawl=request.meta.get('crawl'),
+                                  priority=request.priority, dont_filter=True)
+
+    def link_done(self, meta):
+        crawl = meta.get('crawl')
+        if crawl and crawl['depth'] > 0:
+            self.frontier_size -= 1
+            self.crawler.stats.set_value('link_crawl/frontier_size', self.frontier_size)
+
+    def follow_links(self, response, keywords, matcher):
+        crawl = response.meta.get('crawl')
+        if not crawl or crawl['depth'] >= crawl['max_depth']:
+            return
+        site = crawl['site']
+        site_domain = urlparse(site).netloc.lower()
+        stats = self.crawler.stats
+        job_id = response.meta.get('job_id')
+        seen_urls = self.seen(job_id)
+        site_pages = self.site_pages[job_id]
+
+        candidates = []
+        for link in response.css('a[href]'):
+            url = canonicalize_url(response.urljoin(link.attrib['href']))
+            parsed = urlparse(url)
+            if parsed.scheme not in ('http', 'https'):
+                continue
+            if crawl['same_domain'] and parsed.netloc.lower() != site_domain:
+                continue
+            if os.path.splitext(parsed.path)[1][1:].lower() in IGNORED_EXTENSIONS:
+                continue
+            stats.inc_value('link_crawl/links_seen')
+            if not seen_urls.add(url):
+                stats.inc_value('link_crawl/links_duplicate')
+                continue
+            # Links whose anchor text or URL mention a keyword are crawled first.
+            anchor = ' '.join(link.css('::text').getall())
+            score = sum(hit['count'] for hit in matcher.find(f'{anchor} {url}').values())
+            candidates.append((score, url))
+
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        child = {**crawl, 'depth': crawl['depth'] + 1}
+        for score, url in candidates:
+            if site_pages[site] >= crawl['max_pages']:
+                stats.inc_value('link_crawl/links_over_budget')
                 break
+            site_pages[site] += 1
+            self.frontier_size += 1
+            yield self.build_request(
+                url, keywords, job_id=job_id, crawl=child,
+                priority=score * 10 - child['depth'],
+            )
+
+        seen = stats.get_value('link_crawl/links_seen', 0)
+        if seen:
+            stats.set_value('link_crawl/dedupe_rate', round(stats.get_value('link_crawl/links_duplicate', 0) / seen, 4))
+        stats.set_value('link_crawl/frontier_size', self.frontier_size)
+        stats.set_value('link_crawl/seen_urls', sum(len(seen) for seen in self.seen_urls.values()))
+
+    def spider_idle(self, spider):
+        if self.poll_loop is not None and self.poll_loop.running:
+            raise DontCloseSpider
+
+    def save_state(self):
+        if getattr(self, 'fetch_modes', None):
+            self.fetch_modes.save()
+        if getattr(self, 'profiles', None):
+            self.profiles.save()
+        if getattr(self, 'watermarks', None):
+            self.watermarks.save()
+
+    def claim_item(self, item, job_id):
+        # Worker jobs are independent: another job may want the same page.
+        parts = (item['URL'],) if job_id is None else (job_id, item['URL'])
+        if not self.emitted.claim(*parts):
+            return False
+        self.emitting[id(item)] = parts
+        return True
+
+    def item_scraped(self, item):
+        # Feeds write the item on item_scraped; a pipeline that delivers
+        # later sends items_delivered instead.
+        if self.delivery_acked is None:
+            pipelines = self.crawler.engine.scraper.itemproc.middlewares
+            self.delivery_acked = any(getattr(pipeline, 'acks_delivery', False) for pipeline in pipelines)
+        if not self.delivery_acked:
+            self.item_delivered(item)
+
+    def items_delivered(self, items):
+        for item in items:
+            self.item_delivered(item)
+
+    def item_delivered(self, item):
+        parts = self.emitting.pop(id(item), None)
+        if parts is not None:
+            self.emitted.add(*parts)
+
+    def item_lost(self, item):
+        parts = self.emitting.pop(id(item), None)
+        if parts is not None:
+            self.emitted.release(*parts)
+
+    def closed(self, reason):
+        if self.save_loop is not None and self.save_loop.running:
+            self.save_loop.stop()
+        self.save_state()
+        if self.emitted is not None:
+            self.emitted.close()
+        if getattr(self, 'extraction_pool', None):
+            self.extraction_pool.shutdown(wait=False, cancel_futures=True)
+        if self.poll_loop is not None and self.poll_loop.running:
+            self.poll_loop.stop()
+        if self.heartbeat_loop is not None and self.heartbeat_loop.running:
+            self.heartbeat_loop.stop()
+        if self.job_client is not None:
+            return deferred_from_coro(self.job_client.close())
 
-        return metadata
+    def extraction_options(self, fetch_mode, url):
+        options = extractors.extraction_options(
+            self.settings, self.min_content_length if fetch_mode == STATIC else 0
+        )
+        options['timings'] = self.stage_timing
+        if self.profiles is not None:
+            options['profile'] = self.profiles.get(domain_of(url))
+            # A profile whose content is shorter than this counts as failed.
+            options['profile_min_length'] = max(self.min_content_length, 1)
+        return options
 
-    def parse(self, response):
+    def record_selectors(self, url, content, used):
+        if self.profiles is None or not used or len(content) < self.min_content_length:
+            return
+        stats = self.crawler.stats
+        stats.inc_value('selector_profiles/evaluations', used['evaluations'])
+        for field in used['fallbacks']:
+            stats.inc_value(f'selector_profiles/fallback/{field}')
+        domain = domain_of(url)
+        if self.profiles.record(domain, used):
+            stats.inc_value('selector_profiles/reset')
+            self.logger.info(f"Selector profile for {domain} stopped working, relearning it")
+
+    async def extract(self, response, keywords, options):
+        args = (response.url, response.body, response.encoding, keywords, options)
+        if self.extraction_pool is None:
+            return extractors.extract_page(*args)
+        # Parsing and regex work happens in a worker process; the reactor
+        # thread only waits on the future.
+        for attempt in range(2):
+            pool = self.extraction_pool
+            try:
+                return await asyncio.wrap_future(pool.submit(extractors.extract_page, *args))
+            except BrokenProcessPool:
+                self.replace_extraction_pool(pool)
+        # The page broke a fresh pool as well.
+        return extractors.extract_page(*args)
+
+    def replace_extraction_pool(self, pool):
+        # A worker process that dies (killed, out of memory) breaks the whole
+        # pool, and every later submit would fail. Only the first page to
+        # notice replaces it.
+        if self.extraction_pool is not pool:
+            return
+        self.logger.error("Extraction process pool broke, starting a new one")
+        self.crawler.stats.inc_value('extraction_pool/restarts')
+        pool.shutdown(wait=False, cancel_futures=True)
+        self.extraction_pool = self.new_extraction_pool()
+
+    def new_extraction_pool(self):
+        # Workers start lazily, once the reactor and Selenium threads are
+        # running; forking then could copy a lock held by one of them into
+        # the child and deadlock it. forkserver (spawn where it does not
+        # exist, e.g. Windows) starts them from a clean process instead.
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        return ProcessPoolExecutor(
+            max_workers=self.settings.getint('EXTRACTION_PROCESSES'),
+            mp_context=multiprocessing.get_context(method),
+        )
+
+    def record_stages(self, response, fetch_mode, timings, extract_seconds):
+        stats = self.crawler.stats
+        domain = domain_of(response.url)
+        # Renders are timed by the Selenium middleware itself.
+        if fetch_mode == STATIC and 'download_latency' in response.meta:
+            record_stage(stats, 'download', domain, response.meta['download_latency'])
+        for stage, seconds in timings.items():
+            record_stage(stats, stage, domain, seconds)
+        # Whatever the worker did not spend extracting went to waiting for a
+        # free worker and shipping the page there and back.
+        worked = sum(seconds for stage, seconds in timings.items() if stage != 'clean_text')
+        record_stage(stats, 'extraction_overhead', domain, max(extract_seconds - worked, 0.0))
+
+    def record_parity(self, url, diff):
+        if diff['missing_words'] or diff['extra_words']:
+            self.crawler.stats.inc_value('content_extractor/parity_mismatch')
+            self.logger.warning(
+                f"Extractor parity mismatch on {url}: "
+                f"legacy={diff['legacy_length']} single_pass={diff['single_pass_length']} "
+                f"missing={diff['missing_words'][:20]} extra={diff['extra_words'][:20]}"
+            )
+        else:
+            self.crawler.stats.inc_value('content_extractor/parity_match')
+
+    async def parse(self, response):
+        requeued = False
         try:
             keywords = response.meta['keywords']
-            self.logger.info(f"Parsing URL: {response.url}")
-            
-            metadata = self.extract_metadata(response)
-            self.logger.info(f"Extracted title: {metadata['title']}")
-            
-            content_selectors = [
-                'article', '.article', '.post', '.entry',
-                '.content', '.main', '.body', '.text',
-                '[itemprop="articleBody"]', '.article-content',
-                '.post-content', '.entry-content'
-            ]
-            
-            content_parts = []
-            for selector in content_selectors:
-                content_parts.extend(response.css(f'{selector}::text, {selector} *::text').getall())
-            
-            content = ' '.join([
-                self.clean_text(text) for text in content_parts
-                if text.strip() 
-                and not text.strip().startswith('{')
-                and not text.strip().startswith('document.')
-                and not text.strip().startswith('Skip to')
-                and not text.strip().startswith('Advertisement')
-                and not text.strip().startswith('Cookie')
-                and not text.strip().startswith('Sign in')
-                and len(text.strip()) > 3
-            ])
+            job_id = response.meta.get('job_id')
+            fetch_mode = response.meta.get('fetch_mode', SELENIUM)
+            self.logger.info(f"Parsing URL: {response.url} ({fetch_mode})")
             
+            options = self.extraction_options(fetch_mode, response.url)
+            started = time.perf_counter()
+            extracted = await self.extract(response, keywords, options)
+            if extracted['timings'] is not None:
+                self.record_stages(response, fetch_mode, extracted['timings'], time.perf_counter() - started)
+            content = extracted['content']
+            if options.get('profile'):
+                self.crawler.stats.inc_value('selector_profiles/profiled_pages')
+            self.record_selectors(response.url, content, extracted['selectors'])
+            if extracted['parity']:
+                self.record_parity(response.url, extracted['parity'])
             self.logger.info(f"Content length: {len(content)}")
+
+            if fetch_mode == STATIC:
+                if len(content) < self.min_content_length:
+                    self.logger.info(f"Static content too short for {response.url}, falling back to Selenium")
+                    self.crawler.stats.inc_value('hybrid/selenium_fallback')
+                    self.fetch_modes.set(response.url, SELENIUM)
+                    requeued = True
+                    # Same URL as the static request, so it must bypass the dupefilter.
+                    yield self.build_request(response.request.url, keywords, render=True, job_id=job_id,
+                                             crawl=response.meta.get('crawl'), priority=response.request.priority,
+                                             dont_filter=True)
+                    return
+                self.crawler.stats.inc_value('hybrid/static_ok')
+                self.fetch_modes.set(response.url, STATIC)
+
+            metadata = extracted['metadata']
+            self.logger.info(f"Extracted title: {metadata['title']}")
+
+            matcher = self.keyword_matcher(keywords)
+
             if content:
                 self.logger.info(f"Content preview: {content[:200]}...")
             else:
                 self.logger.warning(f"No content extracted from {response.url}")
+                # Index pages may have no article text but still lead to articles.
+                for request in self.follow_links(response, keywords, matcher):
+                    yield request
+                self.crawler.signals.send_catch_log(page_processed, response=response)
                 return
 
-            found_keywords = False
-            for keyword in keywords:
-                if keyword.lower() in content.lower():
-                    self.logger.info(f"Found keyword: {keyword}")
-                    found_keywords = True
-                    yield {
-                        'URL': response.url,
-                        'Mot_clé': keyword,
-                        'Titre': metadata['title'],
-                        'Contenu': content[:1000],
-                        'Date': metadata['date'],
-                        'Auteurs': metadata['authors']
-                    }
+            hits = extracted['hits']
+            for item in extractors.page_items(response.url, extracted, keywords, options):
+                if self.emitted is not None and not self.claim_item(item, job_id):
+                    self.crawler.stats.inc_value('crawl_state/items_already_emitted')
+                    continue
+                found = ', '.join(f'{keyword} ({count} times)' for keyword, count in zip(item['Mots_clés'], item['Occurrences']))
+                self.logger.info(f"Found keywords: {found}")
+                if job_id in self.jobs:
+                    self.jobs[job_id]['items'] += 1
+                yield item
             
-            if not found_keywords:
+            if not hits:
                 self.logger.warning(f"No keywords found in content for {response.url}")
+
+            for request in self.follow_links(response, keywords, matcher):
+                yield request
+            # Only now may the conditional cache skip the page on later runs.
+            self.crawler.signals.send_catch_log(page_processed, response=response)
                 
         except Exception as e:
-            self.logger.error(f"Error in parse method: {str(e)}")
\ No newline at end of file
+            self.logger.error(f"Error in parse method: {str(e)}")
+        finally:
+            if not requeued:
+                self.link_done(response.meta)
+            self.request_done(response.meta.get('job_id'))
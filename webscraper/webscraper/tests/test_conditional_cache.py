@@ -0,0 +1,66 @@
+import pytest
+from scrapy import Spider
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+
+from webscraper.crawl_state import page_processed
+from webscraper.middlewares import ConditionalCacheMiddleware
+
+
+@pytest.fixture
+def cache(tmp_path):
+    crawler = get_crawler(Spider, {
+        'CONDITIONAL_CACHE_ENABLED': True,
+        'CONDITIONAL_CACHE_DIR': str(tmp_path),
+    })
+    spider = crawler._create_spider('cache_test')
+    middleware = ConditionalCacheMiddleware.from_crawler(crawler)
+    middleware.spider_opened(spider)
+    yield crawler, spider, middleware
+    middleware.spider_closed(spider)
+
+
+def fetch(middleware, spider, body=b'<html>page</html>', keywords=('climat',), headers=None):
+    request = Request('https://example.com/page', meta={'keywords': list(keywords)})
+    assert middleware.process_request(request, spider) is None
+    response = HtmlResponse(request.url, body=body, headers=headers, request=request)
+    return middleware.process_response(request, response, spider)
+
+
+def test_entry_is_written_only_once_the_page_is_processed(cache):
+    crawler, spider, middleware = cache
+    response = fetch(middleware, spider)
+    # Parsing failed: nothing was stored, so the page is processed again.
+    assert fetch(middleware, spider).status == 200
+
+    crawler.signals.send_catch_log(page_processed, response=response)
+    with pytest.raises(IgnoreRequest):
+        fetch(middleware, spider)
+    assert crawler.stats.get_value('conditional_cache/unchanged_body') == 1
+
+
+def test_changed_body_is_processed(cache):
+    crawler, spider, middleware = cache
+    crawler.signals.send_catch_log(page_processed, response=fetch(middleware, spider))
+    assert fetch(middleware, spider, body=b'<html>new</html>').status == 200
+
+
+def test_changed_keywords_are_processed(cache):
+    crawler, spider, middleware = cache
+    crawler.signals.send_catch_log(page_processed, response=fetch(middleware, spider))
+    assert fetch(middleware, spider, keywords=('énergie',)).status == 200
+    assert crawler.stats.get_value('conditional_cache/context_changed') == 1
+
+
+def test_not_modified_is_dropped_after_revalidation(cache):
+    crawler, spider, middleware = cache
+    response = fetch(middleware, spider, headers={'ETag': '"v1"'})
+    crawler.signals.send_catch_log(page_processed, response=response)
+
+    request = Request('https://example.com/page', meta={'keywords': ['climat']})
+    middleware.process_request(request, spider)
+    assert request.headers['If-None-Match'] == b'"v1"'
+    with pytest.raises(IgnoreRequest):
+        middleware.process_response(request, HtmlResponse(request.url, status=304, request=request), spider)
+    assert crawler.stats.get_value('conditional_cache/hit') == 1
@@ -0,0 +1,100 @@
+from datetime import datetime, timezone
+
+from webscraper.discovery import WatermarkStore, iter_feed, iter_sitemap, parse_date
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_parse_date():
+    assert parse_date('2024-03-01T10:00:00Z') == utc(2024, 3, 1, 10)
+    assert parse_date('2024-03-01T12:00:00+02:00') == utc(2024, 3, 1, 10)
+    assert parse_date('2024-03-01') == utc(2024, 3, 1)
+    assert parse_date('Fri, 01 Mar 2024 10:00:00 GMT') == utc(2024, 3, 1, 10)
+    assert parse_date('not a date') is None
+    assert parse_date('') is None
+
+
+def test_sitemap_urls_ignore_nested_image_locs():
+    body = b'''<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
+        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">
+  <url>
+    <loc>https://example.com/a</loc>
+    <lastmod>2024-03-01</lastmod>
+    <image:image><image:loc>https://example.com/a.jpg</image:loc></image:image>
+  </url>
+  <url><loc>https://example.com/b</loc></url>
+</urlset>'''
+    assert list(iter_sitemap(body)) == [
+        ('url', 'https://example.com/a', utc(2024, 3, 1)),
+        ('url', 'https://example.com/b', None),
+    ]
+
+
+def test_sitemap_index_and_news_publication_date():
+    index = b'''<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>https://example.com/news.xml</loc><lastmod>2024-03-02T00:00:00Z</lastmod></sitemap>
+</sitemapindex>'''
+    assert list(iter_sitemap(index)) == [('sitemap', 'https://example.com/news.xml', utc(2024, 3, 2))]
+
+    news = b'''<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
+        xmlns:news="http://www.google.com/schemas/sitemap-news/0.9">
+  <url><loc>https://example.com/n</loc>
+    <news:news><news:publication_date>2024-03-03T08:00:00Z</news:publication_date></news:news>
+  </url>
+</urlset>'''
+    assert list(iter_sitemap(news)) == [('url', 'https://example.com/n', utc(2024, 3, 3, 8))]
+
+
+def test_rss_feed_ignores_channel_link():
+    body = b'''<rss version="2.0"><channel>
+  <link>https://example.com/</link>
+  <pubDate>Sun, 03 Mar 2024 00:00:00 GMT</pubDate>
+  <item><link>https://example.com/1</link><pubDate>Fri, 01 Mar 2024 10:00:00 GMT</pubDate></item>
+  <item><link>https://example.com/2</link></item>
+</channel></rss>'''
+    assert list(iter_feed(body)) == [
+        ('https://example.com/1', utc(2024, 3, 1, 10)),
+        ('https://example.com/2', None),
+    ]
+
+
+def test_atom_feed_uses_alternate_link():
+    body = b'''<feed xmlns="http://www.w3.org/2005/Atom">
+  <link href="https://example.com/feed" rel="self"/>
+  <entry>
+    <link href="https://example.com/edit/1" rel="edit"/>
+    <link href="https://example.com/1"/>
+    <published>2024-03-01T10:00:00Z</published>
+  </entry>
+</feed>'''
+    assert list(iter_feed(body)) == [('https://example.com/1', utc(2024, 3, 1, 10))]
+
+
+def test_watermark_advances_on_save_only(tmp_path):
+    path = tmp_path / 'watermarks.json'
+    store = WatermarkStore(str(path))
+    site = 'https://example.com/'
+    assert store.is_fresh(site, utc(2024, 3, 1))
+    store.observe(site, utc(2024, 3, 2))
+    store.observe(site, utc(2024, 3, 1))
+    # Entries of the same run are still compared with the previous watermark.
+    assert store.is_fresh(site, utc(2024, 3, 1))
+    store.save()
+
+    reloaded = WatermarkStore(str(path))
+    assert reloaded.get(site) == utc(2024, 3, 2)
+    assert not reloaded.is_fresh(site, utc(2024, 3, 2))
+    assert reloaded.is_fresh(site, utc(2024, 3, 2, 0, 0, 1))
+
+
+def test_skipped_entries_stay_fresh(tmp_path):
+    store = WatermarkStore(str(tmp_path / 'watermarks.json'))
+    site = 'https://example.com/'
+    store.observe(site, utc(2024, 3, 5))
+    store.skip(site, utc(2024, 3, 3))
+    store.save()
+    assert store.is_fresh(site, utc(2024, 3, 3))
+    assert not store.is_fresh(site, utc(2024, 3, 2))
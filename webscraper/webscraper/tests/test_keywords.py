@@ -0,0 +1,66 @@
+from webscraper.keywords import SEPARATE_KEYWORDS, KeywordMatcher
+
+
+def counts(hits):
+    return {keyword: hit['count'] for keyword, hit in hits.items()}
+
+
+def test_case_and_accents_are_folded():
+    hits = KeywordMatcher(['universite']).find('Université et UNIVERSITÉ')
+    assert hits == {'universite': {'count': 2, 'positions': [0, 14]}}
+
+
+def test_accents_kept_without_fold_accents():
+    hits = KeywordMatcher(['Université'], fold_accents=False).find('universite Université')
+    assert hits == {'Université': {'count': 1, 'positions': [11]}}
+
+
+def test_length_changing_fold_reports_original_offsets():
+    # "ß" folds to "ss", so folded and original positions differ after it.
+    hits = KeywordMatcher(['strasse']).find('Die Straße und die Strasse')
+    assert hits == {'strasse': {'count': 2, 'positions': [4, 19]}}
+    assert counts(KeywordMatcher(['straße']).find('xx STRASSE')) == {'straße': 1}
+
+
+def test_word_boundaries():
+    text = 'article art, art.'
+    assert KeywordMatcher(['art']).find(text)['art']['positions'] == [8, 13]
+    assert counts(KeywordMatcher(['art'], word_boundaries=False).find(text)) == {'art': 3}
+
+
+def test_non_word_edges_need_no_boundary():
+    # "+" and "." are not word characters, so only the word-character edge
+    # of "c++" and ".net" is checked.
+    hits = KeywordMatcher(['c++', '.net']).find('I like c++ and C++11, asp.net and .NET core; xc++')
+    assert counts(hits) == {'c++': 2, '.net': 2}
+    assert hits['c++']['positions'] == [7, 15]
+
+
+def test_overlapping_occurrences_all_count():
+    assert counts(KeywordMatcher(['aa'], word_boundaries=False).find('aaaa')) == {'aa': 3}
+    assert KeywordMatcher(['aa']).find('aaaa') == {}
+
+
+def test_keyword_that_prefixes_another():
+    hits = KeywordMatcher(['new', 'new york']).find('New York is new')
+    assert hits == {
+        'new': {'count': 2, 'positions': [0, 12]},
+        'new york': {'count': 1, 'positions': [0]},
+    }
+
+
+def test_duplicates_and_blank_keywords_are_dropped():
+    matcher = KeywordMatcher(['climat', ' climat ', '', '  '])
+    assert matcher.keywords == ['climat']
+    assert counts(matcher.find('Le climat')) == {'climat': 1}
+
+
+def test_large_keyword_lists_match_like_small_ones():
+    keywords = [f'mot{number}' for number in range(SEPARATE_KEYWORDS * 2)] + ['économie', 'c++']
+    text = 'mot1 mot12 mot120x économie Economie c++ mot7'
+    large = KeywordMatcher(keywords)
+    assert len(large.regexes) == 1
+    expected = {}
+    for keyword in keywords:
+        expected.update(KeywordMatcher([keyword]).find(text))
+    assert large.find(text) == expected
@@ -0,0 +1,18 @@
+from webscraper.seen import BloomFilter
+
+
+def test_add_reports_new_values_only():
+    seen = BloomFilter(1000, 0.001)
+    assert seen.add('https://example.com/a')
+    assert not seen.add('https://example.com/a')
+    assert 'https://example.com/a' in seen
+    assert len(seen) == 1
+
+
+def test_no_false_negatives_and_few_false_positives():
+    seen = BloomFilter(10000, 0.01)
+    for number in range(10000):
+        seen.add(f'https://example.com/{number}')
+    assert all(f'https://example.com/{number}' in seen for number in range(10000))
+    false_positives = sum(f'https://other.example/{number}' in seen for number in range(10000))
+    assert false_positives < 300
@@ -0,0 +1,65 @@
+import logging
+
+import httpx
+
+
+class BackendJobClient:
+    """Leases XML scraping jobs from the backend queue and reports their completion."""
+
+    xml_path = '/scraping/xml'
+    wait_path = '/scraping/xml/wait'
+
+    def __init__(self, base_url, token=None, timeout=30.0):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        self.client = httpx.AsyncClient(base_url=base_url, headers=headers, timeout=timeout)
+
+    async def lease(self, wait=0):
+        """Return (request_id, xml_content) for the next queued job, or None when the queue is empty.
+
+        With wait > 0 the backend holds the request for up to that many
+        seconds until a job is queued, instead of answering at once.
+        """
+        try:
+            if wait > 0:
+                response = await self.client.get(
+                    self.wait_path, params={'timeout': wait}, timeout=self.client.timeout.read + wait
+                )
+            else:
+                response = await self.client.get(self.xml_path)
+        except httpx.HTTPError as e:
+            logging.warning(f"Could not reach backend job queue: {str(e)}")
+            return None
+        if response.status_code in (204, 404):
+            return None
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            logging.warning(f"Backend job queue refused the lease: {str(e)}")
+            return None
+        return response.headers.get('X-Request-Id'), response.content
+
+    async def heartbeat(self, request_id):
+        """Renew the lease of a job still being crawled; return False once it was lost."""
+        try:
+            response = await self.client.post(f'{self.xml_path}/{request_id}/heartbeat')
+        except httpx.HTTPError as e:
+            logging.warning(f"Could not renew the lease of job {request_id}: {str(e)}")
+            return True
+        if response.status_code == 404:
+            return False
+        if response.status_code >= 400:
+            logging.warning(f"Backend refused to renew the lease of job {request_id}: HTTP {response.status_code}")
+        return True
+
+    async def complete(self, request_id, status, items):
+        try:
+            response = await self.client.post(
+                f'{self.xml_path}/{request_id}/complete',
+                json={'status': status, 'items': items},
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            logging.error(f"Could not report completion of job {request_id}: {str(e)}")
+
+    async def close(self):
+        await self.client.aclose()
@@ -1,22 +1,43 @@
 import xml.etree.ElementTree as ET
 import logging
 
+def sites_from_root(root):
+    sites = []
+    for site in root.findall('site'):
+        url = site.find('url').text
+        keywords = [keyword.text for keyword in site.findall('keywords/keyword')]
+        entry = {
+            'url': url,
+            'keywords': keywords
+        }
+        feeds = [feed.text.strip() for feed in site.findall('feeds/feed') if feed.text]
+        if feeds:
+            entry['feeds'] = feeds
+        # Optional <crawl max_depth="2" max_pages="100" same_domain="true"/>
+        crawl = site.find('crawl')
+        if crawl is not None:
+            entry['crawl'] = {
+                key: value for key, value in (
+                    ('max_depth', crawl.get('max_depth')),
+                    ('max_pages', crawl.get('max_pages')),
+                    ('same_domain', crawl.get('same_domain')),
+                ) if value is not None
+            }
+        sites.append(entry)
+        logging.info(f"Found site: {url} with keywords: {keywords}")
+    return sites
+
 def parse_xml(file_path):
     try:
         tree = ET.parse(file_path)
-        root = tree.getroot()
-        sites = []
-        
-        for site in root.findall('site'):
-            url = site.find('url').text
-            keywords = [keyword.text for keyword in site.findall('keywords/keyword')]
-            sites.append({
-                'url': url,
-                'keywords': keywords
-            })
-            logging.info(f"Found site: {url} with keywords: {keywords}")
-            
-        return sites
+        return sites_from_root(tree.getroot())
     except Exception as e:
         logging.error(f"Error parsing XML file: {str(e)}")
-        return []
\ No newline at end of file
+        return []
+
+def parse_xml_content(content):
+    try:
+        return sites_from_root(ET.fromstring(content))
+    except Exception as e:
+        logging.error(f"Error parsing XML content: {str(e)}")
+        return []